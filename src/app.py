@@ -2,33 +2,156 @@
 # coding: utf-8
 
 import os
-from flask import Flask, render_template, request
-import plotly.express as px
-import plotly.io as pio
-import pandas as pd
+import hashlib
+import mimetypes
+from functools import wraps
+from flask import Flask, abort, jsonify, make_response, render_template, request, send_file
 
-from interactive_vis import (
-    create_box_chart,
+from department_vis import (
+    BIN_WIDTHS,
+    DEFAULT_BIN_WIDTH,
     acq_bar_chart,
     show_highlights
 )
 
 from explorer import (
     FIELDS,
+    DETAIL_COLUMNS,
     get_departments,
     run_group_query,
-    run_detail_query,
+    run_detail_page,
+    search_objects,
     collapse_small_groups
 )
 
-from eda_cloisters import run_eda
+# plotly, matplotlib and seaborn are imported by the functions that draw
+# charts, on first use, so a worker boots without loading them
+from eda_cloisters import DEFAULT_DEPARTMENT, run_eda
+
+from facets import FACETS, facet_counts, make_selection, warm as warm_facets
+
+from artifacts import stored_chart
+
+from assets import ASSET_MAX_AGE, asset_url, figure_html, find as find_asset
+
+from images import (
+    DEFAULT_IMAGE_SIZE,
+    IMAGE_SIZES,
+    PREFETCH_DISTANCE,
+    ImageNotFound,
+    image_variant,
+    prefetch
+)
+
+from compression import choose_encoding, compress_response, compressed_file
+
+from database import snapshot_version
+
+from profiling import init_app as init_profiling, metrics as profiling_metrics, phase
+
+import cache
+from cache import versioned_cache
 
 
 app = Flask(__name__)
+app.jinja_env.globals["asset_url"] = asset_url
+init_profiling(app)
 
 # SQLite database path
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "met.db")
 
+# Most rows the detail table API returns per request, and the largest row
+# offset it takes (more rows than any collection has)
+MAX_PAGE_LENGTH = 100
+MAX_DETAIL_START = 10_000_000
+
+# Last search results page shown (10,000 results); later pages get this one
+MAX_SEARCH_PAGE = 400
+
+# Seconds browsers may reuse an /img response without asking again
+IMAGE_MAX_AGE = 7 * 24 * 3600
+
+# Clients /metrics answers
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+
+NO_DATA_HTML = "<p><b>No matching data for this selection.</b></p>"
+
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request)
+
+
+def snapshot_etag(view):
+    """Tag a GET view's response with a weak ETag of the snapshot version and URL.
+
+    The response is a pure function of the two, so a request whose
+    If-None-Match carries the tag gets a 304 without running the view.
+    Clients must revalidate (no-cache), so a new build is seen at once.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = repr((snapshot_version(DB_PATH), request.full_path))
+        tag = hashlib.sha1(key.encode()).hexdigest()
+
+        if request.if_none_match.contains_weak(tag):
+            response = app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        response.set_etag(tag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+
+    return wrapper
+
+
+def to_json(payload):
+    """Serialize a payload holding Plotly figures or NumPy values."""
+    with phase("figure"):
+        import plotly.io as pio
+        return pio.json.to_json_plotly(payload)
+
+
+def json_response(payload):
+    """A JSON response for payloads holding Plotly figures or NumPy values."""
+    return app.response_class(to_json(payload), mimetype="application/json")
+
+
+def breakdown(db_path, selected_dept, selected_field, collapse):
+    """The Explorer's counts for one department's field, and their pie chart.
+
+    Returns (DataFrame, figure); the figure is None when there is no data.
+    """
+    df = run_group_query(db_path, selected_dept, selected_field)
+    if df.empty:
+        return df, None
+
+    if collapse:
+        df = collapse_small_groups(df, "category")
+
+    with phase("figure"):
+        import plotly.express as px
+        fig = px.pie(
+            df,
+            values="num_objects",
+            names="category",
+            title=f"{selected_dept} – {selected_field} breakdown"
+        )
+    return df, fig
+
+
+@versioned_cache(maxsize=256)
+def breakdown_json(db_path, selected_dept, selected_field, collapse):
+    """The /api/breakdown body, drawn and serialized once per snapshot."""
+    df, fig = breakdown(db_path, selected_dept, selected_field, collapse)
+    return to_json({
+        "dept": selected_dept,
+        "field": selected_field,
+        "collapse": collapse,
+        "data": df.to_dict(orient="records"),
+        "figure": fig
+    })
+
 
 # ================================================================
 # Department Explorer (Main Page)
@@ -41,37 +164,18 @@ def index():
     selected_field = FIELDS[0]
     collapse_checked = False
     chart_html = ""
-    detail_df = pd.DataFrame()
+    detail_dept = None
 
     if request.method == "POST":
         selected_dept = request.form.get("department", selected_dept)
         selected_field = request.form.get("field", selected_field)
         collapse_checked = request.form.get("collapse") == "on"
 
-        df = run_group_query(DB_PATH, selected_dept, selected_field)
+        _, fig = breakdown(DB_PATH, selected_dept, selected_field, collapse_checked)
+        chart_html = NO_DATA_HTML if fig is None else figure_html(fig)
 
-        if df.empty:
-            chart_html = "<p><b>No matching data for this selection.</b></p>"
-        else:
-            if collapse_checked:
-                df = collapse_small_groups(df, "category")
-
-            fig = px.pie(
-                df,
-                values="num_objects",
-                names="category",
-                title=f"{selected_dept} – {selected_field} breakdown"
-            )
-            chart_html = pio.to_html(fig, full_html=False, include_plotlyjs="cdn")
-
-        detail_df = run_detail_query(DB_PATH, selected_dept)
-
-    if detail_df.empty:
-        detail_df = pd.DataFrame(columns=[
-            "title", "culture", "country",
-            "classification", "artist",
-            "isHighlight", "isPublicDomain"
-        ])
+        # rows are fetched a page at a time from /api/details
+        detail_dept = selected_dept
 
     return render_template(
         "index.html",
@@ -81,18 +185,104 @@ def index():
         selected_field=selected_field,
         collapse_checked=collapse_checked,
         chart_html=chart_html,
-        detail_df=detail_df
+        no_data_html=NO_DATA_HTML,
+        detail_dept=detail_dept
     )
 
 
 # ================================================================
-# Cloisters EDA
+# Explorer chart data (JSON, updated in place by the page)
+# ================================================================
+@app.route("/api/breakdown")
+@snapshot_etag
+def breakdown_api():
+    dept = request.args.get("dept", "ALL")
+    field = request.args.get("field", FIELDS[0])
+    collapse = request.args.get("collapse") in ("1", "on", "true")
+    if field not in FIELDS:
+        abort(400)
+
+    body = breakdown_json(DB_PATH, dept, field, collapse)
+    return app.response_class(body, mimetype="application/json")
+
+
+# ================================================================
+# Explorer detail table (DataTables server-side processing)
+# ================================================================
+@app.route("/api/details")
+@snapshot_etag
+def details_api():
+    dept = request.args.get("dept", "ALL")
+    start = min(max(request.args.get("start", 0, type=int), 0), MAX_DETAIL_START)
+    length = request.args.get("length", 25, type=int)
+    if not 0 < length <= MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    order_by = None
+    descending = False
+    column = request.args.get("order[0][column]", type=int)
+    if column is not None and 0 <= column < len(DETAIL_COLUMNS):
+        order_by = DETAIL_COLUMNS[column]
+        descending = request.args.get("order[0][dir]") == "desc"
+
+    df, records_total, records_filtered = run_detail_page(
+        DB_PATH,
+        dept,
+        start=start,
+        length=length,
+        search=request.args.get("search[value]", ""),
+        order_by=order_by,
+        descending=descending
+    )
+
+    return jsonify({
+        "draw": request.args.get("draw", 0, type=int),
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": df[DETAIL_COLUMNS].fillna("").values.tolist()
+    })
+
+
+# ================================================================
+# Faceted cross-filter counts (JSON)
+# ================================================================
+@app.route("/api/facets")
+@snapshot_etag
+def facets_api():
+    """Counts of every facet for a selection.
+
+    Each facet takes any number of values (?culture=French&culture=Italian),
+    and year_from/year_to filter on the creation years.
+    """
+    selection = make_selection({facet: request.args.getlist(facet) for facet in FACETS})
+    year_from = request.args.get("year_from", type=int)
+    year_to = request.args.get("year_to", type=int)
+
+    return jsonify(facet_counts(DB_PATH, selection, year_from, year_to))
+
+
+# ================================================================
+# Department EDA
 # ================================================================
 @app.route("/eda")
 def eda_page():
-    heatmap_html, sankey_html = run_eda(DB_PATH)
+    departments = get_departments(DB_PATH)[1:]
+    dept = request.args.get("dept", DEFAULT_DEPARTMENT)
+    if dept not in departments:
+        dept = DEFAULT_DEPARTMENT
+
+    # the build stores the default department's charts; others are queried
+    # for just that department on request
+    if dept == DEFAULT_DEPARTMENT:
+        heatmap_html = stored_chart(DB_PATH, "eda_heatmap")
+        sankey_html = stored_chart(DB_PATH, "eda_sankey")
+    else:
+        heatmap_html, sankey_html = run_eda(DB_PATH, dept)
+
     return render_template(
         "eda.html",
+        departments=departments,
+        dept=dept,
         heatmap_html=heatmap_html,
         sankey_html=sankey_html
     )
@@ -103,8 +293,7 @@ def eda_page():
 # ================================================================
 @app.route("/box")
 def box_chart():
-    fig = create_box_chart()
-    chart_html = fig.to_html(full_html=False)
+    chart_html = stored_chart(DB_PATH, "box_chart")
     return render_template(
         "chart_single.html",
         title="Artwork Creation Year Distribution",
@@ -117,15 +306,39 @@ def box_chart():
 # ================================================================
 @app.route("/acq")
 def acq_chart():
-    fig = acq_bar_chart()
-    chart_html = fig.to_html(full_html=False)
+    bin_width = request.args.get("width", DEFAULT_BIN_WIDTH, type=int)
+    if bin_width not in BIN_WIDTHS:
+        bin_width = DEFAULT_BIN_WIDTH
+
+    # the build stores the chart at the default width; other widths are
+    # binned in SQL on request
+    if bin_width == DEFAULT_BIN_WIDTH:
+        chart_html = stored_chart(DB_PATH, "acq_chart")
+    else:
+        chart_html = figure_html(acq_bar_chart(DB_PATH, bin_width))
+
     return render_template(
         "chart_single.html",
         title="Accession Year Trends",
-        chart_html=chart_html
+        chart_html=chart_html,
+        bin_widths=BIN_WIDTHS,
+        bin_width=bin_width
     )
 
 
+@app.route("/api/acq")
+@snapshot_etag
+def acq_api():
+    bin_width = request.args.get("width", DEFAULT_BIN_WIDTH, type=int)
+    if bin_width not in BIN_WIDTHS:
+        abort(400)
+
+    return json_response({
+        "width": bin_width,
+        "figure": acq_bar_chart(DB_PATH, bin_width)
+    })
+
+
 # ================================================================
 # Highlights Viewer (manual next/prev)
 # ================================================================
@@ -135,25 +348,120 @@ def highlights_viewer():
     dept = request.args.get("dept", departments[0])
     i = int(request.args.get("i", 0))
 
-    fig = show_highlights(i, dept)
-    if fig is None:
-        chart_html = "<h3>No highlight images available for this department.</h3>"
-    else:
-        chart_html = fig.to_html(full_html=False)
+    highlight = show_highlights(i, dept, DB_PATH, neighbors=PREFETCH_DISTANCE)
+    if highlight is not None:
+        # next/prev will ask for these; have them on disk by then
+        prefetch(DB_PATH, highlight["neighbors"], DEFAULT_IMAGE_SIZE, image_format())
 
     return render_template(
         "highlights_viewer.html",
         departments=departments,
         dept=dept,
-        chart_html=chart_html,
+        highlight=highlight,
         next_i=i + 1,
         prev_i=max(i - 1, 0),
         title="Department Highlights Gallery"
     )
 
 
+# ================================================================
+# Object Images (resized, cached on disk)
+# ================================================================
+def image_format():
+    """WebP for clients that list it in Accept; "*/*" alone gets JPEG."""
+    return "webp" if "image/webp" in request.accept_mimetypes.values() else "jpeg"
+
+
+@app.route("/img/<int:object_id>")
+def object_image(object_id):
+    size = request.args.get("size", DEFAULT_IMAGE_SIZE, type=int)
+    if size not in IMAGE_SIZES:
+        size = DEFAULT_IMAGE_SIZE
+
+    try:
+        path, mimetype = image_variant(DB_PATH, object_id, size, image_format())
+    except ImageNotFound:
+        abort(404)
+    except OSError:
+        abort(502)
+
+    response = send_file(path, mimetype=mimetype, max_age=IMAGE_MAX_AGE, conditional=True)
+    response.vary.add("Accept")
+    return response
+
+
+# ================================================================
+# Full-text Search
+# ================================================================
+@app.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    page = min(max(request.args.get("page", 1, type=int), 1), MAX_SEARCH_PAGE)
+
+    results, has_next = search_objects(DB_PATH, query, page)
+    has_next = has_next and page < MAX_SEARCH_PAGE
+
+    return render_template(
+        "search.html",
+        query=query,
+        results=results,
+        page=page,
+        has_next=has_next
+    )
+
+
+# ================================================================
+# Vendored JS/CSS (fingerprinted, cached for a year)
+# ================================================================
+@app.route("/assets/<filename>")
+def vendored_asset(filename):
+    path = find_asset(filename)
+    if path is None:
+        abort(404)
+
+    # served compressed from memory when the client allows it; each version
+    # of a file is compressed once
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        response = send_file(path, max_age=ASSET_MAX_AGE, conditional=True)
+    else:
+        body = compressed_file(path, os.stat(path).st_mtime_ns, encoding)
+        response = app.response_class(body, mimetype=mimetypes.guess_type(path)[0])
+        response.headers["Content-Encoding"] = encoding
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+    response.vary.add("Accept-Encoding")
+    # the name changes with the content, so this URL never needs revalidating
+    response.cache_control.immutable = True
+    return response
+
+
+# ================================================================
+# Result cache counters
+# ================================================================
+@app.route("/api/cache")
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+# ================================================================
+# Profiling (start the app with MET_PROFILE=1)
+# ================================================================
+@app.route("/metrics")
+def metrics():
+    """Per-route phase timings, the slow query log and the cache counters.
+
+    Only answered for requests from this machine.
+    """
+    if request.remote_addr not in LOCAL_ADDRESSES:
+        abort(404)
+    return jsonify({**profiling_metrics(), "caches": cache.stats()})
+
+
 # ================================================================
 # Run App
 # ================================================================
 if __name__ == "__main__":
+    # the first /api/facets request finds the facet index loaded
+    warm_facets(DB_PATH)
     app.run(debug=True)
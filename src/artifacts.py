@@ -0,0 +1,63 @@
+'''
+artifacts.py
+
+The app's static charts, rendered once per snapshot.
+
+/box, /acq and /eda show the same figures to every visitor. met-build.py
+renders them into the snapshot's Artifacts table before publishing it, and
+the routes then serve the stored HTML fragments, so their response time no
+longer depends on the size of the collection. Snapshots built before the
+Artifacts table existed fall back to rendering the chart on first request.
+
+The snapshot's facet index (see facets.py) is stored the same way, so the
+app never builds it from the rows of a live snapshot.
+'''
+
+import sqlite3
+
+from assets import figure_html
+from cache import versioned_cache
+from database import connection
+from department_vis import create_box_chart, acq_bar_chart
+from eda_cloisters import run_eda
+from facets import ARTIFACT as FACET_INDEX, read_facet_index
+
+HTML = "text/html; charset=utf-8"
+
+# artifact name -> (content type, function rendering it from db_path)
+RENDERERS = {
+    "box_chart": (HTML, lambda db_path: figure_html(create_box_chart(db_path))),
+    "acq_chart": (HTML, lambda db_path: figure_html(acq_bar_chart(db_path))),
+    "eda_heatmap": (HTML, lambda db_path: run_eda(db_path)[0]),
+    "eda_sankey": (HTML, lambda db_path: run_eda(db_path)[1]),
+    FACET_INDEX: ("application/x-npz", lambda db_path: read_facet_index(db_path).to_bytes()),
+}
+
+
+def render_artifacts(conn, snapshot):
+    '''
+        Render every artifact from the committed data of `snapshot` and store
+        them through conn, the build's connection to it.
+    '''
+    for name, (content_type, render) in RENDERERS.items():
+        conn.execute(
+            "INSERT OR REPLACE INTO Artifacts (name, content_type, body) VALUES (?, ?, ?)",
+            (name, content_type, render(snapshot)),
+        )
+
+
+@versioned_cache(maxsize=len(RENDERERS))
+def stored_chart(db_path, name):
+    '''The stored artifact `name` of the current snapshot, rendered if it has none.'''
+    try:
+        with connection(db_path) as conn:
+            row = conn.execute("SELECT body FROM Artifacts WHERE name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError as e:
+        # a snapshot from before the Artifacts table
+        if "no such table" not in str(e):
+            raise
+        row = None
+
+    if row is None:
+        return RENDERERS[name][1](db_path)
+    return row[0]
@@ -0,0 +1,170 @@
+'''
+assets.py
+
+The JavaScript and CSS libraries the templates load, served by the app itself.
+
+plotly.js is served from the copy bundled with the plotly package, so it
+always matches the figures the package renders. jQuery and DataTables are
+vendored into static/vendor/ by running this script (the Dockerfile does,
+at image build time):
+
+    python src/assets.py
+
+Each download is checked against its sha256 in static/vendor.sha256 (the
+format of sha256sum) and refused if it differs or has no pinned hash. To pin
+a new version, change its URL and run `python src/assets.py --pin` on a
+trusted network, then commit the manifest.
+
+Every asset is served under a fingerprinted name (/assets/<name>.<hash><ext>)
+with a one year, immutable Cache-Control, so browsers download each version
+once. The app never falls back to a CDN: rendering a page that needs an
+asset that has not been vendored raises MissingAsset. MET_VENDOR_DIR moves
+the vendor directory.
+Figures are rendered by figure_html(), without the library, and rely on
+the page loading plotly.js.
+'''
+
+import hashlib
+import os
+import sys
+import urllib.request
+from functools import lru_cache
+
+import plotly
+
+from profiling import profiled
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+VENDOR_DIR = os.environ.get("MET_VENDOR_DIR", os.path.join(STATIC_DIR, "vendor"))
+
+# sha256 of every vendored file, by file name
+MANIFEST = os.path.join(STATIC_DIR, "vendor.sha256")
+
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+
+# asset name -> (local file, pinned URL it is vendored from)
+ASSETS = {
+    "plotly.js": (PLOTLY_JS, None),
+    "jquery.js": (
+        os.path.join(VENDOR_DIR, "jquery-3.6.0.min.js"),
+        "https://code.jquery.com/jquery-3.6.0.min.js",
+    ),
+    "datatables.js": (
+        os.path.join(VENDOR_DIR, "jquery.dataTables-1.13.6.min.js"),
+        "https://cdn.datatables.net/1.13.6/js/jquery.dataTables.min.js",
+    ),
+    "datatables.css": (
+        os.path.join(VENDOR_DIR, "jquery.dataTables-1.13.6.min.css"),
+        "https://cdn.datatables.net/1.13.6/css/jquery.dataTables.min.css",
+    ),
+}
+
+# Seconds browsers may cache a fingerprinted asset
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+class MissingAsset(RuntimeError):
+    '''An asset the templates need has not been vendored.'''
+
+
+class AssetMismatch(RuntimeError):
+    '''A downloaded asset does not match its pinned sha256, or has none.'''
+
+
+@lru_cache(maxsize=None)
+def _fingerprinted_name(path, mtime_ns):
+    '''<name>.<first 12 hex digits of its sha256><ext> for the file at path.'''
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f"{stem}.{digest}{ext}"
+
+
+def fingerprinted_name(name):
+    '''The fingerprinted file name of a vendored asset, or None if it is missing.'''
+    path = ASSETS[name][0]
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _fingerprinted_name(path, mtime_ns)
+
+
+def asset_url(name):
+    '''URL of an asset for the templates: its fingerprinted /assets URL.'''
+    fingerprinted = fingerprinted_name(name)
+    if fingerprinted is None:
+        raise MissingAsset(f"{name} is not vendored at {ASSETS[name][0]}; run python src/assets.py")
+    return f"/assets/{fingerprinted}"
+
+
+@profiled("figure")
+def figure_html(fig):
+    '''A Plotly figure as an HTML fragment, without the plotly.js library.'''
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def find(filename):
+    '''Local path of the asset with fingerprinted name `filename`, or None.'''
+    for name, (path, _) in ASSETS.items():
+        if fingerprinted_name(name) == filename:
+            return path
+    return None
+
+
+def read_manifest():
+    '''{file name: sha256} of the pinned vendored files.'''
+    pins = {}
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    digest, filename = line.split()
+                    pins[filename.lstrip("*")] = digest
+    return pins
+
+
+def download(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+
+def vendor():
+    '''Download every asset that is not vendored yet from its pinned URL, checking its sha256.'''
+    pins = read_manifest()
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    for name, (path, url) in ASSETS.items():
+        if url is None or os.path.exists(path):
+            continue
+        filename = os.path.basename(path)
+        if filename not in pins:
+            raise AssetMismatch(f"{filename} has no sha256 in {MANIFEST}; pin it with --pin")
+
+        print(f"Vendoring {name} from {url}")
+        data = download(url)
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != pins[filename]:
+            raise AssetMismatch(f"{url} has sha256 {digest}, {MANIFEST} pins {pins[filename]}")
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def pin():
+    '''Download every asset from its URL and write their sha256 to the manifest.'''
+    lines = []
+    for path, url in ASSETS.values():
+        if url is not None:
+            digest = hashlib.sha256(download(url)).hexdigest()
+            lines.append(f"{digest}  {os.path.basename(path)}\n")
+    with open(MANIFEST, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--pin"]:
+        pin()
+    else:
+        vendor()
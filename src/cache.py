@@ -0,0 +1,124 @@
+'''
+cache.py
+
+Caching of query results and rendered charts between requests.
+
+versioned_cache() keeps the results of a function of db_path in an LRU cache
+keyed by its arguments and the version of the snapshot published under
+db_path (database.snapshot_version). When met-build.py publishes a new build
+the version changes, so the next call misses and the entries of the old
+snapshot are dropped.
+'''
+
+import functools
+import inspect
+import threading
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from database import snapshot_version
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+MISSING = object()
+
+# every cached function, by name, for stats()
+_cached = {}
+
+
+class VersionedCache:
+    '''At most maxsize results of one function, least recently used first.'''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''The cached value for key, or MISSING.'''
+        with self.lock:
+            value = self.entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, db_path, version, key, value):
+        with self.lock:
+            if self.versions.get(db_path, version) != version:
+                # a new snapshot of db_path: its old results can never hit again
+                for stale in [k for k in self.entries if k[0] == db_path and k[1] != version]:
+                    del self.entries[stale]
+            self.versions[db_path] = version
+
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+            self.hits = self.misses = 0
+
+
+def versioned_cache(maxsize=32):
+    '''
+        Decorator caching the results of a function with a db_path parameter.
+        Entries are keyed by the arguments (which must be hashable) and the
+        snapshot version of db_path.
+
+        DataFrames are copied on the way out, so callers may modify them.
+        Other results (figures, HTML) are shared and must not be modified.
+        Concurrent misses on the same key may each run the function.
+        The wrapper has cache_info() and cache_clear(), like functools.lru_cache.
+    '''
+    def decorator(func):
+        signature = inspect.signature(func)
+        cache = VersionedCache(maxsize)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            db_path = bound.arguments["db_path"]
+            version = snapshot_version(db_path)
+            key = (db_path, version, tuple(bound.arguments.items()))
+
+            value = cache.get(key)
+            if value is MISSING:
+                value = func(*args, **kwargs)
+                cache.put(db_path, version, key, value)
+
+            if isinstance(value, pd.DataFrame):
+                return value.copy()
+            return value
+
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        _cached[func.__qualname__] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    '''{function name: hits, misses, maxsize and currsize} for every cached function.'''
+    return {name: func.cache_info()._asdict() for name, func in _cached.items()}
+
+
+def clear_all():
+    '''Empty every cache and reset the counters.'''
+    for func in _cached.values():
+        func.cache_clear()
@@ -0,0 +1,79 @@
+'''
+compression.py
+
+Brotli/gzip compression of the app's text responses.
+
+compress_response() is installed as an after_request hook. It compresses
+JSON, HTML, CSS and JavaScript bodies for clients that accept it, preferring
+brotli when the brotli package is installed. Files sent with send_file are
+streamed and left alone; the vendored assets are compressed once per file by
+compressed_file() instead.
+'''
+
+import gzip
+from functools import lru_cache
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent as is
+MIN_SIZE = 1024
+
+COMPRESSIBLE = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/html",
+    "text/css",
+}
+
+# (brotli quality, gzip level) for per-request bodies, and for files that are
+# compressed once and kept
+FAST = (5, 6)
+BEST = (11, 9)
+
+
+def choose_encoding(accept_encodings):
+    '''The best encoding the client accepts ("br", "gzip"), or None.'''
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, level=FAST):
+    if encoding == "br":
+        return brotli.compress(data, quality=level[0])
+    return gzip.compress(data, compresslevel=level[1])
+
+
+@lru_cache(maxsize=16)
+def compressed_file(path, mtime_ns, encoding):
+    '''The contents of path compressed at the best level, kept per file version.'''
+    with open(path, "rb") as f:
+        return compress(f.read(), encoding, BEST)
+
+
+def compress_response(response, request):
+    '''Compress a response body in place, when it and the client allow it.'''
+    if (
+        response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
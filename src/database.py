@@ -0,0 +1,220 @@
+'''
+database.py
+
+Locating and opening the published met.db snapshot.
+
+met-build.py writes every build into its own file under data/snapshots/ and,
+once the snapshot has passed its checks, publishes it by atomically replacing
+the pointer file data/met.current with the snapshot's name. Readers resolve
+the pointer each time they connect, so a new build is picked up without a
+restart, and a snapshot is never modified after it has been published.
+A db path without a pointer file is opened as is.
+
+The app reads through connection(), which lends out pooled read-only
+connections that stay open, with their page cache and prepared statements,
+for as long as their snapshot is current.
+'''
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+# Logical path of the database read by the app
+DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "met.db")
+
+# Published snapshots kept besides the current one, for readers that still
+# have them open
+KEEP_SNAPSHOTS = 2
+
+# Idle connections kept per db_path. More are opened when needed, but only this
+# many are kept once returned.
+POOL_SIZE = 8
+
+# Settings of pooled connections: bytes of the db file memory-mapped, page cache
+# size in KiB, and prepared statements kept by the sqlite3 module
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_KIB = 64 * 1024
+CACHED_STATEMENTS = 256
+
+
+def pointer_path(db_path):
+    '''Path of the pointer file naming the current snapshot of db_path.'''
+    return os.path.splitext(db_path)[0] + ".current"
+
+
+def snapshot_dir(db_path):
+    return os.path.join(os.path.dirname(db_path), "snapshots")
+
+
+def snapshot_path(db_path, build_id):
+    '''Path of the snapshot file for one build of db_path.'''
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(snapshot_dir(db_path), f"{name}-{build_id}.db")
+
+
+def resolve(db_path):
+    '''Path of the snapshot currently published under db_path.'''
+    try:
+        with open(pointer_path(db_path), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return db_path
+    return os.path.join(os.path.dirname(db_path), name)
+
+
+def snapshot_version(db_path):
+    '''
+        A value that changes whenever different data is published under db_path.
+        Published snapshots are never modified, so their path is their version.
+        A db without a pointer file can be written in place, so its version also
+        includes the modification time and size of the db and its -wal file.
+    '''
+    snapshot = resolve(db_path)
+    if snapshot != db_path:
+        return snapshot
+
+    version = [snapshot]
+    for path in (snapshot, snapshot + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version += [stat.st_mtime_ns, stat.st_size]
+    return tuple(version)
+
+
+def connect(db_path, snapshot=None, **kwargs):
+    '''
+        Open a read-only connection to the current snapshot of db_path (or to
+        `snapshot`, if already resolved). Published snapshots are in WAL mode, so
+        readers never block on, or see a partial, checkpoint. Raises
+        sqlite3.DatabaseError for a snapshot that is not. Extra keyword
+        arguments are passed on to sqlite3.connect().
+    '''
+    snapshot = snapshot or resolve(db_path)
+    path = os.path.abspath(snapshot)
+    conn = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True, **kwargs)
+    conn.execute("PRAGMA query_only = ON")
+
+    # met-build.py switches every snapshot to WAL before loading it; a read-only
+    # connection cannot change the mode, so it is checked here instead
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if mode != "wal" and snapshot != db_path:
+        conn.close()
+        raise sqlite3.DatabaseError(f"{snapshot} is not in WAL mode ({mode})")
+    return conn
+
+
+# ================================================================
+# Connection pool
+# ================================================================
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _Pool:
+    '''Idle read-only connections to db_path, each with the snapshot it reads.'''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        snapshot = resolve(self.db_path)
+        with self.lock:
+            while self.idle:
+                conn_snapshot, conn = self.idle.pop()
+                if conn_snapshot == snapshot:
+                    return snapshot, conn
+                # opened before the current snapshot was published
+                conn.close()
+
+        conn = connect(
+            self.db_path,
+            snapshot,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+        return snapshot, conn
+
+    def release(self, snapshot, conn):
+        with self.lock:
+            if len(self.idle) < POOL_SIZE:
+                # last in, first out, so the warmest connections are reused
+                self.idle.append((snapshot, conn))
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for _, conn in self.idle:
+                conn.close()
+            self.idle.clear()
+
+
+@contextmanager
+def connection(db_path=DB_PATH):
+    '''
+        Borrow a pooled read-only connection to the current snapshot of db_path
+        for the duration of the with block. The connection goes back to the pool
+        afterwards and must not be closed or used outside the block.
+    '''
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = _Pool(db_path)
+
+    snapshot, conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(snapshot, conn)
+
+
+def close_all():
+    '''Close every idle pooled connection.'''
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def publish(db_path, snapshot):
+    '''
+        Make `snapshot` the current db for db_path. The pointer is written to a
+        temporary file and renamed over the old one, so readers see either the
+        previous snapshot or the new one, never a partial write.
+    '''
+    pointer = pointer_path(db_path)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.relpath(snapshot, os.path.dirname(db_path)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+    prune(db_path)
+
+
+def remove(snapshot):
+    '''Delete a snapshot file together with its -wal/-shm files.'''
+    for path in (snapshot, snapshot + "-wal", snapshot + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def prune(db_path, keep=KEEP_SNAPSHOTS):
+    '''Delete all but the current and the `keep` most recent older snapshots.'''
+    directory = snapshot_dir(db_path)
+    current = os.path.abspath(resolve(db_path))
+    older = sorted(
+        os.path.join(directory, f) for f in os.listdir(directory)
+        if f.endswith(".db") and os.path.abspath(os.path.join(directory, f)) != current
+    )
+    for snapshot in older[:max(len(older) - keep, 0)]:
+        remove(snapshot)
@@ -1,108 +1,221 @@
-import os
-import sqlite3
+import numpy as np
 import pandas as pd
-import plotly.express as px
-from skimage import io
 
-# Path to SQLite database
-DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "met.db")
+from cache import versioned_cache
+from database import DB_PATH, connection
+from profiling import profiled, read_sql
+
+# color of the box plot and its outliers (plotly's first default color)
+BOX_COLOR = "#636efa"
 
 
 # ================================================================
 # Box Plot: Artwork Creation Year Distribution
 # ================================================================
-def create_box_chart():
-    conn = sqlite3.connect(DB_PATH)
+# Outliers drawn per box; a department with more shows an evenly spaced sample
+# of them, which always includes the most extreme values
+MAX_OUTLIERS = 200
+
+
+@profiled("dataframe")
+def box_stats(df, value, group):
+    """Per-group box plot statistics of df[value], as a DataFrame indexed by group.
+
+    Quartiles use linear interpolation and the whiskers reach the furthest
+    values within 1.5 IQR of the box, as Plotly computes them from raw points.
+    The `outliers` column holds each group's values beyond the whiskers,
+    sampled down to MAX_OUTLIERS.
+    """
+    groups = df.groupby(group)[value]
+    stats = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+
+    iqr = stats["q3"] - stats["q1"]
+    low = df[group].map(stats["q1"] - 1.5 * iqr)
+    high = df[group].map(stats["q3"] + 1.5 * iqr)
+    inside = df[value].between(low, high)
+
+    fences = df[inside].groupby(group)[value].agg(["min", "max"])
+    stats["lowerfence"] = fences["min"]
+    stats["upperfence"] = fences["max"]
+
+    outliers = df.loc[~inside, [group, value]].sort_values(value).groupby(group)[value]
+    samples = {name: sample_evenly(values.to_numpy()) for name, values in outliers}
+    stats["outliers"] = [samples.get(name, np.array([])) for name in stats.index]
+    return stats
+
+
+def sample_evenly(values, size=MAX_OUTLIERS):
+    """At most `size` of the sorted `values`, evenly spaced and keeping both ends."""
+    if len(values) <= size:
+        return values
+    return values[np.linspace(0, len(values) - 1, size).round().astype(int)]
+
+
+@versioned_cache(maxsize=2)
+@profiled("figure")
+def create_box_chart(db_path=DB_PATH):
+    # plotly is imported by the chart functions, not at startup
+    import plotly.graph_objects as go
+
     query = """
         SELECT 
-            CAST(a.objectBeginDate AS INTEGER) AS earliest,
-            CAST(a.objectEndDate AS INTEGER) AS latest,
+            a.objectBeginDate AS earliest,
             d.displayName
         FROM Art a
         JOIN Objects o ON a.object_id = o.object_id
         JOIN Department d ON o.department_id = d.department_id
-        WHERE CAST(a.objectBeginDate AS INTEGER) != 0
-          AND CAST(a.objectEndDate AS INTEGER) <= 2025
+        WHERE a.objectEndDate <= 2025
+          AND a.objectBeginDate != 0
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    with connection(db_path) as conn:
+        df = read_sql(query, conn)
 
-    fig = px.box(
-        df,
-        x="earliest",
-        y="displayName",
-        title="Creation Year of Art Objects per Department"
+    # the box statistics are computed here, so the figure carries a handful of
+    # numbers per department rather than every object's year
+    stats = box_stats(df, "earliest", "displayName")
+    outliers = stats["outliers"].explode().dropna()
+
+    fig = go.Figure([
+        go.Box(
+            y=stats.index,
+            q1=stats["q1"],
+            median=stats["median"],
+            q3=stats["q3"],
+            lowerfence=stats["lowerfence"],
+            upperfence=stats["upperfence"],
+            orientation="h",
+            name="earliest",
+            marker_color=BOX_COLOR
+        ),
+        go.Scatter(
+            x=outliers.to_numpy(dtype=float),
+            y=outliers.index,
+            mode="markers",
+            name="outliers",
+            marker=dict(color=BOX_COLOR, size=4)
+        ),
+    ])
+    fig.update_layout(
+        title="Creation Year of Art Objects per Department",
+        xaxis_title="Creation Year",
+        yaxis_title="displayName",
+        showlegend=False
     )
-    fig.update_layout(xaxis_title="Creation Year")
     return fig
 
 
 # ================================================================
 # Histogram: Accession Year Trends
 # ================================================================
-def acq_bar_chart():
-    conn = sqlite3.connect(DB_PATH)
+# Accession year bin widths offered by /acq, in years
+BIN_WIDTHS = [1, 5, 10, 25, 50]
+DEFAULT_BIN_WIDTH = 10
+
+
+def accession_counts(db_path, bin_width=DEFAULT_BIN_WIDTH):
+    """Objects per department per accession year bin, counted in SQL.
+
+    Bins are `bin_width` years wide and aligned on multiples of it; bin_start
+    is the first year of each bin.
+    """
     query = """
-        SELECT 
-            CAST(a.accessionYear AS INTEGER) AS accessionYear,
-            d.displayName
+        SELECT
+            (a.accessionYear / ?) * ? AS bin_start,
+            d.displayName,
+            COUNT(*) AS num_objects
         FROM Art a
         JOIN Objects o ON a.object_id = o.object_id
         JOIN Department d ON o.department_id = d.department_id
-        WHERE CAST(a.accessionYear AS INTEGER) != 0
+        WHERE a.accessionYear > 0
+        GROUP BY bin_start, d.displayName
+        ORDER BY bin_start, d.displayName
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    with connection(db_path) as conn:
+        return read_sql(query, conn, (bin_width, bin_width))
+
+
+@versioned_cache(maxsize=2 * len(BIN_WIDTHS))
+@profiled("figure")
+def acq_bar_chart(db_path=DB_PATH, bin_width=DEFAULT_BIN_WIDTH):
+    import plotly.express as px
+
+    if bin_width not in BIN_WIDTHS:
+        raise ValueError(f"Unsupported bin width: {bin_width}")
+
+    df = accession_counts(db_path, bin_width)
+    # bars are centered on their bin, so each spans its bin's years
+    df["bin_center"] = df["bin_start"] + bin_width / 2
 
-    fig = px.histogram(
+    fig = px.bar(
         df,
-        x="accessionYear",
+        x="bin_center",
+        y="num_objects",
         color="displayName",
         title="Accession Year Histogram",
-        nbins=20
+        hover_data={"bin_start": True, "bin_center": False}
+    )
+    fig.update_layout(
+        bargap=0.2,
+        xaxis_title="accessionYear",
+        yaxis_title="Count"
     )
-    fig.update_layout(bargap=0.2, yaxis_title="Count")
     return fig
 
 
 # ================================================================
 # Highlights Viewer (Single Image with Prev/Next)
 # ================================================================
-def show_highlights(i, dept):
-    conn = sqlite3.connect(DB_PATH)
+@versioned_cache(maxsize=64)
+@profiled("dataframe")
+def highlight_list(db_path, dept):
+    """A department's highlights with an image, in object order, read once per snapshot."""
     query = """
-        SELECT *
+        SELECT
+            a.object_id,
+            a.title,
+            a.objectBeginDate,
+            a.objectEndDate,
+            a.artistAlphaSort
         FROM Art a
         JOIN Objects o ON a.object_id = o.object_id
         JOIN Department d ON o.department_id = d.department_id
         WHERE d.displayName = ?
           AND primaryImage NOT LIKE 'Unknown'
           AND isHighlight = 1
+        ORDER BY o.object_id
     """
-    df = pd.read_sql(query, conn, params=(dept,))
-    conn.close()
+    with connection(db_path) as conn:
+        return read_sql(query, conn, (dept,))
 
-    if df.empty:
-        return None
 
-    idx = i % len(df)
-    img_path = df.iloc[idx]["primaryImage"]
+@profiled("dataframe")
+def show_highlights(i, dept, db_path=DB_PATH, neighbors=0):
+    """Return the i-th highlight of a department (wrapping around), or None.
 
-    # load image
-    try:
-        img = io.imread(img_path)
-    except Exception:
+    The record has the object_id the viewer loads its image by (see /img),
+    the caption lines shown under it, and the object_ids of the highlights
+    up to `neighbors` steps before and after it, nearest first.
+    """
+    df = highlight_list(db_path, dept)
+    if df.empty:
         return None
 
-    caption = (
-        f"{df.iloc[idx]['title']}<br>"
-        f"{df.iloc[idx]['objectBeginDate']} - {df.iloc[idx]['objectEndDate']}<br>"
-        f"{df.iloc[idx]['artistAlphaSort']}"
-    )
-
-    fig = px.imshow(img, title=caption)
-    fig.update_xaxes(showticklabels=False)
-    fig.update_yaxes(showticklabels=False)
-    fig.update_layout(title_x=0.5)
+    n = len(df)
+    row = df.iloc[i % n]
+    nearby = []
+    for step in range(1, neighbors + 1):
+        for j in (i + step, i - step):
+            object_id = int(df.iloc[j % n]["object_id"])
+            if object_id != row["object_id"] and object_id not in nearby:
+                nearby.append(object_id)
 
-    return fig
+    return {
+        "object_id": int(row["object_id"]),
+        "caption": [
+            row["title"],
+            f"{row['objectBeginDate']} - {row['objectEndDate']}",
+            row["artistAlphaSort"],
+        ],
+        "neighbors": nearby,
+    }
@@ -1,68 +1,91 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import sqlite3
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.graph_objects as go
 import io
 import base64
+from functools import lru_cache
 
-sns.set_theme(style="whitegrid", font_scale=1.2)
+from assets import figure_html
+from cache import versioned_cache
+from database import connection
+from materials import classify_materials
+from profiling import profiled, read_sql
+
+
+@lru_cache(maxsize=None)
+def init_plotting():
+    """Import matplotlib and seaborn and set the heatmap theme, on first use.
+
+    They take over a second to import, so the app loads them with the first
+    EDA request rather than at startup. Returns (pyplot, seaborn).
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set_theme(style="whitegrid", font_scale=1.2)
+    return plt, sns
 
 
 # =============================================================================
 # 1. Load Database
 # =============================================================================
-def load_db(db_path):
-    """Load Art + Objects + Department tables and filter to Cloisters."""
-    conn = sqlite3.connect(db_path)
+DEFAULT_DEPARTMENT = "The Cloisters"
+
+# The medieval centuries both charts cover
+CENTURIES = [12, 13, 14, 15, 16]
+
+
+@profiled("dataframe")
+def load_db(db_path, dept=DEFAULT_DEPARTMENT):
+    """Load the columns the EDA uses for one department's objects in CENTURIES.
+
+    The department and the century window are filtered in SQL, so the cost
+    follows the size of the department rather than of the collection.
+    """
     query = """
-        SELECT 
-            Art.*,
-            Objects.department_id,
-            Department.displayName AS department_name
-        FROM Art
-        JOIN Objects ON Art.object_id = Objects.object_id
-        JOIN Department ON Objects.department_id = Department.department_id
+        SELECT
+            a.object_id,
+            a.objectBeginDate,
+            a.culture,
+            a.medium,
+            a.material_family
+        FROM Art a
+        JOIN Objects o ON a.object_id = o.object_id
+        WHERE o.department_id = (SELECT department_id FROM Department WHERE displayName = ?)
+          AND a.objectBeginDate BETWEEN ? AND ?
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    first_year = (CENTURIES[0] - 1) * 100
+    last_year = CENTURIES[-1] * 100 - 1
 
-    return df[df["department_name"] == "The Cloisters"]
+    with connection(db_path) as conn:
+        df = read_sql(query, conn, (dept, first_year, last_year))
 
+    return df
 
 # =============================================================================
 # 2. Material Classification
 # =============================================================================
-material_map = {
-    "Stone": ["stone", "limestone", "marble", "sandstone", "alabaster", "cement"],
-    "Wood": ["wood", "oak", "walnut"],
-    "Metal": ["iron", "silver", "bronze", "copper", "brass", "lead", "gilt", "alloy"],
-    "Glass": ["glass", "vitreous", "stained", "pot-metal"],
-    "Organic": ["ivory", "bone", "parchment", "vellum", "human remains"],
-    "Ceramic": ["earthenware", "ceramic", "terracotta", "tile"],
-    "Textile": ["wool", "linen", "silk", "tapestry", "embroidered"],
-    "Mixed": ["tempera", "painted", "gilded", "gold", "polychrome"]
-}
-
-
-def assign_material_family(medium):
-    """Assign standardized material family based on keyword rules."""
-    m = str(medium).lower()
-    for family, keywords in material_map.items():
-        if any(k in m for k in keywords):
-            return family
-    return "Other"
+# Every object's material family is classified by the build (see materials.py),
+# or by the Art view's triggers for rows written through it, and read from
+# Art.material_family. Rows written to ArtData directly may have none yet and
+# are classified here.
+def assign_material_families(df):
+    """Return the material family of every row, classifying the missing ones."""
+    families = df["material_family"].copy()
+    missing = families.isna()
+    if missing.any():
+        families[missing] = classify_materials(df.loc[missing, "medium"])
+    return families
 
 
 # =============================================================================
 # 3. Preprocessing
 # =============================================================================
+@profiled("dataframe")
 def preprocess(df):
     """Assign material family and compute century from objectBeginDate."""
-    df["material_family"] = df["medium"].apply(assign_material_family)
+    df["material_family"] = assign_material_families(df)
 
     df["year"] = df["objectBeginDate"].astype(str).str[:4]
     df = df[df["year"].str.isnumeric()]  # Filter invalid years
@@ -76,16 +99,17 @@ def preprocess(df):
 # =============================================================================
 # 4. Material Heatmap
 # =============================================================================
+@profiled("figure")
 def run_material_eda(df):
     """Return heatmap (Top 3 materials × centuries) as HTML <img> tag."""
-    centuries = [12, 13, 14, 15, 16]
-    df_c = df[df["century"].isin(centuries)]
+    df_c = df[df["century"].isin(CENTURIES)]
 
     top3 = df_c["material_family"].value_counts().head(3).index.tolist()
     df_c = df_c[df_c["material_family"].isin(top3)]
 
     pivot = pd.crosstab(df_c["century"], df_c["material_family"])
 
+    plt, sns = init_plotting()
     plt.figure(figsize=(9, 6))
     sns.heatmap(
         pivot,
@@ -115,10 +139,12 @@ def run_material_eda(df):
 # =============================================================================
 # 5. Cultural Flow Sankey Diagram
 # =============================================================================
+@profiled("figure")
 def run_culture_sankey(df):
     """Return Sankey diagram (century → culture) as Plotly HTML."""
-    centuries = [12, 13, 14, 15, 16]
-    df_c = df[df["century"].isin(centuries)]
+    import plotly.graph_objects as go
+
+    df_c = df[df["century"].isin(CENTURIES)]
     df_c = df_c[df_c["culture"] != "European"]
 
     top5 = df_c["culture"].value_counts().head(5).index.tolist()
@@ -128,7 +154,7 @@ def run_culture_sankey(df):
     node_index = {}
 
     # Century nodes
-    for c in centuries:
+    for c in CENTURIES:
         label = f"Century {c}"
         node_index[label] = len(nodes)
         nodes.append(label)
@@ -140,22 +166,23 @@ def run_culture_sankey(df):
         nodes.append(label)
 
     # Color palette (you defined manually — preserved)
-    culture_colors = {
-        top5[0]: "rgba(199, 21, 133, 0.9)",
-        top5[1]: "rgba(30, 144, 255, 0.9)",
-        top5[2]: "rgba(46, 139, 87, 0.9)",
-        top5[3]: "rgba(255, 165, 0, 0.9)",
-        top5[4]: "rgba(138, 43, 226, 0.9)"
-    }
+    # (zipped, since a small collection may have fewer than five cultures)
+    culture_colors = dict(zip(top5, [
+        "rgba(199, 21, 133, 0.9)",
+        "rgba(30, 144, 255, 0.9)",
+        "rgba(46, 139, 87, 0.9)",
+        "rgba(255, 165, 0, 0.9)",
+        "rgba(138, 43, 226, 0.9)"
+    ]))
     century_color = "rgba(180,180,180,0.50)"
 
-    node_colors = [century_color] * len(centuries) + [
+    node_colors = [century_color] * len(CENTURIES) + [
         culture_colors[c] for c in top5
     ]
 
     source, target, value, link_colors = [], [], [], []
 
-    for c in centuries:
+    for c in CENTURIES:
         df_cen = df_c[df_c["century"] == c]
         counts = df_cen["culture"].value_counts()
 
@@ -187,17 +214,22 @@ def run_culture_sankey(df):
         height=650
     )
 
-    return fig.to_html(full_html=False)
+    return figure_html(fig)
 
 
 # =============================================================================
 # 6. Unified Entry Point for Flask
 # =============================================================================
-def run_eda(db_path):
-    """Return two HTML components: heatmap + Sankey."""
-    df = load_db(db_path)
+@versioned_cache(maxsize=32)
+def run_eda(db_path, dept=DEFAULT_DEPARTMENT):
+    """Return two HTML components for one department: heatmap + Sankey."""
+    df = load_db(db_path, dept)
     df = preprocess(df)
 
+    if df.empty:
+        empty = f"<p><b>No {dept} objects from the {CENTURIES[0]}th to {CENTURIES[-1]}th centuries.</b></p>"
+        return empty, empty
+
     heatmap_html = run_material_eda(df)
     sankey_html = run_culture_sankey(df)
 
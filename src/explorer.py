@@ -1,33 +1,36 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import sqlite3
 import pandas as pd
 
-# Fields available for category breakdown in the Explorer
-FIELDS = [
-    "classification",
+from cache import versioned_cache
+from database import connection
+from fields import ALL_DEPARTMENTS, BINARY_FIELDS, FIELDS
+from profiling import fetch_all, profiled, read_sql
+
+# Columns of the Explorer detail table, in display order
+DETAIL_COLUMNS = [
+    "title",
     "culture",
     "country",
+    "classification",
+    "artist",
     "isHighlight",
     "isPublicDomain",
 ]
 
-# Fields whose values should be displayed as Yes/No
-BINARY_FIELDS = ["isHighlight", "isPublicDomain"]
-
 
 # ================================================================
 # Load departments
 # ================================================================
+@profiled("dataframe")
 def get_departments(db_path):
     """Return a list of all departments, with an 'ALL' option prepended."""
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql(
-        "SELECT DISTINCT displayName FROM Department ORDER BY displayName;",
-        conn,
-    )
-    conn.close()
+    with connection(db_path) as conn:
+        df = read_sql(
+            "SELECT DISTINCT displayName FROM Department ORDER BY displayName;",
+            conn,
+        )
 
     departments = df["displayName"].tolist()
     departments.insert(0, "ALL")
@@ -37,37 +40,45 @@ def get_departments(db_path):
 # ================================================================
 # Summary table for Explorer chart
 # ================================================================
+@versioned_cache(maxsize=256)
+@profiled("dataframe")
 def run_group_query(db_path, selected_dept, selected_field):
-    """Return grouped counts for building the Explorer chart."""
+    """Return grouped counts for building the Explorer chart.
+
+    Counts come from the Rollup table maintained by the build, so this is a
+    key lookup on (field, department) rather than a GROUP BY over the join.
+    """
+    if selected_field not in FIELDS:
+        raise ValueError(f"Unknown field: {selected_field}")
 
     if selected_dept == "ALL":
-        query = f"""
-            SELECT 
-                a.{selected_field} AS category,
-                COUNT(*) AS num_objects
-            FROM Art a
-            JOIN Objects o ON a.object_id = o.object_id
-            GROUP BY a.{selected_field}
+        query = """
+            SELECT
+                category,
+                num_objects
+            FROM Rollup
+            WHERE field = ?
+              AND department_id = ?
+              AND num_objects > 0
             ORDER BY num_objects DESC
         """
-        params = ()
+        params = (selected_field, ALL_DEPARTMENTS)
     else:
-        query = f"""
-            SELECT 
-                a.{selected_field} AS category,
-                COUNT(*) AS num_objects
-            FROM Art a
-            JOIN Objects o ON a.object_id = o.object_id
-            JOIN Department d ON d.department_id = o.department_id
-            WHERE d.displayName = ?
-            GROUP BY a.{selected_field}
-            ORDER BY num_objects DESC
+        query = """
+            SELECT
+                r.category,
+                r.num_objects
+            FROM Rollup r
+            JOIN Department d ON d.department_id = r.department_id
+            WHERE r.field = ?
+              AND d.displayName = ?
+              AND r.num_objects > 0
+            ORDER BY r.num_objects DESC
         """
-        params = (selected_dept,)
+        params = (selected_field, selected_dept)
 
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql(query, conn, params=params)
-    conn.close()
+    with connection(db_path) as conn:
+        df = read_sql(query, conn, params)
 
     df["category"] = df["category"].fillna("Unknown")
 
@@ -80,55 +91,151 @@ def run_group_query(db_path, selected_dept, selected_field):
 # ================================================================
 # Detail table for Explorer
 # ================================================================
-def run_detail_query(db_path, selected_dept):
-    """Return detailed metadata records for the Explorer table."""
+@profiled("dataframe")
+def run_detail_page(db_path, selected_dept, start=0, length=25, search="", order_by=None, descending=False):
+    """Return one page of the Explorer table, for DataTables server-side processing.
+
+    `search` filters through the ArtSearch index (every word must match, the
+    last as a prefix), and `order_by` is one of DETAIL_COLUMNS, or None for
+    object order. Only the requested rows leave SQLite.
+    Returns (DataFrame, records_total, records_filtered).
+    """
+    if order_by is not None and order_by not in DETAIL_COLUMNS:
+        raise ValueError(f"Unknown column: {order_by}")
+
+    conditions = []
+    params = []
+    if selected_dept != "ALL":
+        # resolved to an id first, so Objects is read in (department_id,
+        # object_id) index order and object order needs no sort
+        conditions.append("o.department_id = (SELECT department_id FROM Department WHERE displayName = ?)")
+        params.append(selected_dept)
+
+    expression = match_expression(search or "")
+    if expression is not None:
+        conditions.append("a.object_id IN (SELECT rowid FROM ArtSearch WHERE ArtSearch MATCH ?)")
+        params.append(expression)
+
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    if order_by is None:
+        order = "o.object_id"
+    else:
+        order = f"{order_by} {'DESC' if descending else 'ASC'}, o.object_id"
+
+    query = f"""
+        SELECT
+            a.title,
+            a.culture,
+            a.country,
+            a.classification,
+            COALESCE(ar.artist_name, 'Unknown') AS artist,
+            a.isHighlight,
+            a.isPublicDomain
+        FROM Art a
+        JOIN Objects o ON a.object_id = o.object_id
+        LEFT JOIN Artists ar ON a.artistAlphaSort = ar.artistAlphaSort
+        {where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    """
+
+    with connection(db_path) as conn:
+        records_total = _count_objects(conn, selected_dept)
+        if expression is None:
+            records_filtered = records_total
+        else:
+            records_filtered = fetch_all(
+                conn,
+                f"SELECT COUNT(*) FROM Art a JOIN Objects o ON a.object_id = o.object_id {where}",
+                params,
+            )[0][0]
+        df = read_sql(query, conn, params + [length, start])
 
+    df["isHighlight"] = df["isHighlight"].map({0: "No", 1: "Yes"}).fillna("Unknown")
+    df["isPublicDomain"] = df["isPublicDomain"].map({0: "No", 1: "Yes"}).fillna("Unknown")
+
+    return df, records_total, records_filtered
+
+
+def _count_objects(conn, selected_dept):
+    """Number of objects in a department (or "ALL"), summed from its Rollup rows."""
     if selected_dept == "ALL":
         query = """
-            SELECT 
-                a.title,
-                a.culture,
-                a.country,
-                a.classification,
-                COALESCE(ar.artist_name, 'Unknown') AS artist,
-                a.isHighlight,
-                a.isPublicDomain
-            FROM Art a
-            JOIN Objects o ON a.object_id = o.object_id
-            LEFT JOIN Artists ar ON a.artistAlphaSort = ar.artistAlphaSort
+            SELECT COALESCE(SUM(num_objects), 0)
+            FROM Rollup
+            WHERE field = ?
+              AND department_id = ?
         """
-        params = ()
+        params = (FIELDS[0], ALL_DEPARTMENTS)
     else:
         query = """
-            SELECT 
-                a.title,
-                a.culture,
-                a.country,
-                a.classification,
-                COALESCE(ar.artist_name, 'Unknown') AS artist,
-                a.isHighlight,
-                a.isPublicDomain
-            FROM Art a
-            JOIN Objects o ON a.object_id = o.object_id
-            JOIN Department d ON d.department_id = o.department_id
-            LEFT JOIN Artists ar ON a.artistAlphaSort = ar.artistAlphaSort
-            WHERE d.displayName = ?
+            SELECT COALESCE(SUM(r.num_objects), 0)
+            FROM Rollup r
+            JOIN Department d ON d.department_id = r.department_id
+            WHERE r.field = ?
+              AND d.displayName = ?
         """
-        params = (selected_dept,)
+        params = (FIELDS[0], selected_dept)
 
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql(query, conn, params=params)
-    conn.close()
+    return fetch_all(conn, query, params)[0][0]
 
-    df["isHighlight"] = df["isHighlight"].map({0: "No", 1: "Yes"}).fillna("Unknown")
-    df["isPublicDomain"] = df["isPublicDomain"].map({0: "No", 1: "Yes"}).fillna("Unknown")
 
-    return df
+# ================================================================
+# Full-text search
+# ================================================================
+def match_expression(text):
+    """Turn free text into an FTS5 query matching every word, the last as a prefix."""
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+@profiled("dataframe")
+def search_objects(db_path, text, page=1, per_page=25):
+    """Return one page of objects matching `text`, best match first.
+
+    Matches title, medium, culture, classification and artist through the
+    ArtSearch index. Returns (DataFrame, has_next).
+    """
+    columns = ["object_id", "title", "artist", "department", "medium", "culture", "classification"]
+    expression = match_expression(text)
+    if expression is None:
+        return pd.DataFrame(columns=columns), False
+
+    query = """
+        SELECT
+            a.object_id,
+            a.title,
+            COALESCE(ar.artist_name, a.artistAlphaSort) AS artist,
+            d.displayName AS department,
+            a.medium,
+            a.culture,
+            a.classification
+        FROM ArtSearch s
+        JOIN Art a ON a.object_id = s.rowid
+        LEFT JOIN Objects o ON o.object_id = a.object_id
+        LEFT JOIN Department d ON d.department_id = o.department_id
+        LEFT JOIN Artists ar ON ar.artistAlphaSort = a.artistAlphaSort
+        WHERE ArtSearch MATCH ?
+        ORDER BY s.rank
+        LIMIT ? OFFSET ?
+    """
+    # one extra row tells us whether there is a next page
+    params = (expression, per_page + 1, (page - 1) * per_page)
+
+    with connection(db_path) as conn:
+        df = read_sql(query, conn, params)
+
+    return df.head(per_page)[columns], len(df) > per_page
 
 
 # ================================================================
 # Collapse small groups into "Other"
 # ================================================================
+@profiled("dataframe")
 def collapse_small_groups(df, field, cutoff_ratio=0.01):
     """Collapse groups under <cutoff_ratio of total into 'Other <field>'."""
     cutoff = df["num_objects"].sum() * cutoff_ratio
@@ -0,0 +1,268 @@
+'''
+facets.py
+
+Faceted counts for cross-filtering the collection.
+
+facet_counts() takes any combination of departments, classifications,
+cultures, countries and highlight/public domain flags, and a range of
+creation years, and counts the matching objects per value of every facet.
+Each facet is counted under every filter but its own, so its counts show
+what choosing another of its values would give.
+
+The counts come from a FacetIndex: the facet values of every object as
+integer codes in NumPy arrays. A filter is a boolean mask over those codes
+and a facet's counts are a bincount of its masked codes, so a drill-down is
+a few passes over flat arrays, whatever the selection, instead of a GROUP BY
+per facet over the join.
+
+met-build.py stores the index of every snapshot in its Artifacts table (see
+artifacts.py), so the app loads it with one read instead of fetching every
+row. The app keeps the index of the current snapshot only, and warm()
+loads it in the background when the app starts.
+'''
+
+import io
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cache import versioned_cache
+from database import connection, snapshot_version
+from fields import BINARY_FIELDS, FIELDS
+from profiling import fetch_all, phase, profiled
+
+# Facets, in response order: the department and the explorer FIELDS
+FACETS = ["department"] + FIELDS
+
+# facet -> SQL for its code in ArtData/Objects (0 when the object has no
+# value), and the query for the label of each code. Lookup and department ids
+# start at 1; the binary fields are stored as 0/1 and coded 1 (No) and 2 (Yes).
+FACET_COLUMNS = {
+    "department": "o.department_id",
+    "classification": "COALESCE(a.classification_id, 0)",
+    "culture": "COALESCE(a.culture_id, 0)",
+    "country": "COALESCE(a.country_id, 0)",
+    "isHighlight": "COALESCE(a.isHighlight + 1, 0)",
+    "isPublicDomain": "COALESCE(a.isPublicDomain + 1, 0)",
+}
+LABEL_QUERIES = {
+    "department": "SELECT department_id, displayName FROM Department",
+    "classification": "SELECT classification_id, classification FROM Classification",
+    "culture": "SELECT culture_id, culture FROM Culture",
+    "country": "SELECT country_id, country FROM Country",
+    **{field: "SELECT 1, 'No' UNION ALL SELECT 2, 'Yes'" for field in BINARY_FIELDS},
+}
+
+# Creation years of every object, undated objects as (+inf, -inf) so that no
+# year range matches them (1e999 is how SQLite writes infinity)
+YEAR_COLUMNS = {
+    "begin": "COALESCE(a.objectBeginDate, a.objectEndDate, 1e999)",
+    "end": "COALESCE(a.objectEndDate, a.objectBeginDate, -1e999)",
+}
+
+# Label of the objects without a value, as in the Rollup table
+UNKNOWN = "Unknown"
+
+# Most values returned per facet, largest first
+FACET_LIMIT = 25
+
+# Name of the stored index in the Artifacts table
+ARTIFACT = "facet_index"
+
+
+class FacetIndex:
+    '''
+        The facet values and creation years of every object of one snapshot.
+        codes[facet] holds an index into labels[facet] per object, in the
+        smallest unsigned type that fits.
+    '''
+
+    def __init__(self, codes, labels, begin, end):
+        self.codes = codes
+        self.labels = labels
+        self.positions = {facet: {label: i for i, label in enumerate(labels[facet])} for facet in FACETS}
+        self.begin = begin
+        self.end = end
+        self.size = len(begin)
+
+    @classmethod
+    def read(cls, conn):
+        '''
+            Build the index from the rows of a snapshot. Each column is read
+            straight into a typed array, one value at a time.
+        '''
+        joins = "FROM ArtData a JOIN Objects o ON o.object_id = a.object_id"
+        count = fetch_all(conn, f"SELECT COUNT(*) {joins}")[0][0]
+
+        def column(sql, dtype):
+            with phase("sql"):
+                rows = conn.execute(f"SELECT {sql} {joins} ORDER BY a.object_id")
+                return np.fromiter((row[0] for row in rows), dtype=dtype, count=count)
+
+        codes, labels = {}, {}
+        for facet in FACETS:
+            raw = column(FACET_COLUMNS[facet], np.int64)
+            names = dict(fetch_all(conn, LABEL_QUERIES[facet]))
+            size = max(max(names, default=0), int(raw.max(initial=0))) + 1
+            by_code = [names.get(code, UNKNOWN) for code in range(size)]
+            by_code[0] = UNKNOWN
+            # values named like the missing one ("Unknown") share its code
+            merged, uniques = pd.factorize(pd.Series(by_code, dtype=object))
+            codes[facet] = merged.astype(np.min_scalar_type(len(uniques)))[raw]
+            labels[facet] = list(uniques)
+
+        return cls(codes, labels, column(YEAR_COLUMNS["begin"], np.float32), column(YEAR_COLUMNS["end"], np.float32))
+
+    def to_bytes(self):
+        '''The index as an uncompressed .npz file, for the Artifacts table.'''
+        arrays = {"begin": self.begin, "end": self.end}
+        for facet in FACETS:
+            arrays[f"codes.{facet}"] = self.codes[facet]
+            arrays[f"labels.{facet}"] = np.array(self.labels[facet], dtype=str)
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(
+                {facet: arrays[f"codes.{facet}"] for facet in FACETS},
+                {facet: arrays[f"labels.{facet}"].tolist() for facet in FACETS},
+                arrays["begin"],
+                arrays["end"],
+            )
+
+    def value_mask(self, facet, values):
+        '''Objects whose `facet` is one of the labels in `values`.'''
+        selected = np.zeros(len(self.labels[facet]), dtype=bool)
+        selected[[self.positions[facet][v] for v in values if v in self.positions[facet]]] = True
+        return selected[self.codes[facet]]
+
+    def year_mask(self, year_from, year_to):
+        '''
+            Objects made at some point between year_from and year_to (either may
+            be None). Objects without a creation year never match a range.
+        '''
+        keep = np.ones(self.size, dtype=bool)
+        if year_from is not None:
+            keep &= self.end >= year_from
+        if year_to is not None:
+            keep &= self.begin <= year_to
+        return keep
+
+    def counts(self, facet, mask):
+        '''(label, objects) of every value of `facet` among the masked objects, largest first.'''
+        counts = np.bincount(self.codes[facet][mask], minlength=len(self.labels[facet]))
+        order = np.argsort(-counts, kind="stable")
+        return [(self.labels[facet][i], int(counts[i])) for i in order if counts[i] > 0]
+
+
+def read_facet_index(db_path):
+    '''Build the FacetIndex of the current snapshot of db_path from its rows.'''
+    with connection(db_path) as conn:
+        return FacetIndex.read(conn)
+
+
+def load_facet_index(db_path):
+    '''The FacetIndex stored in the current snapshot, or built from its rows if it has none.'''
+    try:
+        with connection(db_path) as conn:
+            row = fetch_all(conn, "SELECT body FROM Artifacts WHERE name = ?", (ARTIFACT,))
+    except sqlite3.OperationalError as e:
+        # a snapshot from before the Artifacts table
+        if "no such table" not in str(e):
+            raise
+        row = None
+
+    if not row:
+        return read_facet_index(db_path)
+    return FacetIndex.from_bytes(row[0][0])
+
+
+# The index of the current snapshot, as ((db_path, snapshot version), FacetIndex)
+_index = (None, None)
+_index_lock = threading.Lock()
+
+
+@profiled("dataframe")
+def facet_index(db_path):
+    '''
+        The FacetIndex of the current snapshot of db_path. It is loaded once
+        per snapshot; requests arriving meanwhile wait for it rather than
+        loading their own, and the previous index is dropped first, so at most
+        one is held.
+    '''
+    global _index
+
+    key = (db_path, snapshot_version(db_path))
+    with _index_lock:
+        if _index[0] != key:
+            _index = (None, None)
+            _index = (key, load_facet_index(db_path))
+        return _index[1]
+
+
+def warm(db_path):
+    '''Load the facet index of db_path in a background thread.'''
+    thread = threading.Thread(target=facet_index, args=(db_path,), name="facet-index", daemon=True)
+    thread.start()
+    return thread
+
+
+def make_selection(filters):
+    '''
+        The hashable selection facet_counts() takes, from {facet: values}.
+        Facets without values are left out.
+    '''
+    unknown = set(filters) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown facets: {', '.join(sorted(unknown))}")
+    return tuple((facet, tuple(sorted(set(filters[facet])))) for facet in FACETS if filters.get(facet))
+
+
+@versioned_cache(maxsize=256)
+@profiled("dataframe")
+def facet_counts(db_path, selection=(), year_from=None, year_to=None, limit=FACET_LIMIT):
+    """Return the objects matching a selection and the counts of every facet.
+
+    `selection` comes from make_selection(): an object matches when, for
+    every facet in it, its value is one of the selected labels, and its
+    creation years overlap [year_from, year_to]. Selected values are always
+    listed, past `limit` and with 0 objects if need be.
+    Returns {"total", "years": [first, last] or None, "facets": {facet: [[label, objects], ...]}}.
+    """
+    index = facet_index(db_path)
+
+    years = index.year_mask(year_from, year_to)
+    masks = {facet: index.value_mask(facet, values) for facet, values in selection}
+    matching = years.copy()
+    for mask in masks.values():
+        matching &= mask
+
+    facets = {}
+    for facet in FACETS:
+        if facet in masks:
+            # every filter but the facet's own
+            others = years.copy()
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+        else:
+            others = matching
+
+        counts = index.counts(facet, others)
+        selected = dict(selection).get(facet, ())
+        listed = counts[:limit] + [c for c in counts[limit:] if c[0] in selected]
+        found = {label for label, _ in counts}
+        listed += [(label, 0) for label in selected if label not in found]
+        facets[facet] = [list(c) for c in listed]
+
+    dated = matching & np.isfinite(index.begin)
+    years_found = None
+    if dated.any():
+        years_found = [int(index.begin[dated].min()), int(index.end[dated].max())]
+
+    return {"total": int(matching.sum()), "years": years_found, "facets": facets}
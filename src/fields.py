@@ -0,0 +1,22 @@
+'''
+fields.py
+
+The Explorer's breakdown fields, shared by the app and the schema scripts.
+met-schema.py builds the Rollup table and its indexes from these, so it
+imports them from here rather than from the app's modules.
+'''
+
+# Fields available for category breakdown in the Explorer
+FIELDS = [
+    "classification",
+    "culture",
+    "country",
+    "isHighlight",
+    "isPublicDomain",
+]
+
+# Fields whose values should be displayed as Yes/No
+BINARY_FIELDS = ["isHighlight", "isPublicDomain"]
+
+# department_id of the collection wide ("ALL") rows in the Rollup table
+ALL_DEPARTMENTS = 0
@@ -0,0 +1,270 @@
+'''
+images.py
+
+A local proxy for the museum's object images.
+
+The highlights viewer shows images through /img/<object_id> instead of
+downloading and embedding the full-resolution file on every click. The first
+request for an object downloads its primaryImage once into IMAGE_CACHE_DIR;
+every size variant is then resized from that local copy and stored beside
+it, so repeat views are served from disk without touching the network.
+While one highlight is shown, prefetch() fills the cache for its neighbors
+in the background, so next/prev find their images ready.
+
+The cache is capped at IMAGE_CACHE_MAX_BYTES (MET_IMAGE_CACHE_MB): past it,
+the least recently used files are removed. Images are only downloaded over
+http(s), whatever the primaryImage URL in the database says.
+'''
+
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from database import DB_PATH, connection
+
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(DB_PATH), "image_cache")
+
+# Most bytes kept in IMAGE_CACHE_DIR. Past that, the least recently used
+# files are removed until it holds IMAGE_CACHE_TRIM of it.
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("MET_IMAGE_CACHE_MB", 2048)) << 20
+IMAGE_CACHE_TRIM = 0.9
+
+# Longest side, in pixels, of the variants /img serves
+IMAGE_SIZES = [400, 800, 1600]
+DEFAULT_IMAGE_SIZE = 800
+
+# variant format -> (Pillow format, file extension, mimetype)
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+}
+QUALITY = 85
+
+# seconds to wait for the image host
+FETCH_TIMEOUT = 20
+
+# URL schemes images are downloaded with. The opener has no handlers for any
+# other, so a redirect cannot lead to a file: or ftp: URL either.
+FETCH_SCHEMES = ("http", "https")
+_opener = urllib.request.OpenerDirector()
+for _handler in (
+    urllib.request.ProxyHandler(),
+    urllib.request.HTTPHandler(),
+    urllib.request.HTTPSHandler(),
+    urllib.request.HTTPRedirectHandler(),
+    urllib.request.HTTPDefaultErrorHandler(),
+    urllib.request.HTTPErrorProcessor(),
+):
+    _opener.add_handler(_handler)
+
+# What Pillow raises for a file it cannot decode, besides OSError
+DECODE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+# The highlights viewer prefetches the images this many steps either side of
+# the one shown, with this many background downloads at a time
+PREFETCH_DISTANCE = 2
+PREFETCH_WORKERS = 4
+
+# Objects share this many locks, so the set stays the same size however many
+# objects are requested
+LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+# Bytes in IMAGE_CACHE_DIR as this process last counted them (None: not yet)
+_cache_bytes = None
+_cache_lock = threading.Lock()
+
+_prefetcher = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class ImageNotFound(LookupError):
+    '''The object does not exist or has no primary image.'''
+
+
+def _lock(object_id):
+    '''The lock of an object, so concurrent requests download its image once.'''
+    return _locks[hash(object_id) % LOCK_STRIPES]
+
+
+def primary_image_url(db_path, object_id):
+    with connection(db_path) as conn:
+        row = conn.execute("SELECT primaryImage FROM Art WHERE object_id = ?", (object_id,)).fetchone()
+    if row is None or not row[0] or row[0] == "Unknown":
+        raise ImageNotFound(object_id)
+    if urllib.parse.urlsplit(row[0]).scheme.lower() not in FETCH_SCHEMES:
+        raise ImageNotFound(f"{object_id}: not an http(s) URL")
+    return row[0]
+
+
+def original_path(object_id):
+    return os.path.join(IMAGE_CACHE_DIR, f"{object_id}.orig")
+
+
+def variant_path(object_id, size, fmt):
+    return os.path.join(IMAGE_CACHE_DIR, f"{object_id}-{size}.{FORMATS[fmt][1]}")
+
+
+def _write_atomically(path, write):
+    '''Call write(tmp_path), then rename it to path, so readers never see part of a file.'''
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _touch(path):
+    '''Mark a cached file as just used; False if it is not in the cache.'''
+    try:
+        # the access time orders eviction; the modification time is left
+        # alone, since /img responses are validated against it
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _cached_files():
+    '''(access time, size, path) of every file in IMAGE_CACHE_DIR.'''
+    files = []
+    with os.scandir(IMAGE_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime_ns, stat.st_size, entry.path))
+    return files
+
+
+def _added_to_cache(path):
+    '''
+        Count a file just written to the cache, and once the cache is over
+        IMAGE_CACHE_MAX_BYTES, remove the least recently used other files
+        until it is back to IMAGE_CACHE_TRIM of that.
+    '''
+    global _cache_bytes
+
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _cached_files())
+        else:
+            _cache_bytes += os.path.getsize(path)
+        if _cache_bytes <= IMAGE_CACHE_MAX_BYTES:
+            return
+
+        # recounted, since other processes share the directory
+        files = sorted(_cached_files())
+        _cache_bytes = sum(size for _, size, _ in files)
+        for _, size, old in files:
+            if _cache_bytes <= IMAGE_CACHE_MAX_BYTES * IMAGE_CACHE_TRIM:
+                break
+            if old == path:
+                continue
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+            _cache_bytes -= size
+
+
+def fetch_original(db_path, object_id):
+    '''Path of the local copy of an object's primaryImage, downloading it if needed.'''
+    path = original_path(object_id)
+    if _touch(path):
+        return path
+
+    url = primary_image_url(db_path, object_id)
+
+    def download(tmp):
+        with _opener.open(url, timeout=FETCH_TIMEOUT) as response, open(tmp, "wb") as f:
+            while chunk := response.read(1 << 16):
+                f.write(chunk)
+
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    _write_atomically(path, download)
+    _added_to_cache(path)
+    return path
+
+
+def image_variant(db_path, object_id, size=DEFAULT_IMAGE_SIZE, fmt="jpeg"):
+    '''
+        Return (path, mimetype) of an object's image resized to fit size x size
+        pixels, creating it on first use. Raises ImageNotFound for objects
+        without an image, and OSError if it cannot be downloaded or decoded.
+    '''
+    if size not in IMAGE_SIZES:
+        raise ValueError(f"Unsupported image size: {size}")
+    pil_format, _, mimetype = FORMATS[fmt]
+
+    path = variant_path(object_id, size, fmt)
+    if _touch(path):
+        return path, mimetype
+
+    with _lock(object_id):
+        if not os.path.exists(path):
+            original = fetch_original(db_path, object_id)
+
+            def resize(tmp):
+                with Image.open(original) as image:
+                    image.thumbnail((size, size))
+                    image.convert("RGB").save(tmp, pil_format, quality=QUALITY)
+
+            try:
+                _write_atomically(path, resize)
+            except DECODE_ERRORS as e:
+                # not an image Pillow can read; download it again next time
+                if os.path.exists(original):
+                    os.remove(original)
+                if isinstance(e, OSError):
+                    raise
+                raise OSError(f"Cannot decode the image of object {object_id}: {e}") from e
+            _added_to_cache(path)
+
+    return path, mimetype
+
+
+# ================================================================
+# Background prefetch
+# ================================================================
+def prefetch(db_path, object_ids, size=DEFAULT_IMAGE_SIZE, fmt="jpeg"):
+    '''
+        Create the variants of object_ids in the background, so a later /img
+        request finds them on disk. Variants already cached or already queued
+        are skipped. Failures are dropped; the /img request for the image will
+        retry and report them. Returns the futures of the queued downloads.
+    '''
+    global _prefetcher
+
+    futures = []
+    for object_id in object_ids:
+        key = (object_id, size, fmt)
+        if os.path.exists(variant_path(object_id, size, fmt)):
+            continue
+        with _pending_lock:
+            if key in _pending:
+                continue
+            _pending.add(key)
+            if _prefetcher is None:
+                _prefetcher = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+        future = _prefetcher.submit(image_variant, db_path, object_id, size, fmt)
+        future.add_done_callback(lambda _, key=key: _discard_pending(key))
+        futures.append(future)
+    return futures
+
+
+def _discard_pending(key):
+    with _pending_lock:
+        _pending.discard(key)
@@ -9,25 +9,28 @@ Created: November 18th 2025
 '''
 
 # imports
+# plotly, ipywidgets and skimage are imported where they are used, and the
+# database is only opened by the functions below, so importing this module
+# is quick and has no side effects; call create_widgets() in the notebook
 import pandas as pd
 import numpy as np
 import sqlite3
-import plotly.express as px
-import ipywidgets as widgets
-from ipywidgets import interact
-from skimage import io
 
 
-# set up connecting to the met database
-conn = sqlite3.connect("met_data/met.db")
-cursor = conn.cursor()
+# path of the met database, relative to the notebook
+DB_PATH = "met_data/met.db"
 
 # pull categorical data types for further visualization
 categorical = ['isHighlight', 'isPublicDomain', 'country', 'classification']
 
-# pull in department names for future visualizations
-department_names = pd.read_sql('''SELECT displayName FROM Department WHERE department_id IN (SELECT department_id
+
+def department_names(db_path=DB_PATH):
+    '''pulls in department names for the dropdowns'''
+    conn = sqlite3.connect(db_path)
+    names = pd.read_sql('''SELECT displayName FROM Department WHERE department_id IN (SELECT department_id
                                FROM Objects)''', conn)
+    conn.close()
+    return names['displayName'].to_list()
 
 
 # helper functions
@@ -41,11 +44,13 @@ def one_p_filter(pie_df, field):
 
 def select_dept_field(dept, field, filter_1_p):
     '''filters the met db by the department and groups by field. can optionally roll up groups with under 1% of the total count'''
-    conn = sqlite3.connect("met_data/met.db")
+    import plotly.express as px
+
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    pie_data = pd.read_sql(f'''SELECT a.{field}, COUNT(*) as num_objects 
-                           FROM Art a, Objects o, Department d WHERE d.displayName="''' + dept +  f'''" AND a.object_id=o.object_id 
-                           AND o.department_id=d.department_id GROUP BY {field}''', conn)
+    pie_data = pd.read_sql(f'''SELECT r.category as {field}, r.num_objects 
+                           FROM Rollup r, Department d WHERE d.displayName=? AND r.field=? 
+                           AND r.department_id=d.department_id AND r.num_objects > 0''', conn, params=(dept, field))
     
     # filter if a categorical type rather than boolean
     if field in ("isHighlight", "isPublicDomain"):
@@ -61,13 +66,15 @@ def select_dept_field(dept, field, filter_1_p):
 
 def create_box_chart():
     '''groups met data by department and plots the creation year of the art'''
-    conn = sqlite3.connect("met_data/met.db")
+    import plotly.express as px
+
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     create_years = pd.read_sql('''
-        SELECT CAST(a.objectBeginDate as integer) as earliest, CAST(a.objectEndDate as integer) as latest, 
+        SELECT a.objectBeginDate as earliest, a.objectEndDate as latest, 
                                d.displayName FROM Art a, Department d, Objects o WHERE a.object_id=o.object_id
-                                AND o.department_id=d.department_id AND CAST(a.objectBeginDate as integer)!= 0 
-                                AND CAST(a.objectEndDate as integer) <= 2025
+                                AND o.department_id=d.department_id AND a.objectEndDate <= 2025
+                                AND a.objectBeginDate != 0
         ''', conn)
 
     fig = px.box(create_years, x='earliest', y='displayName', title='Creation Year of the Art Objects per Department')
@@ -78,12 +85,14 @@ def create_box_chart():
 
 def acq_bar_chart():
     '''groups met data by department and pltos the acquistion years'''
-    conn = sqlite3.connect("met_data/met.db")
+    import plotly.express as px
+
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     accquision_years = pd.read_sql('''
-            SELECT CAST(a.accessionYear as integer) as accessionYear, d.displayName FROM Art a, 
+            SELECT a.accessionYear, d.displayName FROM Art a, 
             Department d, Objects o WHERE a.object_id=o.object_id AND o.department_id=d.department_id
-             AND CAST(a.accessionYear as integer)!=0
+             AND a.accessionYear > 0
         ''', conn)
     
     fig = px.histogram(accquision_years, x='accessionYear', color='displayName', title='Accession Year by Department', nbins=20)
@@ -95,7 +104,10 @@ def acq_bar_chart():
 
 def show_highlights(play, dept):
     '''pulls Art Objects with an available image and tagged as highlights of the collection and plots it'''
-    conn = sqlite3.connect("met_data/met.db")
+    import plotly.express as px
+    from skimage import io
+
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     image_available = pd.read_sql(f'''SELECT *
                            FROM Art a, Objects o, Department d WHERE d.displayName="''' + dept +  f'''" AND a.object_id=o.object_id 
@@ -120,37 +132,54 @@ def show_highlights(play, dept):
     fig.show()
     conn.close()
 
-# create the interactive pie chart
-interactive_pie = widgets.interactive(select_dept_field, 
-    dept= widgets.Dropdown(
-        options=department_names['displayName'].to_list(),
-        value='The Cloisters',
-        description='Department:',
-        disabled=False), 
-    field=widgets.ToggleButtons(
-        options=categorical,
-        description='Field of Interest:',
-        disabled=False),
-    filter_1_p= widgets.Checkbox(
-        value=False,
-        description='Collapse values under 1%?',
-        disabled=False,
-        button_style='success',
-        tooltip='Description',
-        icon='check' #
-    ))
-
-# creates the interactive slideshow
-interactive_slideshow = widgets.interactive(show_highlights, play=widgets.Play(
-    value=0,
-    min=0,
-    max=1000,
-    step=1,
-    interval=5000,
-    description="Press play",
-    disabled=False),
+def create_widgets(db_path=DB_PATH):
+    '''builds the interactive pie chart and slideshow; returns (interactive_pie, interactive_slideshow)'''
+    import ipywidgets as widgets
+
+    names = department_names(db_path)
+
+    # create the interactive pie chart
+    interactive_pie = widgets.interactive(select_dept_field, 
         dept= widgets.Dropdown(
-        options=department_names['displayName'].to_list(),
-        value='The Cloisters',
-        description='Department:',
-        disabled=False))
+            options=names,
+            value='The Cloisters',
+            description='Department:',
+            disabled=False), 
+        field=widgets.ToggleButtons(
+            options=categorical,
+            description='Field of Interest:',
+            disabled=False),
+        filter_1_p= widgets.Checkbox(
+            value=False,
+            description='Collapse values under 1%?',
+            disabled=False,
+            button_style='success',
+            tooltip='Description',
+            icon='check' #
+        ))
+
+    # creates the interactive slideshow
+    interactive_slideshow = widgets.interactive(show_highlights, play=widgets.Play(
+        value=0,
+        min=0,
+        max=1000,
+        step=1,
+        interval=5000,
+        description="Press play",
+        disabled=False),
+            dept= widgets.Dropdown(
+            options=names,
+            value='The Cloisters',
+            description='Department:',
+            disabled=False))
+
+    return interactive_pie, interactive_slideshow
+
+
+def __getattr__(name):
+    '''builds the widgets the first time interactive_pie or interactive_slideshow is used'''
+    if name in ("interactive_pie", "interactive_slideshow"):
+        global interactive_pie, interactive_slideshow
+        interactive_pie, interactive_slideshow = create_widgets(DB_PATH)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,79 @@
+'''
+materials.py
+Classify object mediums into standardized material families.
+
+met-build.py classifies every distinct medium once and stores the result in
+ArtData.material_family, so the EDA and any collection-wide material queries
+read a column instead of re-running the rules. Rows written through the Art
+view later are classified by its triggers, with the same rules in SQL
+(family_sql()).
+'''
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Family -> keywords found in the medium. Families are checked in this order
+# and the first one with a matching keyword wins.
+MATERIAL_FAMILIES = {
+    "Stone": ["stone", "limestone", "marble", "sandstone", "alabaster", "cement"],
+    "Wood": ["wood", "oak", "walnut"],
+    "Metal": ["iron", "silver", "bronze", "copper", "brass", "lead", "gilt", "alloy"],
+    "Glass": ["glass", "vitreous", "stained", "pot-metal"],
+    "Organic": ["ivory", "bone", "parchment", "vellum", "human remains"],
+    "Ceramic": ["earthenware", "ceramic", "terracotta", "tile"],
+    "Textile": ["wool", "linen", "silk", "tapestry", "embroidered"],
+    "Mixed": ["tempera", "painted", "gilded", "gold", "polychrome"]
+}
+
+OTHER = "Other"
+
+FAMILIES = list(MATERIAL_FAMILIES) + [OTHER]
+
+# keyword -> index of its family in FAMILIES
+KEYWORD_RANKS = {
+    keyword: rank
+    for rank, keywords in reversed(list(enumerate(MATERIAL_FAMILIES.values())))
+    for keyword in keywords
+}
+
+# One pattern for every keyword. The lookahead reports a match at every
+# position, and the keywords are tried in family order, so at each position the
+# highest priority keyword starting there is the one found.
+KEYWORDS = re.compile(
+    "(?=({}))".format("|".join(re.escape(k) for k in sorted(KEYWORD_RANKS, key=KEYWORD_RANKS.get)))
+)
+
+
+def family_rank(text):
+    """Index in FAMILIES of the first family with a keyword in `text`."""
+    return min((KEYWORD_RANKS[k] for k in KEYWORDS.findall(text)), default=len(MATERIAL_FAMILIES))
+
+
+def classify_materials(mediums):
+    """Return the material family of every medium in a Series, as a Series.
+
+    Gives the same result as checking the keywords row by row in
+    MATERIAL_FAMILIES order. The combined pattern runs once per distinct
+    lowercased medium, and the families are mapped back onto the rows by
+    their factorized codes.
+    """
+    codes, uniques = pd.factorize(mediums.astype(str).str.lower())
+    ranks = np.array([family_rank(text) for text in uniques], dtype=np.intp)
+    families = np.array(FAMILIES, dtype=object)[ranks[codes]]
+    return pd.Series(families, index=mediums.index, dtype=object)
+
+
+def family_sql(medium):
+    """The material family of `medium`, an SQL expression, as an SQL subquery.
+
+    Checks the keywords in MATERIAL_FAMILIES order like classify_materials(),
+    so the two agree on every medium: LIKE ignores the case of ASCII letters,
+    the only ones in the keywords. A NULL medium is OTHER.
+    """
+    cases = " ".join(
+        "WHEN " + " OR ".join(f"m LIKE '%{k}%'" for k in keywords) + f" THEN '{family}'"
+        for family, keywords in MATERIAL_FAMILIES.items()
+    )
+    return f"(SELECT CASE {cases} ELSE '{OTHER}' END FROM (SELECT {medium} AS m))"
@@ -1,97 +1,419 @@
 '''
 met-build.py
 Build the Met Museum of Art DB in SQLite
+
+Every build is written into a new snapshot file under data/snapshots/. Once
+the snapshot is loaded, analyzed and has passed its integrity checks it is
+published as the current met.db (see database.py); a failed build leaves the
+published db untouched.
+
+Department files are parsed in a pool of worker processes. Each worker reads
+its CSV in chunks, projects the columns for each table and streams the row
+batches through a bounded queue to the main process, which is the only
+connection writing to the db.
 '''
 
 import os
+import queue
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 import pandas as pd
 import numpy as np
 import sqlite3
 
-# Create tables in sqlite
-conn = sqlite3.connect("data/met.db")
-cursor = conn.cursor()
-
-### Loading the Departments table into the db ###
-departments = pd.read_csv("data/cleaned_data/departments.csv")
-departments\
-    .drop_duplicates()\
-    .to_sql("Department", conn, index=False, if_exists="replace")
-
-### Loading the Objects, Art, and Artists table ###
-
-path_extension = "data/cleaned_data"
-file_ids = [d for d in os.listdir(path_extension) if os.path.isfile(os.path.join(path_extension, d))]
-file_ids.remove("departments.csv")
-object_ids = [f for f in file_ids if f.startswith("objects_")]
-artist_ids = [f for f in file_ids if f.startswith("artists_")]
-
-for id in object_ids:
-    # --- Objects Table -- #
-    objects = pd.read_csv(f"data/cleaned_data/{id}",  dtype={"accessionYear": str})
-    objects[["department_id", "object_id"]]\
-        .drop_duplicates()\
-        .to_sql("Objects", conn, index=False, if_exists="append")
-
-    # --- Art Table --- #
-    objects[["object_id",
-            "isHighlight",
-            "accessionYear",
-            "isPublicDomain",
-            "primaryImage",
-            "objectName",
-            "title",
-            "culture",
-            "period",
-            "dynasty",
-            "reign",
-            "portfolio",
-            "artistWikidata_URL",
-            "artistAlphaSort",
-            "objectBeginDate",
-            "objectEndDate",
-            "medium",
-            "dimensions",
-            "creditLine",
-            "city",
-            "state",
-            "county",
-            "country",
-            "region",
-            "subregion",
-            "excavation",
-            "classification"
-            ]]\
-                .drop_duplicates()\
-                .to_sql("Art", conn, index=False, if_exists="append")
-
-for id in artist_ids:
-    # --- Artists Table --- #
-
-    # reading in the artists, and ignoring all the ones with unknown, "", or null alphaSorts.
-    artists = pd.read_csv(f"data/cleaned_data/{id}")
+import artifacts
+import database
+
+DB_PATH = "data/met.db"
+CLEANED_DIR = "data/cleaned_data"
+
+# rows per batch sent to the writer, and how many batches may be waiting in
+# the queue before the parsers block
+BATCH_ROWS = 5000
+QUEUE_BATCHES = 16
+
+# how long the writer waits on an empty queue before checking on the workers
+POLL_SECONDS = 1.0
+
+ART_COLUMNS = [
+    "object_id",
+    "isHighlight",
+    "accessionYear",
+    "isPublicDomain",
+    "primaryImage",
+    "objectName",
+    "title",
+    "culture",
+    "period",
+    "dynasty",
+    "reign",
+    "portfolio",
+    "artistWikidata_URL",
+    "artistAlphaSort",
+    "objectBeginDate",
+    "objectEndDate",
+    "medium",
+    "dimensions",
+    "creditLine",
+    "city",
+    "state",
+    "county",
+    "country",
+    "region",
+    "subregion",
+    "excavation",
+    "classification"
+]
+
+# Art columns stored as INTEGER years
+YEAR_COLUMNS = ["accessionYear", "objectBeginDate", "objectEndDate"]
+
+ARTIST_COLUMNS = [
+    "artistWikidata_URL",
+    "artist_name",
+    "artistAlphaSort",
+    "artistNationality",
+    "artistBeginDate",
+    "artistEndDate"
+]
+
+
+# ================================================================
+# Parsing (worker processes)
+# ================================================================
+def to_rows(df):
+    '''Convert a DataFrame into a list of tuples, with NaN/NA as None.'''
+    df = df.astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def to_year(values):
+    '''
+        Leading integer of each value, as CAST(... AS INTEGER) would read it
+        ("1999-2000" -> 1999), or NA when the value does not start with one.
+    '''
+    years = values.astype(str).str.extract(r"^\s*(-?\d+)", expand=False)
+    return pd.to_numeric(years).astype("Int64")
+
+
+def parse_objects(path):
+    '''
+        Yield (table, rows) batches for the Objects and Art tables. Rows are
+        deduplicated on object_id across the whole file; the first one wins.
+    '''
+    seen = set()
+    for chunk in pd.read_csv(path, dtype={"accessionYear": str}, chunksize=BATCH_ROWS):
+        chunk = chunk[~chunk["object_id"].isin(seen) & ~chunk["object_id"].duplicated()].copy()
+        seen.update(chunk["object_id"])
+
+        for column in YEAR_COLUMNS:
+            chunk[column] = to_year(chunk[column])
+        yield "Objects", to_rows(chunk[["department_id", "object_id"]])
+        yield "Art", to_rows(chunk[ART_COLUMNS])
+
+
+def parse_artists(path):
+    '''Return the rows of one artists CSV for the Artists table.'''
+    artists = pd.read_csv(path)
+
+    # ignoring all the artists with unknown, "", or null alphaSorts.
     artists = artists[
-    artists["artistAlphaSort"].notna() &
-    (artists["artistAlphaSort"] != "") &
-    (artists["artistAlphaSort"].str.lower() != "unknown")
-    ]
+        artists["artistAlphaSort"].notna() &
+        (artists["artistAlphaSort"] != "") &
+        (artists["artistAlphaSort"].str.lower() != "unknown")
+    ].copy()
 
     # loading wikidata url as null
-    artists["artistWikidata_URL"] = pd.NA
+    artists["artistWikidata_URL"] = None
+
+    return to_rows(artists[ARTIST_COLUMNS])
+
+
+_batches = None
+_abort = None
+
+
+def _init_worker(batches, abort):
+    '''Pool initializer, hands every worker the shared batch queue and abort flag.'''
+    global _batches, _abort
+    _batches = batches
+    _abort = abort
+
+
+def _parse_file(path):
+    '''
+        Worker entry point. Streams the batches of one objects CSV to the writer,
+        followed by a (None, error) marker once the file is finished. Stops early
+        when the writer has given up on the build.
+    '''
+    try:
+        for table, rows in parse_objects(path):
+            if _abort.is_set():
+                return
+            _batches.put((table, rows))
+    except Exception as e:
+        _batches.put((None, f"{path}: {e!r}"))
+        return
+    _batches.put((None, None))
+
+
+# ================================================================
+# Writing (main process only)
+# ================================================================
+# Objects and Art rows are upserted, so an object_id loaded twice keeps its
+# last row. The build loads without the schema's triggers (see finalize), but
+# the upserts keep them correct for loads into a db that has them.
+#
+# Art rows are staged as text and encoded into ArtData and its lookup tables
+# by schema.upsert_art() once every file is in, see load().
+def insert_objects(conn, rows):
+    conn.executemany(
+        '''
+        INSERT INTO Objects (department_id, object_id) VALUES (?, ?)
+        ON CONFLICT (object_id) DO UPDATE SET department_id = excluded.department_id
+        ''',
+        rows,
+    )
+
+
+def insert_art(conn, rows):
+    conn.executemany(
+        f'''
+        INSERT INTO Art_stage ({", ".join(ART_COLUMNS)})
+        VALUES ({", ".join("?" * len(ART_COLUMNS))})
+        ''',
+        rows,
+    )
+
+
+def insert_artists(conn, rows):
+    '''
+        Stage the batch and insert everything not already in Artists with a single
+        INSERT OR IGNORE, so the existence check against artistAlphaSort (the primary
+        key) happens inside SQLite. Rows are moved in file order so the first
+        occurrence of an artistAlphaSort wins.
+    '''
+    conn.executemany("INSERT INTO Artists_stage VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.execute(
+        f'''
+        INSERT OR IGNORE INTO Artists ({", ".join(ARTIST_COLUMNS)})
+        SELECT {", ".join(ARTIST_COLUMNS)}
+        FROM Artists_stage
+        ORDER BY rowid
+        '''
+    )
+    conn.execute("DELETE FROM Artists_stage")
+
+
+WRITERS = {
+    "Objects": insert_objects,
+    "Art": insert_art,
+    "Artists": insert_artists,
+}
+
+
+def write_batches(conn, batches, futures):
+    '''
+        Consume batches from the queue until every objects file has reported in.
+        While the queue is empty the workers are checked, so a task that failed
+        outside _parse_file (a dead worker, a pickling error) fails the build
+        instead of leaving the writer waiting.
+    '''
+    remaining = len(futures)
+    while remaining:
+        try:
+            table, rows = batches.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    raise RuntimeError("Parser worker failed") from future.exception()
+            continue
+
+        if table is None:
+            remaining -= 1
+            if rows is not None:
+                raise RuntimeError(f"Failed to parse {rows}")
+            continue
+        WRITERS[table](conn, rows)
+
+
+def stop_workers(futures, batches, abort):
+    '''Cancel outstanding files and drain the queue until every worker has stopped.'''
+    abort.set()
+    for future in futures:
+        future.cancel()
+    while not all(future.done() for future in futures):
+        try:
+            batches.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+
+
+def load_departments(conn, path):
+    '''
+        Load the Departments table into the db. The rows are replaced in the
+        existing table so the schema's indexes are kept.
+    '''
+    departments = pd.read_csv(path)
+    conn.execute("DELETE FROM Department")
+    conn.executemany(
+        "INSERT INTO Department (department_id, displayName) VALUES (?, ?)",
+        to_rows(departments[["department_id", "displayName"]].drop_duplicates()),
+    )
+
+
+def load(conn, schema, cleaned_dir=CLEANED_DIR, processes=None):
+    '''
+        Load every cleaned department file into the db on conn. Parsing runs in a
+        pool of `processes` workers (default: one per CPU), writing stays on this
+        connection.
+    '''
+
+    ### Loading the Departments table into the db ###
+    load_departments(conn, os.path.join(cleaned_dir, "departments.csv"))
+
+    ### Loading the Objects, Art, and Artists table ###
+    file_ids = sorted(d for d in os.listdir(cleaned_dir) if os.path.isfile(os.path.join(cleaned_dir, d)))
+    object_paths = [os.path.join(cleaned_dir, f) for f in file_ids if f.startswith("objects_")]
+    artist_paths = [os.path.join(cleaned_dir, f) for f in file_ids if f.startswith("artists_")]
+
+    # Staging tables for the Art and artist loads. Art_stage has the (decoded)
+    # columns of the Art view.
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS Art_stage AS SELECT * FROM Art WHERE false")
+    conn.execute(
+        '''
+        CREATE TEMP TABLE IF NOT EXISTS Artists_stage (
+            artistWikidata_URL TEXT,
+            artist_name TEXT,
+            artistAlphaSort TEXT,
+            artistNationality TEXT,
+            artistBeginDate TEXT,
+            artistEndDate TEXT
+        )
+        '''
+    )
+
+    batches = multiprocessing.Queue(maxsize=QUEUE_BATCHES)
+    abort = multiprocessing.Event()
+    pool = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(batches, abort))
+    futures = []
+    try:
+        futures = [pool.submit(_parse_file, path) for path in object_paths]
+        # artist files are parsed alongside, but written in sorted file order
+        # after the objects, so the first artistAlphaSort in that order wins
+        artists = pool.map(parse_artists, artist_paths)
+
+        write_batches(conn, batches, futures)
+        for rows in artists:
+            insert_artists(conn, rows)
+    except BaseException:
+        stop_workers(futures, batches, abort)
+        raise
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    # encode the staged Art rows into ArtData in one pass
+    schema.upsert_art(conn, "Art_stage")
+    conn.execute("DROP TABLE Art_stage")
+
+
+# ================================================================
+# Snapshot checks and publishing
+# ================================================================
+def load_schema():
+    '''Import met-schema.py, which is not a valid module name.'''
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "met-schema.py")
+    spec = importlib.util.spec_from_file_location("met_schema", path)
+    schema = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(schema)
+    return schema
+
+
+def check_snapshot(conn, schema):
+    '''Raise RuntimeError if a freshly built snapshot is not fit to publish.'''
+    result = conn.execute("PRAGMA integrity_check").fetchall()
+    if result != [("ok",)]:
+        raise RuntimeError(f"integrity_check failed: {result[:5]}")
+
+    # raises sqlite3.DatabaseError if the index does not match Art
+    conn.execute("INSERT INTO ArtSearch (ArtSearch) VALUES ('integrity-check')")
+
+    num_objects = conn.execute(
+        "SELECT COUNT(*) FROM Art a JOIN Objects o ON a.object_id = o.object_id"
+    ).fetchone()[0]
+    if num_objects == 0:
+        raise RuntimeError("No objects were loaded")
+
+    totals = conn.execute(
+        "SELECT field, SUM(num_objects) FROM Rollup WHERE department_id = ? GROUP BY field",
+        (schema.ALL_DEPARTMENTS,),
+    ).fetchall()
+    wrong = [field for field, total in totals if total != num_objects]
+    if len(totals) != len(schema.FIELDS) or wrong:
+        raise RuntimeError(f"Rollup counts do not add up to {num_objects} objects: {wrong}")
+
+
+def finalize(conn, schema, snapshot):
+    '''
+        Optimize, analyze and check the loaded snapshot, render the app's static
+        charts into it, then make it durable.
+    '''
+
+    # classify every distinct medium once into its material family
+    schema.refresh_materials(conn)
+
+    # the load ran without the Rollup and ArtSearch triggers; fill both in one
+    # pass each and install the triggers for later incremental upserts
+    schema.refresh_rollups(conn)
+    schema.refresh_search(conn)
+    schema.create_triggers(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    check_snapshot(conn, schema)
+    conn.commit()
+
+    # the charts are read back from the committed snapshot through the app's
+    # own code, then stored so no request has to plot the whole collection
+    artifacts.render_artifacts(conn, snapshot)
+    conn.commit()
+    database.close_all()
+
+    # the load ran without fsyncs; sync everything into the db file now
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def build(db_path=DB_PATH, cleaned_dir=CLEANED_DIR, processes=None):
+    '''
+        Build a new snapshot of db_path from the cleaned data and publish it.
+        Returns the path of the published snapshot.
+    '''
+    schema = load_schema()
+    snapshot = database.snapshot_path(db_path, datetime.now().strftime("%Y%m%dT%H%M%S%f"))
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+
+    conn = sqlite3.connect(snapshot)
+    try:
+        # readers open published snapshots in WAL mode. Nothing reads the
+        # snapshot before it is published, so the load can skip fsyncs.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
 
-    existing_keys = pd.read_sql("SELECT artistAlphaSort FROM Artists", conn)
-    existing_keys_set = set(existing_keys["artistAlphaSort"])
+        schema.create_schema(conn, triggers=False)
+        load(conn, schema, cleaned_dir, processes)
+        finalize(conn, schema, snapshot)
+    except BaseException:
+        conn.close()
+        database.remove(snapshot)
+        raise
+    conn.close()
 
-    # Keep only rows not already in the table
-    artists = artists[~artists["artistAlphaSort"].isin(existing_keys_set)]
-    
-    # removes all duplicates in the leftover rows, on artistAlphaSort
-    artists_to_insert = artists[
-        ["artistWikidata_URL", "artist_name", "artistAlphaSort", "artistNationality", "artistBeginDate", "artistEndDate"]
-    ].drop_duplicates(subset=["artistAlphaSort"])
+    database.publish(db_path, snapshot)
+    return snapshot
 
-    # Insert into SQL
-    if not artists_to_insert.empty:
-        artists_to_insert.to_sql("Artists", conn, if_exists="append", index=False)
 
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    build()
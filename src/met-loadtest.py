@@ -0,0 +1,358 @@
+'''
+met-loadtest.py
+Load test the Flask app with concurrent scripted users.
+
+Each simulated user runs journeys through the app the way a visitor does:
+
+    department  open the Explorer, switch between departments (often "ALL")
+                and load the first page of each one's detail table
+    field       switch the breakdown field and the collapse box of one
+                department, through the JSON API the page uses
+    highlights  page through a department's highlights
+    facets      drill down through the faceted counts: a department, then
+                a creation year range, then highlights only
+    eda         open the EDA page for a few departments, the box plot and
+                the accession histogram at different bin widths
+
+The load runs in stages of increasing concurrency, and every stage reports
+the p50/p95/p99 latency, throughput and errors of each route, and the peak
+resident memory of the server while the route's requests were running:
+
+    python src/met-loadtest.py --db data/met.db --users 1,10,50 --duration 30
+
+By default the app is started in a server process of its own, with image
+prefetching turned off so the load never reaches the museum's image host.
+--url runs against an app that is already up instead (with --pid, its
+memory is reported too).
+'''
+
+import argparse
+import bisect
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+import numpy as np
+import requests
+
+from department_vis import BIN_WIDTHS
+from fields import FIELDS
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# seconds a request may take before it counts as an error
+TIMEOUT = 30
+
+# seconds between samples of the server's memory
+SAMPLE_SECONDS = 0.02
+
+# share of department choices that are "ALL", the heaviest selection
+ALL_SHARE = 0.3
+
+# highlights a user pages through
+HIGHLIGHT_PAGES = 5
+
+# The server process: serves app.app on the given port with the given db,
+# without request logging and, unless asked, without image prefetching
+SERVER = '''
+import logging
+import sys
+
+import app
+from werkzeug.serving import run_simple
+
+db_path, port, prefetch = sys.argv[1], int(sys.argv[2]), sys.argv[3] == "1"
+app.DB_PATH = db_path
+if not prefetch:
+    app.prefetch = lambda *args, **kwargs: []
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+app.warm_facets(db_path)
+run_simple("127.0.0.1", port, app.app, threaded=True)
+'''
+
+
+# ================================================================
+# Journeys
+# ================================================================
+# A journey yields (route, method, path, form data) steps. route labels the
+# step in the report.
+def pick_department(rng, departments):
+    if rng.random() < ALL_SHARE:
+        return "ALL"
+    return rng.choice(departments)
+
+
+def department_journey(rng, departments):
+    yield "GET /", "GET", "/", None
+    for _ in range(3):
+        dept = pick_department(rng, departments)
+        yield "POST /", "POST", "/", {"department": dept, "field": rng.choice(FIELDS)}
+        yield "/api/details", "GET", "/api/details?" + urlencode({"dept": dept, "start": 0, "length": 25}), None
+
+
+def field_journey(rng, departments):
+    dept = pick_department(rng, departments)
+    yield "GET /", "GET", "/", None
+    for field in rng.sample(FIELDS, len(FIELDS)):
+        collapse = int(rng.random() < 0.5)
+        query = urlencode({"dept": dept, "field": field, "collapse": collapse})
+        yield "/api/breakdown", "GET", "/api/breakdown?" + query, None
+    yield "/api/details", "GET", "/api/details?" + urlencode({"dept": dept, "start": 25, "length": 25}), None
+
+
+def highlights_journey(rng, departments):
+    dept = rng.choice(departments)
+    for i in range(HIGHLIGHT_PAGES):
+        yield "/highlights_viewer", "GET", "/highlights_viewer?" + urlencode({"dept": dept, "i": i}), None
+
+
+def facets_journey(rng, departments):
+    start = rng.randrange(-2000, 1900, 100)
+    steps = [
+        {},
+        {"department": rng.choice(departments)},
+        {"year_from": start, "year_to": start + rng.choice([100, 500, 1000])},
+        {"isHighlight": "Yes"},
+    ]
+    selection = {}
+    for step in steps:
+        selection.update(step)
+        yield "/api/facets", "GET", "/api/facets?" + urlencode(selection), None
+
+
+def eda_journey(rng, departments):
+    yield "/eda", "GET", "/eda", None
+    yield "/eda", "GET", "/eda?" + urlencode({"dept": rng.choice(departments)}), None
+    yield "/box", "GET", "/box", None
+    yield "/acq", "GET", "/acq", None
+    yield "/acq", "GET", f"/acq?width={rng.choice(BIN_WIDTHS)}", None
+
+
+JOURNEYS = {
+    "department": department_journey,
+    "field": field_journey,
+    "highlights": highlights_journey,
+    "facets": facets_journey,
+    "eda": eda_journey,
+}
+
+
+def list_departments(base_url):
+    '''The departments offered by the Explorer page, without "ALL".'''
+    html = requests.get(base_url + "/", timeout=TIMEOUT).text
+    select = re.search(r'<select name="department">(.*?)</select>', html, re.S).group(1)
+    return [d for d in re.findall(r'<option value="([^"]*)"', select) if d != "ALL"]
+
+
+# ================================================================
+# Server and memory
+# ================================================================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, prefetch=False):
+    '''Start the app on a free port. Returns (process, base URL) once it answers.'''
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER, os.path.abspath(db_path), str(port), "1" if prefetch else "0"],
+        cwd=SRC_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with status {process.returncode}")
+        try:
+            requests.get(base_url + "/", timeout=TIMEOUT)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The app did not start within 60 seconds")
+
+
+def rss_bytes(pid):
+    '''Resident memory of a process (Linux), or None if it cannot be read.'''
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    '''Samples the resident memory of a process in the background.'''
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.times = []
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = rss_bytes(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+                self.times.append(time.monotonic())
+            self.stopped.wait(SAMPLE_SECONDS)
+
+    def peak(self, start, end):
+        '''
+            Largest sample taken between start and end (time.monotonic()), or
+            the last one before end for a request shorter than the interval.
+        '''
+        first = bisect.bisect_left(self.times, start)
+        last = bisect.bisect_right(self.times, end)
+        if first < last:
+            return max(self.samples[first:last])
+        return self.samples[last - 1] if last else None
+
+    def stop(self):
+        self.stopped.set()
+
+
+# ================================================================
+# Load
+# ================================================================
+def run_user(base_url, departments, journeys, deadline, think, seed, results):
+    '''One user: run random journeys until the deadline, appending (route, start, end, ok) to results.'''
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        journey = JOURNEYS[rng.choice(journeys)]
+        for route, method, path, data in journey(rng, departments):
+            if time.monotonic() >= deadline:
+                break
+            start = time.monotonic()
+            try:
+                response = session.request(method, base_url + path, data=data, timeout=TIMEOUT)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            results.append((route, start, time.monotonic(), ok))
+            if think:
+                time.sleep(rng.uniform(0, 2 * think))
+
+
+def run_stage(base_url, departments, users, duration, journeys, think=0.0, seed=0):
+    '''Run `users` concurrent users for `duration` seconds. Returns their results.'''
+    results = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=run_user, args=(base_url, departments, journeys, deadline, think, seed + i, results))
+        for i in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration, sampler=None):
+    '''
+        {route: requests, errors, p50/p95/p99/max latency in ms, requests per
+        second and peak server memory in MiB}, plus an "all" row.
+    '''
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result[0]].append(result)
+        by_route["all"].append(result)
+
+    summary = {}
+    for route, rows in sorted(by_route.items(), key=lambda item: (item[0] == "all", item[0])):
+        latencies = np.array([(end - start) * 1000 for _, start, end, _ in rows])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        stats = {
+            "requests": len(rows),
+            "errors": sum(not ok for *_, ok in rows),
+            "p50_ms": round(p50, 1),
+            "p95_ms": round(p95, 1),
+            "p99_ms": round(p99, 1),
+            "max_ms": round(latencies.max(), 1),
+            "rps": round(len(rows) / duration, 1),
+        }
+        if sampler is not None:
+            peaks = [sampler.peak(start, end) for _, start, end, _ in rows]
+            peaks = [p for p in peaks if p is not None]
+            stats["peak_rss_mib"] = round(max(peaks) / 2**20, 1) if peaks else None
+        summary[route] = stats
+    return summary
+
+
+def print_report(users, summary):
+    columns = list(next(iter(summary.values())))
+    print(f"\n{users} concurrent users")
+    print(f"{'route':<20}" + "".join(f"{c:>14}" for c in columns))
+    for route, stats in summary.items():
+        print(f"{route:<20}" + "".join(f"{'-' if stats[c] is None else stats[c]:>14}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Met Flask app.")
+    parser.add_argument("--db", default=os.path.join(SRC_DIR, "..", "data", "met.db"), help="db the started app serves")
+    parser.add_argument("--url", help="test an app already running at this URL instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of the --url app, to report its memory")
+    parser.add_argument("--users", default="1,10,50", help="comma separated concurrent users of each stage")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per stage")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a user waits between requests")
+    parser.add_argument("--journeys", default=",".join(JOURNEYS), help="comma separated journeys to run")
+    parser.add_argument("--prefetch-images", action="store_true", help="let the started app prefetch images")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    journeys = args.journeys.split(",")
+    unknown = set(journeys) - set(JOURNEYS)
+    if unknown:
+        parser.error(f"unknown journeys: {', '.join(sorted(unknown))}")
+
+    process = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        process, base_url = start_server(args.db, args.prefetch_images)
+        pid = process.pid
+
+    sampler = None
+    if pid is not None and rss_bytes(pid) is not None:
+        sampler = MemorySampler(pid)
+        sampler.start()
+
+    report = {}
+    try:
+        departments = list_departments(base_url)
+        for users in [int(u) for u in args.users.split(",")]:
+            results = run_stage(base_url, departments, users, args.duration, journeys, args.think)
+            report[users] = summarize(results, args.duration, sampler)
+            print_report(users, report[users])
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,83 +3,801 @@ met-schema.py
 Set up the Met Museum of Art Schema in SQLite
 '''
 
+import sys
 import pandas as pd
 import sqlite3
+from datetime import datetime
 
-# Create tables in sqlite
-conn = sqlite3.connect("met_data/met.db")
-cursor = conn.cursor()
+import database
+from fields import FIELDS, ALL_DEPARTMENTS
+from materials import OTHER, classify_materials, family_sql
 
-# Department table - contains department name and id
-conn.execute(
+DB_PATH = "data/met.db"
+
+# stored in PRAGMA user_version, see migrate()
+SCHEMA_VERSION = 7
+
+# Art columns holding a year. Values are stored as the leading integer of the
+# raw text (what CAST(... AS INTEGER) would read), NULL when there is none.
+YEAR_COLUMNS = ["accessionYear", "objectBeginDate", "objectEndDate"]
+
+# Columns of the Art view, in the order of the original Art table
+ART_COLUMNS = [
+    "object_id",
+    "isHighlight",
+    "accessionYear",
+    "isPublicDomain",
+    "primaryImage",
+    "objectName",
+    "title",
+    "culture",
+    "period",
+    "dynasty",
+    "reign",
+    "portfolio",
+    "artistWikidata_URL",
+    "artistAlphaSort",
+    "objectBeginDate",
+    "objectEndDate",
+    "medium",
+    "dimensions",
+    "creditLine",
+    "city",
+    "state",
+    "county",
+    "country",
+    "region",
+    "subregion",
+    "excavation",
+    "classification"
+]
+
+# Art columns stored in ArtData as an integer key into a lookup table holding
+# each distinct value once, column -> lookup table
+LOOKUP_TABLES = {
+    "objectName": "ObjectName",
+    "culture": "Culture",
+    "period": "Period",
+    "dynasty": "Dynasty",
+    "reign": "Reign",
+    "medium": "Medium",
+    "country": "Country",
+    "region": "Region",
+    "subregion": "Subregion",
+    "classification": "Classification",
+}
+
+
+def stored_column(column):
+    '''Name of the ArtData column holding an Art view column.'''
+    return f"{column}_id" if column in LOOKUP_TABLES else column
+
+
+def art_value(row, column):
+    '''SQL for the Art value of `column` in the ArtData row `row` (an alias, NEW or OLD).'''
+    if column in LOOKUP_TABLES:
+        return f"(SELECT {column} FROM {LOOKUP_TABLES[column]} WHERE {column}_id = {row}.{column}_id)"
+    return f"{row}.{column}"
+
+
+def create_tables(conn):
+    '''Create the Department, Objects, Art (with its lookup tables) and Artists tables.'''
+
+    # Department table - contains department name and id
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS Department (
+            department_id INTEGER PRIMARY KEY,
+            displayName TEXT NOT NULL
+        )
+        '''
+    )
+
+    # Objects table - linking table between Art and Departments
+    # all objects must have a department
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS Objects (
+            department_id INTEGER NOT NULL,
+            object_id INTEGER PRIMARY KEY
+        )
+        '''
+    )
+
+    # Lookup tables - one row per distinct value of a dictionary encoded column
+    for column, table in LOOKUP_TABLES.items():
+        conn.execute(
+            f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {column}_id INTEGER PRIMARY KEY,
+                {column} TEXT NOT NULL UNIQUE
+            )
+            '''
+        )
+
+    # ArtData table - contains all information about the piece in question,
+    # with the repeated text columns stored as keys into their lookup tables.
+    # Links to the Artists table via artistAlphaSort, but not a required link
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS ArtData (
+            object_id INTEGER PRIMARY KEY,
+            isHighlight INTEGER,
+            accessionYear INTEGER,
+            isPublicDomain INTEGER,
+            primaryImage text,
+            objectName_id INTEGER REFERENCES ObjectName (objectName_id),
+            title TEXT NOT NULL,
+            culture_id INTEGER REFERENCES Culture (culture_id),
+            period_id INTEGER REFERENCES Period (period_id),
+            dynasty_id INTEGER REFERENCES Dynasty (dynasty_id),
+            reign_id INTEGER REFERENCES Reign (reign_id),
+            portfolio TEXT,
+            artistWikidata_URL TEXT,
+            artistAlphaSort TEXT,
+            objectBeginDate INTEGER,
+            objectEndDate INTEGER,
+            medium_id INTEGER REFERENCES Medium (medium_id),
+            dimensions TEXT,
+            creditLine TEXT,
+            city TEXT,
+            state TEXT,
+            county TEXT,
+            country_id INTEGER REFERENCES Country (country_id),
+            region_id INTEGER REFERENCES Region (region_id),
+            subregion_id INTEGER REFERENCES Subregion (subregion_id),
+            excavation TEXT,
+            classification_id INTEGER REFERENCES Classification (classification_id),
+            material_family TEXT
+        )
+        '''
+    )
+    create_art_view(conn)
+
+    # Artists table - contains all information about the artist
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS Artists (
+            artistWikidata_URL TEXT,
+            artist_name TEXT,
+            artistAlphaSort TEXT PRIMARY KEY,
+            artistNationality TEXT,
+            artistBeginDate TEXT,
+            artistEndDate TEXT
+        )
+        '''
+    )
+
+
+def create_art_view(conn):
+    '''
+        Art is a view decoding ArtData back into the columns of the original Art
+        table, so queries written against it keep working. Plain INSERT, UPDATE
+        and DELETE statements on Art are passed on to ArtData by INSTEAD OF
+        triggers, adding new values to the lookup tables as needed.
+
+        The view also exposes ArtData.material_family, which is derived from
+        the medium: by refresh_materials() at build time, and by the triggers
+        for the rows they write.
     '''
-    CREATE TABLE IF NOT EXISTS Department (
-        department_id INTEGER PRIMARY KEY,
-        display_name TEXT NOT NULL
+    # each value is decoded by a scalar subquery on the lookup's primary key,
+    # which SQLite only evaluates for the columns a query actually reads
+    columns = [f"{art_value('a', c)} AS {c}" for c in ART_COLUMNS] + ["a.material_family"]
+    conn.execute(
+        f'''
+        CREATE VIEW IF NOT EXISTS Art AS
+        SELECT {", ".join(columns)}
+        FROM ArtData a
+        '''
     )
-'''
-)
-
-# Objects table - linking table between Art and Departments
-# all objects must have a department
-conn.execute(
-    '''
-    CREATE TABLE IF NOT EXISTS Objects (
-        department_id INTEGER NOT NULL,
-        object_id INTEGER PRIMARY KEY
-    )
-    '''
-)
-
-
-# Art table - contains all information about the piece in question
-# Links to the Artists table via artist_id, but not a required link
-conn.execute(
-    '''
-    CREATE TABLE IF NOT EXISTS Art (
-        object_id INTEGER PRIMARY KEY,
-        isHighlight INTEGER,
-        accessionYear TEXT,
-        isPublicDomain INTEGER,
-        primaryImage text,
-        objectName TEXT,
-        title TEXT NOT NULL,
-        culture TEXT,
-        period TEXT,
-        dynasty TEXT,
-        reign TEXT,
-        portfolio TEXT,
-        artistWikidata_URL TEXT,
-        artistAlphaSort TEXT,
-        objectBeginDate TEXT,
-        objectEndDate TEXT,
-        medium TEXT,
-        dimensions TEXT,
-        creditLine TEXT,
-        city TEXT,
-        state TEXT,
-        county TEXT,
-        country TEXT,
-        region TEXT,
-        subregion TEXT,
-        excavation TEXT,
-        classification TEXT
-    )
-    '''
-)
-
-# Artists table - contains all information about the artist
-conn.execute(
-    '''
-    CREATE TABLE IF NOT EXISTS Artists (
-        artistWikidata_URL TEXT,
-        artist_name TEXT,
-        artistAlphaSort TEXT PRIMARY KEY,
-        artistNationality TEXT,
-        artistBeginDate TEXT,
-        artistEndDate TEXT
-    )
-    '''
-)
-
-conn.close()
\ No newline at end of file
+    _create_triggers(conn, art_triggers())
+
+
+def art_triggers():
+    '''The INSTEAD OF triggers writing through the Art view, as {name: (event, body)}.'''
+    add_values = "".join(
+        f"INSERT OR IGNORE INTO {table} ({column}) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;"
+        for column, table in LOOKUP_TABLES.items()
+    )
+    stored = [stored_column(c) for c in ART_COLUMNS]
+    values = [
+        f"(SELECT {c}_id FROM {LOOKUP_TABLES[c]} WHERE {c} = NEW.{c})" if c in LOOKUP_TABLES else f"NEW.{c}"
+        for c in ART_COLUMNS
+    ]
+    stored.append("material_family")
+    values.append(family_sql("NEW.medium"))
+    return {
+        "art_insert": (
+            "INSTEAD OF INSERT ON Art",
+            add_values
+            + f"INSERT INTO ArtData ({', '.join(stored)}) VALUES ({', '.join(values)});",
+        ),
+        "art_update": (
+            "INSTEAD OF UPDATE ON Art",
+            add_values
+            + f"UPDATE ArtData SET {', '.join(f'{c} = {v}' for c, v in zip(stored, values))}"
+            + " WHERE object_id = OLD.object_id;",
+        ),
+        "art_delete": (
+            "INSTEAD OF DELETE ON Art",
+            "DELETE FROM ArtData WHERE object_id = OLD.object_id;",
+        ),
+    }
+
+
+def upsert_art(conn, source):
+    '''
+        Upsert every row of `source`, a table with the columns of the Art view,
+        into ArtData. New values are added to the lookup tables first, then the
+        rows are encoded and written in one statement, in rowid order, so the
+        last row of a repeated object_id wins.
+    '''
+    for column, table in LOOKUP_TABLES.items():
+        conn.execute(
+            f'''
+            INSERT OR IGNORE INTO {table} ({column})
+            SELECT {column} FROM {source} WHERE {column} IS NOT NULL
+            '''
+        )
+
+    stored = [stored_column(c) for c in ART_COLUMNS]
+    values = [
+        f"(SELECT {c}_id FROM {LOOKUP_TABLES[c]} WHERE {c} = s.{c})" if c in LOOKUP_TABLES else f"s.{c}"
+        for c in ART_COLUMNS
+    ]
+    conn.execute(
+        f'''
+        INSERT INTO ArtData ({", ".join(stored)})
+        SELECT {", ".join(values)}
+        FROM {source} s
+        WHERE true
+        ORDER BY s.rowid
+        ON CONFLICT (object_id) DO UPDATE SET
+            {", ".join(f"{c} = excluded.{c}" for c in stored[1:])}
+        '''
+    )
+
+
+def create_indexes(conn):
+    '''
+        Secondary indexes for the explorer and chart queries. Every department
+        filtered query resolves displayName -> department_id -> object_ids through
+        covering indexes and then reads ArtData by primary key. The per-field
+        indexes cover the "ALL" breakdowns, which can then be counted in index
+        order without touching the ArtData rows.
+    '''
+
+    # displayName lookups, covering the department_id used for the join
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_department_displayName
+        ON Department (displayName, department_id)
+        '''
+    )
+
+    # department_id -> object_id, covering the Objects side of every join
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_objects_department
+        ON Objects (department_id, object_id)
+        '''
+    )
+
+    # one index per explorer breakdown field (object_id is the rowid, so it is
+    # part of every index)
+    for field in FIELDS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_art_{field} ON ArtData ({stored_column(field)})")
+
+    # year range filters for the charts. The begin/end pairs cover the box plot
+    # and EDA queries, which read both years.
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_art_objectBeginDate
+        ON ArtData (objectBeginDate, objectEndDate)
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_art_objectEndDate
+        ON ArtData (objectEndDate, objectBeginDate)
+        '''
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_art_accessionYear ON ArtData (accessionYear)")
+
+    # material family breakdowns, for any department or the whole collection
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_art_material_family
+        ON ArtData (material_family)
+        '''
+    )
+
+    # Art -> Artists joins by artistAlphaSort (the Artists side is its primary key)
+    conn.execute(
+        '''
+        CREATE INDEX IF NOT EXISTS idx_art_artistAlphaSort
+        ON ArtData (artistAlphaSort)
+        '''
+    )
+
+
+# ================================================================
+# Rollups
+# ================================================================
+def _rollup_delta(sign, values, departments):
+    '''
+        Trigger statement adding sign * 1 to the Rollup row of every
+        (field, category) in `values` for every department in `departments`.
+    '''
+    return f'''
+        INSERT INTO Rollup (field, department_id, category, num_objects)
+        SELECT v.field, d.department_id, v.category, {sign}
+        FROM ({values}) v, ({departments}) d
+        WHERE true
+        ON CONFLICT (field, department_id, category)
+        DO UPDATE SET num_objects = num_objects + excluded.num_objects;
+    '''
+
+
+def _row_values(row):
+    '''(field, category) pairs of a NEW/OLD ArtData row in a trigger.'''
+    return " UNION ALL ".join(
+        f"SELECT '{field}' AS field, COALESCE({art_value(row, field)}, 'Unknown') AS category"
+        for field in FIELDS
+    )
+
+
+def _art_values(object_id):
+    '''(field, category) pairs of the Art row with the given object_id.'''
+    return " UNION ALL ".join(
+        f'''
+        SELECT '{field}' AS field, COALESCE({field}, 'Unknown') AS category
+        FROM Art WHERE object_id = {object_id}
+        '''
+        for field in FIELDS
+    )
+
+
+def _object_departments(object_id):
+    '''The department of an object and the "ALL" level, if the object is in Objects.'''
+    return f'''
+        SELECT department_id FROM Objects WHERE object_id = {object_id}
+        UNION ALL
+        SELECT {ALL_DEPARTMENTS} FROM Objects WHERE object_id = {object_id}
+    '''
+
+
+def _departments(department_id):
+    return f"SELECT {department_id} AS department_id UNION ALL SELECT {ALL_DEPARTMENTS}"
+
+
+def rollup_triggers():
+    '''The Rollup triggers on Art and Objects, as {name: (event, body)}.'''
+    return {
+        "rollup_art_insert": (
+            "AFTER INSERT ON ArtData",
+            _rollup_delta(1, _row_values("NEW"), _object_departments("NEW.object_id")),
+        ),
+        "rollup_art_delete": (
+            "AFTER DELETE ON ArtData",
+            _rollup_delta(-1, _row_values("OLD"), _object_departments("OLD.object_id")),
+        ),
+        "rollup_art_update": (
+            f"AFTER UPDATE OF object_id, {', '.join(stored_column(f) for f in FIELDS)} ON ArtData",
+            _rollup_delta(-1, _row_values("OLD"), _object_departments("OLD.object_id"))
+            + _rollup_delta(1, _row_values("NEW"), _object_departments("NEW.object_id")),
+        ),
+        "rollup_objects_insert": (
+            "AFTER INSERT ON Objects",
+            _rollup_delta(1, _art_values("NEW.object_id"), _departments("NEW.department_id")),
+        ),
+        "rollup_objects_delete": (
+            "AFTER DELETE ON Objects",
+            _rollup_delta(-1, _art_values("OLD.object_id"), _departments("OLD.department_id")),
+        ),
+        "rollup_objects_update": (
+            "AFTER UPDATE OF object_id, department_id ON Objects",
+            _rollup_delta(-1, _art_values("OLD.object_id"), _departments("OLD.department_id"))
+            + _rollup_delta(1, _art_values("NEW.object_id"), _departments("NEW.department_id")),
+        ),
+    }
+
+
+def _create_triggers(conn, triggers):
+    for name, (event, body) in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def create_rollups(conn, triggers=True):
+    '''
+        Rollup holds the number of objects per department per value of every
+        explorer FIELDS column, plus an "ALL" level under department_id 0, so a
+        breakdown is a key lookup. An object counts once it has both its Art and
+        its Objects row. Triggers on both tables keep the counts current as rows
+        are inserted, upserted or deleted.
+    '''
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS Rollup (
+            field TEXT NOT NULL,
+            department_id INTEGER NOT NULL,
+            category NOT NULL,
+            num_objects INTEGER NOT NULL,
+            PRIMARY KEY (field, department_id, category)
+        ) WITHOUT ROWID
+        '''
+    )
+    if triggers:
+        _create_triggers(conn, rollup_triggers())
+
+
+def refresh_rollups(conn):
+    '''
+        Recompute every Rollup row from ArtData and Objects. Objects are counted
+        per stored value (the lookup key for encoded columns), and only the
+        counts are decoded into their categories.
+    '''
+    conn.execute("DELETE FROM Rollup")
+    for field in FIELDS:
+        column = stored_column(field)
+        if field in LOOKUP_TABLES:
+            category = f"(SELECT {field} FROM {LOOKUP_TABLES[field]} WHERE {column} = counts.value)"
+        else:
+            category = "counts.value"
+
+        conn.execute(
+            f'''
+            INSERT INTO Rollup (field, department_id, category, num_objects)
+            WITH counts AS (
+                SELECT o.department_id, a.{column} AS value, COUNT(*) AS num_objects
+                FROM ArtData a
+                JOIN Objects o ON a.object_id = o.object_id
+                GROUP BY o.department_id, a.{column}
+            ),
+            categories AS (
+                SELECT department_id, COALESCE({category}, 'Unknown') AS category, num_objects
+                FROM counts
+            )
+            SELECT '{field}', department_id, category, SUM(num_objects)
+            FROM categories
+            GROUP BY department_id, category
+            UNION ALL
+            SELECT '{field}', {ALL_DEPARTMENTS}, category, SUM(num_objects)
+            FROM categories
+            GROUP BY category
+            '''
+        )
+
+
+# ================================================================
+# Material families
+# ================================================================
+def refresh_materials(conn):
+    '''
+        Set ArtData.material_family for every row. The classifier runs once per
+        distinct medium in the Medium lookup table, and the families are then
+        joined back onto ArtData by medium_id. Rows without a medium are "Other".
+    '''
+    mediums = pd.read_sql("SELECT medium_id, medium FROM Medium", conn)
+    mediums["material_family"] = classify_materials(mediums["medium"])
+
+    conn.execute(
+        '''
+        CREATE TEMP TABLE IF NOT EXISTS MediumFamily (
+            medium_id INTEGER PRIMARY KEY,
+            material_family TEXT NOT NULL
+        )
+        '''
+    )
+    conn.execute("DELETE FROM MediumFamily")
+    conn.executemany(
+        "INSERT INTO MediumFamily (medium_id, material_family) VALUES (?, ?)",
+        mediums[["medium_id", "material_family"]].itertuples(index=False, name=None),
+    )
+    conn.execute(
+        f'''
+        UPDATE ArtData
+        SET material_family = COALESCE(
+            (SELECT f.material_family FROM MediumFamily f WHERE f.medium_id = ArtData.medium_id),
+            '{OTHER}'
+        )
+        '''
+    )
+    conn.execute("DROP TABLE MediumFamily")
+
+
+# ================================================================
+# Chart artifacts
+# ================================================================
+def create_artifacts(conn):
+    '''
+        Artifacts holds the app's static charts, rendered once per snapshot by
+        met-build.py (see artifacts.py), so their routes serve a stored body
+        instead of querying and plotting the whole collection per request.
+    '''
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS Artifacts (
+            name TEXT PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            body BLOB NOT NULL
+        )
+        '''
+    )
+
+
+# ================================================================
+# Full-text search
+# ================================================================
+# Art columns indexed in ArtSearch, with their bm25 weight. artistAlphaSort is
+# indexed as "artist"; it holds the same name tokens as Artists.artist_name.
+SEARCH_COLUMNS = {
+    "title": 10.0,
+    "medium": 2.0,
+    "culture": 1.0,
+    "classification": 1.0,
+    "artistAlphaSort": 5.0,
+}
+
+
+def search_triggers():
+    '''The ArtSearch triggers on ArtData, as {name: (event, body)}.'''
+    columns = ", ".join(stored_column(c) for c in SEARCH_COLUMNS)
+    insert = f'''
+        INSERT INTO ArtSearch (rowid, title, medium, culture, classification, artist)
+        VALUES (NEW.object_id, {", ".join(art_value("NEW", c) for c in SEARCH_COLUMNS)});
+    '''
+    delete = "DELETE FROM ArtSearch WHERE rowid = OLD.object_id;"
+
+    return {
+        "search_art_insert": ("AFTER INSERT ON ArtData", insert),
+        "search_art_delete": ("AFTER DELETE ON ArtData", delete),
+        "search_art_update": (f"AFTER UPDATE OF object_id, {columns} ON ArtData", delete + insert),
+    }
+
+
+def create_search(conn, triggers=True):
+    '''
+        ArtSearch is an FTS5 index over the searchable Art columns, keyed by
+        object_id (its rowid). Results are ranked by bm25 with the weights in
+        SEARCH_COLUMNS, and triggers on Art keep it in step with the table.
+    '''
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ArtSearch'"
+    ).fetchone()
+    if not exists:
+        conn.execute(
+            '''
+            CREATE VIRTUAL TABLE ArtSearch USING fts5(
+                title, medium, culture, classification, artist,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            '''
+        )
+        weights = ", ".join(str(w) for w in SEARCH_COLUMNS.values())
+        conn.execute(
+            "INSERT INTO ArtSearch (ArtSearch, rank) VALUES ('rank', ?)",
+            (f"bm25({weights})",),
+        )
+
+    if triggers:
+        _create_triggers(conn, search_triggers())
+
+
+def refresh_search(conn):
+    '''Rebuild ArtSearch from Art and merge its b-trees for fast reads.'''
+    conn.execute("DELETE FROM ArtSearch")
+    conn.execute(
+        f'''
+        INSERT INTO ArtSearch (rowid, title, medium, culture, classification, artist)
+        SELECT object_id, {", ".join(SEARCH_COLUMNS)}
+        FROM Art
+        '''
+    )
+    optimize_search(conn)
+
+
+def optimize_search(conn):
+    '''Merge the ArtSearch segments, run after bulk loads.'''
+    conn.execute("INSERT INTO ArtSearch (ArtSearch) VALUES ('optimize')")
+
+
+def year_sql(column):
+    '''SQL expression converting a TEXT year column to its integer year or NULL.'''
+    return f'''
+        CASE WHEN trim({column}) GLOB '[0-9]*' OR trim({column}) GLOB '-[0-9]*'
+             THEN CAST({column} AS INTEGER)
+        END
+    '''
+
+
+# ================================================================
+# Migrations for existing met.db files
+# ================================================================
+def migrate_typed_years(conn):
+    '''
+        Version 1: accessionYear, objectBeginDate and objectEndDate become INTEGER.
+        SQLite cannot change a column type in place, so Art is rebuilt and the
+        rows copied across with their years converted.
+    '''
+    conn.execute("ALTER TABLE Art RENAME TO Art_v0")
+    create_tables(conn)
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(Art_v0)")]
+    values = [year_sql(c) if c in YEAR_COLUMNS else c for c in columns]
+    conn.execute(
+        f'''
+        INSERT INTO Art ({", ".join(columns)})
+        SELECT {", ".join(values)}
+        FROM Art_v0
+        '''
+    )
+    conn.execute("DROP TABLE Art_v0")
+
+
+def migrate_rollups(conn):
+    '''Version 2: add the Rollup table, filled by migrate().'''
+    create_rollups(conn, triggers=False)
+
+
+def migrate_search(conn):
+    '''Version 3: add the ArtSearch full-text index, filled by migrate().'''
+    create_search(conn, triggers=False)
+
+
+def migrate_lookups(conn):
+    '''
+        Version 4: the repeated text columns of Art move into lookup tables.
+        The rows are copied into ArtData and Art is replaced by the view over
+        it. A db migrated from version 0 was rebuilt in this layout already.
+    '''
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'Art'").fetchone()[0]
+    if kind == "view":
+        return
+
+    # the old triggers refer to the Art table; create_schema() recreates them on ArtData
+    drop_triggers(conn)
+    conn.execute("ALTER TABLE Art RENAME TO Art_v3")
+    create_tables(conn)
+    upsert_art(conn, "Art_v3")
+    conn.execute("DROP TABLE Art_v3")
+
+
+def migrate_materials(conn):
+    '''Version 5: add ArtData.material_family, filled by migrate().'''
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(ArtData)")]
+    if "material_family" in columns:
+        return
+
+    conn.execute("ALTER TABLE ArtData ADD COLUMN material_family TEXT")
+    # dropping the view drops its triggers as well; both are recreated with it
+    conn.execute("DROP VIEW Art")
+    create_art_view(conn)
+
+
+def migrate_artifacts(conn):
+    '''Version 6: add the Artifacts table. The app renders charts missing from it.'''
+    create_artifacts(conn)
+
+
+def migrate_art_triggers(conn):
+    '''Version 7: the Art view's triggers also set the material family of the rows they write.'''
+    for name in art_triggers():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    _create_triggers(conn, art_triggers())
+
+
+# version -> migration bringing a db at the previous version up to it
+MIGRATIONS = {
+    1: migrate_typed_years,
+    2: migrate_rollups,
+    3: migrate_search,
+    4: migrate_lookups,
+    5: migrate_materials,
+    6: migrate_artifacts,
+    7: migrate_art_triggers,
+}
+
+
+def migrate(conn):
+    '''
+        Apply every migration newer than the db's user_version. The derived
+        material families and the Rollup and ArtSearch tables are then refilled
+        once, from the base tables in their final layout.
+    '''
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    for target in sorted(MIGRATIONS):
+        if version < target:
+            MIGRATIONS[target](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            version = target
+
+    refresh_materials(conn)
+    refresh_rollups(conn)
+    refresh_search(conn)
+
+
+def create_triggers(conn):
+    '''Create the triggers keeping the derived tables in step with ArtData and Objects.'''
+    _create_triggers(conn, rollup_triggers())
+    _create_triggers(conn, search_triggers())
+
+
+def drop_triggers(conn):
+    for name in {**rollup_triggers(), **search_triggers()}:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def create_schema(conn, triggers=True):
+    '''
+        Create every table and index of the met.db schema. A db that already has
+        an Art table is migrated to SCHEMA_VERSION first. Everything runs in one
+        transaction, so a failed migration leaves the db untouched.
+
+        With triggers=False the maintenance triggers are left out, for a bulk
+        load into an empty db: refresh the derived tables once the load is done
+        and call create_triggers() before the db is used.
+    '''
+    conn.execute("BEGIN")
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = 'Art'"
+    ).fetchone()
+    if exists:
+        migrate(conn)
+
+    create_tables(conn)
+    create_indexes(conn)
+    create_rollups(conn, triggers)
+    create_search(conn, triggers)
+    create_artifacts(conn)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def migrate_published(db_path):
+    '''
+        Bring the db published under db_path up to SCHEMA_VERSION. Published
+        snapshots are never modified, so the current one is copied into a new
+        snapshot, migrated there and published in its place; readers and the
+        app's caches see the migration as a new build. A db without a pointer
+        file is created or migrated in place. Returns the path of the db.
+    '''
+    current = database.resolve(db_path)
+    if current == db_path:
+        conn = sqlite3.connect(db_path)
+        create_schema(conn)
+        conn.close()
+        return db_path
+
+    source = database.connect(db_path, current)
+    try:
+        if source.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return current
+        snapshot = database.snapshot_path(db_path, datetime.now().strftime("%Y%m%dT%H%M%S%f"))
+        conn = sqlite3.connect(snapshot)
+        source.backup(conn)
+    finally:
+        source.close()
+
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        create_schema(conn)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except BaseException:
+        conn.close()
+        database.remove(snapshot)
+        raise
+    conn.close()
+
+    database.publish(db_path, snapshot)
+    return snapshot
+
+
+if __name__ == "__main__":
+    # Create tables in sqlite, or migrate the ones already there. met-build.py
+    # creates the schema of every new snapshot itself; run this to migrate the
+    # current one (published as a new snapshot) or a standalone db in place.
+    migrate_published(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
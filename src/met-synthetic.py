@@ -0,0 +1,374 @@
+'''
+met-synthetic.py
+Generate a synthetic Met collection, at any scale, for benchmarks.
+
+The collection is written in the layout met-databuild.py fetches from the
+API (data/departments.jsonl and data/<id>_<Department>/objects.jsonl and
+artists.jsonl), so it goes through the same cleaning and build as the real
+data. Values follow the shape of the real collection: department sizes in
+the proportions of the Met's open access data, creation dates within each
+department's era, and skewed (Zipf) frequencies for cultures,
+classifications, mediums and artists. Every object is generated from the
+seed, so a run at a given scale and seed always produces the same files.
+
+    python src/met-synthetic.py 500k --root bench --build
+
+writes bench/data/ and builds bench/data/met.db from it. Scales take a k or
+M suffix (10k, 500k, 5M).
+'''
+
+import argparse
+import contextlib
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# rows generated and written at a time
+CHUNK_ROWS = 50_000
+
+# (department_id, displayName, share of the collection, creation years,
+#  cultures, classifications, mediums, share of objects with an artist).
+# Value lists are in order of frequency; "" is a missing value, as the API
+# returns it.
+DEPARTMENTS = [
+    (1, "American Decorative Arts", 0.037, (1650, 1950), ["American", ""],
+     ["Furniture", "Silver", "Glass", "Ceramics", "Textiles"],
+     ["Silver", "Mahogany, white pine", "Earthenware", "Blown glass", "Cotton, linen"], 0.4),
+    (3, "Ancient West Asian Art", 0.013, (-3500, -300), ["Sumerian", "Assyrian", "Babylonian", "Achaemenid"],
+     ["Stone-Sculpture", "Ceramics-Vessels", "Metalwork", "Ivory/Bone"],
+     ["Limestone", "Ceramic", "Bronze", "Ivory", "Gypsum alabaster"], 0.01),
+    (4, "Arms and Armor", 0.029, (1300, 1900), ["German", "Italian", "Japanese", "French", "Spanish"],
+     ["Swords", "Armor for Man", "Firearms", "Helmets", "Shafted Weapons"],
+     ["Steel, gold", "Steel, wood, brass", "Iron, silver", "Steel, leather, textile", "Wood, lacquer"], 0.2),
+    (5, "Arts of Africa, Oceania, and the Americas", 0.025, (500, 1950), ["Maya", "Yoruba", "Aztec", "Asmat", "Kongo"],
+     ["Ceramics-Sculpture", "Wood-Sculpture", "Metal-Ornaments", "Textiles-Woven", "Stone-Implements"],
+     ["Wood, pigment", "Ceramic, pigment", "Gold", "Stone", "Cotton, camelid hair"], 0.05),
+    (6, "Asian Art", 0.077, (-2000, 1950), ["China", "Japan", "Korea", "India", "Nepal"],
+     ["Paintings", "Ceramics", "Prints", "Textiles", "Sculpture"],
+     ["Hanging scroll; ink and color on silk", "Porcelain painted in underglaze blue", "Woodblock print; ink and color on paper", "Bronze", "Silk tapestry"], 0.3),
+    (7, "The Cloisters", 0.005, (1100, 1550), ["French", "Spanish", "German", "Netherlandish", "Italian", "English"],
+     ["Sculpture", "Glass-Stained", "Textiles", "Metalwork", "Manuscripts and Illuminations"],
+     ["Limestone", "Pot-metal glass, vitreous paint", "Wool warp, wool and silk wefts", "Silver gilt", "Tempera and gold on parchment", "Oak"], 0.1),
+    (8, "The Costume Institute", 0.065, (1700, 2020), ["American", "French", "British", "Italian", ""],
+     ["Dresses", "Shoes", "Hats", "Accessories", "Coats"],
+     ["Silk", "Wool", "Cotton", "Leather", "Silk, linen"], 0.6),
+    (9, "Drawings and Prints", 0.395, (1450, 2000), ["", "French", "Italian", "German", "Dutch", "British"],
+     ["Prints", "Drawings", "Ornament & Architecture", "Books", "Ephemera"],
+     ["Etching", "Engraving", "Lithograph", "Pen and brown ink, brush and wash", "Graphite on paper", "Woodcut"], 0.9),
+    (10, "Egyptian Art", 0.056, (-4000, 300), ["", "Egyptian"],
+     ["Scarabs", "Jewelry", "Sculpture", "Amulets", "Funerary Equipment"],
+     ["Faience", "Steatite, glazed", "Limestone, paint", "Wood, paint", "Gold", "Linen"], 0.01),
+    (11, "European Paintings", 0.005, (1250, 1900), ["", "Italian", "French", "Dutch"],
+     ["Paintings"],
+     ["Oil on canvas", "Oil on wood", "Tempera on wood, gold ground", "Pastel on paper"], 0.98),
+    (12, "European Sculpture and Decorative Arts", 0.089, (1400, 1950), ["French", "British", "German", "Italian", "Dutch"],
+     ["Ceramics-Porcelain", "Metalwork-Silver", "Furniture", "Glass", "Sculpture"],
+     ["Hard-paste porcelain", "Silver", "Oak, walnut, gilt bronze", "Glass", "Marble", "Tin-glazed earthenware"], 0.45),
+    (13, "Greek and Roman Art", 0.069, (-3000, 400), ["Greek, Attic", "Roman", "Cypriot", "Etruscan", "Greek"],
+     ["Vases", "Gems", "Bronzes", "Terracottas", "Stone Sculpture"],
+     ["Terracotta", "Bronze", "Marble", "Glass", "Carnelian"], 0.05),
+    (14, "Islamic Art", 0.031, (650, 1900), ["", "Iran", "Egypt", "Turkey", "Syria"],
+     ["Ceramics", "Textiles-Woven", "Codices", "Metal", "Glass"],
+     ["Stonepaste; painted under transparent glaze", "Silk, metal wrapped thread", "Ink, opaque watercolor, and gold on paper", "Brass, inlaid with silver", "Glass, enameled and gilded"], 0.15),
+    (15, "The Robert Lehman Collection", 0.005, (1300, 1900), ["", "Italian", "French", "Dutch"],
+     ["Drawings", "Paintings", "Ceramics", "Glass"],
+     ["Pen and brown ink", "Tempera on wood", "Maiolica", "Oil on canvas"], 0.7),
+    (16, "The Libraries", 0.001, (1500, 2000), [""],
+     ["Books"],
+     ["Paper", "Paper, leather"], 0.5),
+    (17, "Medieval Art", 0.014, (300, 1550), ["Byzantine", "Frankish", "French", "German", "Coptic"],
+     ["Metalwork-Copper alloy", "Textiles-Woven", "Glass", "Enamels-Champlevé", "Ivories"],
+     ["Copper alloy", "Wool, linen", "Glass", "Copper, champlevé enamel, gilt", "Elephant ivory"], 0.1),
+    (18, "Musical Instruments", 0.011, (1500, 2000), ["American", "Italian", "German", "Japanese", "Indian"],
+     ["Chordophone-Lute-plucked", "Aerophone-Lip Vibrated", "Idiophone", "Membranophone", "Chordophone-Zither"],
+     ["Wood, various materials", "Brass", "Spruce, maple", "Wood, skin", "Bamboo"], 0.35),
+    (19, "Photographs", 0.077, (1839, 2020), ["", "American", "French", "British"],
+     ["Photographs", "Negatives"],
+     ["Gelatin silver print", "Albumen silver print from glass negative", "Salted paper print", "Chromogenic print", "Platinum print"], 0.9),
+    (21, "Modern and Contemporary Art", 0.027, (1880, 2024), ["", "American", "French", "German"],
+     ["Paintings", "Drawings", "Prints", "Sculpture", "Photographs"],
+     ["Oil on canvas", "Acrylic on canvas", "Graphite on paper", "Bronze", "Screenprint"], 0.97),
+]
+
+# added to some mediums ("Oak, gilt")
+EXTRA_MATERIALS = ["gilt", "paint", "gold leaf", "iron", "glass", "silk", "ivory", "linen", "bone", "walnut"]
+
+COUNTRIES = ["", "France", "Italy", "Egypt", "Germany", "Spain", "England", "Japan", "China", "Iran", "Mexico", "Peru"]
+
+CREDIT_LINES = [
+    "Rogers Fund", "Gift of J. Pierpont Morgan", "Purchase, Joseph Pulitzer Bequest",
+    "Harris Brisbane Dick Fund", "The Elisha Whittelsey Collection, The Elisha Whittelsey Fund",
+    "Fletcher Fund", "Bequest of Benjamin Altman", "The Cloisters Collection",
+    "Gift of Mrs. Henry O. Havemeyer", "Purchase, Lila Acheson Wallace Gift",
+]
+
+OBJECT_NAMES = [
+    "Print", "Drawing", "Fragment", "Bowl", "Photograph", "Figure", "Plate", "Textile fragment",
+    "Vase", "Panel", "Sword", "Coin", "Dress", "Bead", "Scarab", "Relief", "Cup", "Statuette",
+    "Book", "Portrait", "Ewer", "Box", "Jar", "Pendant", "Chair",
+]
+
+MOTIFS = [
+    "Saint", "Virgin and Child", "Landscape", "Lion", "Horseman", "Flowers", "Birds", "Crucifixion",
+    "Dragon", "Hunting Scene", "Musicians", "Ships", "Garden", "Procession", "Lotus", "Angel",
+    "Deer", "Warrior", "Portrait of a Woman", "Portrait of a Man", "River", "Temple", "Owl",
+    "Grapevine", "Battle", "Mountain", "Dancers", "Fish", "Tree of Life", "Peacock",
+]
+
+SURNAMES = [
+    "Smith", "Dürer", "Rembrandt", "Goya", "Hokusai", "Daumier", "Piranesi", "Callot", "Hollar",
+    "Bellange", "Gogh", "Degas", "Cassatt", "Evans", "Stieglitz", "Steichen", "Whistler", "Picasso",
+    "Matisse", "Sargent", "Homer", "Revere", "Tiffany", "Meissen", "Sèvres", "Rubens", "Titian",
+    "Vermeer", "Hiroshige", "Utamaro", "Kunisada", "Blake", "Turner", "Constable", "Manet", "Monet",
+    "Toulouse-Lautrec", "Atget", "Nadar", "Cameron",
+]
+GIVEN_NAMES = [
+    "Anonymous", "Albrecht", "Francisco", "Katsushika", "Honoré", "Giovanni Battista", "Jacques",
+    "Wenceslaus", "Vincent", "Edgar", "Mary", "Walker", "Alfred", "Edward", "James", "Pablo",
+    "Henri", "John", "Paul", "Louis", "Peter", "Utagawa", "Kitagawa", "William", "Joseph",
+    "Édouard", "Claude", "Eugène", "Julia", "Gaspard",
+]
+NATIONALITIES = ["French", "American", "Italian", "German", "Japanese", "British", "Dutch", "Spanish", "Flemish"]
+
+# Zipf exponents of the value frequencies: the n-th most common value is
+# n ** -exponent times as frequent as the first. Artists have a longer tail.
+ZIPF = 1.1
+ARTIST_ZIPF = 0.9
+
+# objects per distinct artist, on average
+OBJECTS_PER_ARTIST = 15
+
+
+def parse_count(text):
+    '''Parse an object count with an optional k or M suffix ("500k" -> 500000).'''
+    text = str(text).strip()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:].lower(), 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def department_sizes(n_objects):
+    '''Objects per department, in proportion to the shares and adding up to n_objects.'''
+    shares = np.array([d[2] for d in DEPARTMENTS])
+    exact = shares / shares.sum() * n_objects
+    sizes = np.floor(exact).astype(int)
+    # largest remainders get the objects lost to rounding down
+    for i in np.argsort(exact - sizes)[::-1][:n_objects - sizes.sum()]:
+        sizes[i] += 1
+    return sizes
+
+
+def zipf_choice(rng, values, size, exponent=ZIPF):
+    '''Draw `size` values, the n-th of `values` with weight n ** -exponent.'''
+    weights = np.arange(1, len(values) + 1, dtype=float) ** -exponent
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size, p=weights / weights.sum())]
+
+
+def artist_pool(n_objects):
+    '''(name, alphaSort, nationality, begin year) of every artist, most prolific first.'''
+    n_artists = max(n_objects // OBJECTS_PER_ARTIST, 1)
+    rng = np.random.default_rng(0)
+    artists = []
+    for i in range(n_artists):
+        surname = SURNAMES[i % len(SURNAMES)]
+        given = GIVEN_NAMES[(i // len(SURNAMES)) % len(GIVEN_NAMES)]
+        # artists beyond the name combinations are told apart by a number
+        suffix = f" {i // (len(SURNAMES) * len(GIVEN_NAMES)) + 1}" if i >= len(SURNAMES) * len(GIVEN_NAMES) else ""
+        artists.append((
+            f"{given} {surname}{suffix}",
+            f"{surname}, {given}{suffix}",
+            NATIONALITIES[int(rng.integers(len(NATIONALITIES)))],
+            int(rng.integers(1400, 1980)),
+        ))
+    return artists
+
+
+def generate_objects(rng, department, first_id, size, artists):
+    '''A DataFrame of `size` API object records for one department.'''
+    department_id, name, _, (first_year, last_year), cultures, classifications, mediums, artist_rate = department
+    object_ids = np.arange(first_id, first_id + size)
+
+    begin = rng.integers(first_year, last_year + 1, size)
+    end = np.minimum(begin + rng.geometric(1 / 25, size) - 1, 2025)
+    # most accessions are from the 20th century
+    accession = np.clip(rng.normal(1950, 35, size).round().astype(int), 1870, 2024).astype(str)
+    accession[rng.random(size) < 0.03] = ""
+
+    public_domain = (end < 1900) & (rng.random(size) < 0.9)
+    has_image = public_domain & (rng.random(size) < 0.85)
+    images = np.where(
+        has_image,
+        [f"https://images.metmuseum.org/CRDImages/synthetic/original/{i}.jpg" for i in object_ids],
+        "",
+    )
+
+    object_names = zipf_choice(rng, OBJECT_NAMES, size)
+    motifs = zipf_choice(rng, MOTIFS, size)
+    titles = np.where(rng.random(size) < 0.5, object_names, object_names + " with " + motifs)
+
+    medium = zipf_choice(rng, mediums, size)
+    # a minority of mediums carry an extra material, for a long tail of distinct values
+    extra = rng.random(size) < 0.2
+    medium[extra] = medium[extra] + ", " + zipf_choice(rng, EXTRA_MATERIALS, int(extra.sum()))
+
+    # artists by popularity: a few prolific ones, a long tail of the rest.
+    # Each department starts the ranking at a different artist.
+    artist_index = zipf_choice(rng, np.arange(len(artists)), size, ARTIST_ZIPF).astype(int)
+    artist_index = (artist_index + department_id * 7) % len(artists)
+    has_artist = rng.random(size) < artist_rate
+    # every department has an artist, as its artists.jsonl is never empty
+    has_artist[0] = True
+    artist = [artists[i] if a else ("", "", "", None) for i, a in zip(artist_index, has_artist)]
+
+    objects = pd.DataFrame({
+        "objectID": object_ids,
+        "isHighlight": rng.random(size) < 0.01,
+        "accessionNumber": [f"{a or 'L'}.{i}" for a, i in zip(accession, object_ids)],
+        "accessionYear": accession,
+        "isPublicDomain": public_domain,
+        "primaryImage": images,
+        "primaryImageSmall": np.char.replace(images.astype(str), "/original/", "/web-large/"),
+        "department": name,
+        "objectName": object_names,
+        "title": titles,
+        "culture": zipf_choice(rng, cultures, size),
+        "period": "",
+        "dynasty": "",
+        "reign": "",
+        "portfolio": "",
+        "artistDisplayName": [a[0] for a in artist],
+        "artistAlphaSort": [a[1] for a in artist],
+        "artistNationality": [a[2] for a in artist],
+        "artistBeginDate": [str(a[3]) if a[3] else "" for a in artist],
+        "artistEndDate": [str(a[3] + 60) if a[3] else "" for a in artist],
+        "artistWikidata_URL": "",
+        "objectDate": [f"ca. {b}" if b > 0 else f"ca. {-b} B.C." for b in begin],
+        "objectBeginDate": begin,
+        "objectEndDate": end,
+        "medium": medium,
+        "dimensions": [f"H. {h:.1f} cm" for h in rng.lognormal(3, 0.8, size)],
+        "creditLine": zipf_choice(rng, CREDIT_LINES, size),
+        "city": "",
+        "state": "",
+        "county": "",
+        "country": zipf_choice(rng, COUNTRIES, size),
+        "region": "",
+        "subregion": "",
+        "excavation": "",
+        "classification": zipf_choice(rng, classifications, size),
+        "department_id": department_id,
+        "object_id": object_ids,
+    })
+    return objects
+
+
+def department_dir(data_dir, department):
+    '''Directory of one department's files, named as met-databuild.py names it.'''
+    department_id, name = department[:2]
+    safe_name = "".join(c if c.isalnum() or c in (" ", "-") else "_" for c in name).replace(" ", "_")
+    return os.path.join(data_dir, f"{department_id}_{safe_name}")
+
+
+def generate(root, n_objects, seed=0):
+    '''
+        Write a synthetic collection of n_objects under root/data, in the
+        layout of met-databuild.py. Returns the department directories.
+    '''
+    data_dir = os.path.join(root, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    pd.DataFrame(
+        [(d[0], d[1]) for d in DEPARTMENTS], columns=["department_id", "displayName"]
+    ).to_json(os.path.join(data_dir, "departments.jsonl"), orient="records", lines=True)
+
+    artists = artist_pool(n_objects)
+    directories = []
+    first_id = 1
+    for department, size in zip(DEPARTMENTS, department_sizes(n_objects)):
+        directory = department_dir(data_dir, department)
+        os.makedirs(directory, exist_ok=True)
+        directories.append(directory)
+        rng = np.random.default_rng([seed, department[0]])
+
+        seen_artists = set()
+        with open(os.path.join(directory, "objects.jsonl"), "w", encoding="utf-8") as objects_file, \
+                open(os.path.join(directory, "artists.jsonl"), "w", encoding="utf-8") as artists_file:
+            for start in range(0, size, CHUNK_ROWS):
+                chunk = generate_objects(rng, department, first_id + start, min(CHUNK_ROWS, size - start), artists)
+                objects_file.write(chunk.to_json(orient="records", lines=True, force_ascii=False))
+
+                # one artists.jsonl record per artist, as the fetcher writes them
+                new = chunk[(chunk["artistDisplayName"] != "") & ~chunk["artistAlphaSort"].isin(seen_artists)]
+                new = new.drop_duplicates("artistAlphaSort")
+                seen_artists.update(new["artistAlphaSort"])
+                if len(new):
+                    pd.DataFrame({
+                        "artist_name": new["artistDisplayName"],
+                        "artistAlphaSort": new["artistAlphaSort"],
+                        "artistNationality": new["artistNationality"],
+                        "artistBeginDate": new["artistBeginDate"] + "-01-01T00:00:00",
+                        "artistEndDate": new["artistEndDate"] + "-01-01T00:00:00",
+                    }).to_json(artists_file, orient="records", lines=True, force_ascii=False)
+        first_id += size
+
+    return directories
+
+
+def load_script(path):
+    '''Import one of the src scripts by path, once, registered so worker processes can find it.'''
+    name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def clean(root):
+    '''Run the cleaning script over every department under root/data, into root/data/cleaned_data.'''
+    cleaning = load_script(os.path.join(SRC_DIR, "clean", "general-cleaning-script.py"))
+    data_dir = os.path.join(root, "data")
+    # the cleaning script writes to paths relative to the repository root
+    with contextlib.chdir(root):
+        os.makedirs(os.path.join("data", "cleaned_data"), exist_ok=True)
+        cleaning.department_to_csv("data")
+        for department in DEPARTMENTS:
+            name = os.path.basename(department_dir(data_dir, department))
+            artists_df, objects_df = cleaning.extract_MET_data("data", name)
+            artists_df, objects_df = cleaning.clean_MET_data(artists_df, objects_df)
+            cleaning.export_art_to_csv(name, artists_df, objects_df)
+    return os.path.join(data_dir, "cleaned_data")
+
+
+def build(root, processes=None):
+    '''Clean the collection under root/data and build root/data/met.db from it.'''
+    cleaned_dir = clean(root)
+    met_build = load_script(os.path.join(SRC_DIR, "met-build.py"))
+    return met_build.build(os.path.join(root, "data", "met.db"), cleaned_dir, processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Met collection.")
+    parser.add_argument("objects", type=parse_count, help="number of objects, e.g. 10k, 500k or 5M")
+    parser.add_argument("--root", default="synthetic", help="directory to write data/ into")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--build", action="store_true", help="also clean the data and build data/met.db")
+    parser.add_argument("--processes", type=int, default=None, help="parser processes for the build")
+    args = parser.parse_args()
+
+    generate(args.root, args.objects, args.seed)
+    print(f"Generated {args.objects} objects under {os.path.join(args.root, 'data')}")
+    if args.build:
+        snapshot = build(args.root, args.processes)
+        print(f"Built {snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+'''
+profiling.py
+
+Opt-in timing of the app's requests, to see where a slow page spends its time.
+
+Start the app with MET_PROFILE=1 to enable it. The time of each request is
+then split into phases:
+
+    sql        running queries and fetching their rows
+    dataframe  building DataFrames from the rows and reshaping them
+    figure     building charts and serializing them to HTML or JSON
+    template   rendering Jinja templates
+    other      everything else (Flask, the result caches, ...)
+
+Phases nest, and each counts only its own time: the SQL run while a figure
+is built counts as sql, not figure. Per-route totals, and a log of the
+queries slower than SLOW_QUERY_MS with their EXPLAIN QUERY PLAN, are served
+on /metrics. Every response also gets a Server-Timing header, which the
+browser's developer tools display.
+
+The query helpers read_sql() and fetch_all() are used whether or not
+profiling is on; when it is off, the hooks return at once.
+'''
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+from flask import before_render_template, request, template_rendered
+
+ENABLED = os.environ.get("MET_PROFILE", "") not in ("", "0")
+
+# Queries at least this slow, in milliseconds, are logged with their plan
+SLOW_QUERY_MS = float(os.environ.get("MET_SLOW_QUERY_MS", 100))
+
+# Slow queries kept, most recent last
+SLOW_QUERY_LOG_SIZE = 100
+
+PHASES = ["sql", "dataframe", "figure", "template", "other"]
+
+# Timings of the request being handled by this thread: .timings maps phase to
+# seconds, and .frames is the stack of open phases, each [name, start,
+# seconds spent in nested phases]. timings is None outside profiled requests.
+_local = threading.local()
+
+_lock = threading.Lock()
+_routes = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+# ================================================================
+# Phases
+# ================================================================
+def _recording():
+    return ENABLED and getattr(_local, "timings", None) is not None
+
+
+def _start(name):
+    _local.frames.append([name, time.perf_counter(), 0.0])
+
+
+def _stop():
+    name, start, nested = _local.frames.pop()
+    elapsed = time.perf_counter() - start
+    _local.timings[name] += elapsed - nested
+    if _local.frames:
+        _local.frames[-1][2] += elapsed
+
+
+@contextmanager
+def phase(name):
+    '''Count the time spent in the with block, less any nested phases, as `name`.'''
+    if not _recording():
+        yield
+        return
+
+    _start(name)
+    try:
+        yield
+    finally:
+        _stop()
+
+
+def profiled(name):
+    '''Decorator counting the time spent in a function as phase `name`.'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ================================================================
+# Queries
+# ================================================================
+def _execute(conn, query, params):
+    with phase("sql"):
+        start = time.perf_counter()
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+
+    if ENABLED and elapsed * 1000 >= SLOW_QUERY_MS:
+        _log_slow_query(conn, query, params, elapsed)
+    return cursor, rows
+
+
+def fetch_all(conn, query, params=()):
+    '''conn.execute(query, params).fetchall(), timed as sql and logged if slow.'''
+    return _execute(conn, query, params)[1]
+
+
+def read_sql(query, conn, params=()):
+    '''
+        pd.read_sql for the app's sqlite3 connections, timing the query (sql)
+        and the construction of the DataFrame (dataframe) separately.
+    '''
+    cursor, rows = _execute(conn, query, params)
+    with phase("dataframe"):
+        columns = [column[0] for column in cursor.description]
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def query_plan(conn, query, params=()):
+    '''The EXPLAIN QUERY PLAN of a query, one line per step, indented by depth.'''
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in conn.execute("EXPLAIN QUERY PLAN " + query, params):
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+def _log_slow_query(conn, query, params, elapsed):
+    entry = {
+        "time": time.time(),
+        "route": request.path if _recording() else None,
+        "ms": round(elapsed * 1000, 1),
+        "query": " ".join(query.split()),
+        "params": [p if isinstance(p, (int, float, str)) or p is None else repr(p) for p in params],
+        "plan": query_plan(conn, query, params),
+    }
+    with _lock:
+        _slow_queries.append(entry)
+
+
+# ================================================================
+# Requests
+# ================================================================
+def _begin_request():
+    if ENABLED:
+        _local.timings = dict.fromkeys(PHASES, 0.0)
+        _local.frames = []
+        _local.start = time.perf_counter()
+
+
+def _end_request(response):
+    if not _recording():
+        return response
+
+    total = time.perf_counter() - _local.start
+    timings = _local.timings
+    timings["other"] = max(total - sum(timings.values()), 0.0)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    ) + f", total;dur={total * 1000:.1f}"
+
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    with _lock:
+        stats = _routes.setdefault(route, {"count": 0, "total": 0.0, "max": 0.0, "phases": dict.fromkeys(PHASES, 0.0)})
+        stats["count"] += 1
+        stats["total"] += total
+        stats["max"] = max(stats["max"], total)
+        for name, seconds in timings.items():
+            stats["phases"][name] += seconds
+    return response
+
+
+def _clear_request(exc):
+    _local.timings = None
+
+
+def init_app(app):
+    '''Install the request hooks and template timing on a Flask app.'''
+    app.before_request(_begin_request)
+    app.after_request(_end_request)
+    app.teardown_request(_clear_request)
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+
+def _template_started(sender, **extra):
+    if _recording():
+        _start("template")
+
+
+def _template_finished(sender, **extra):
+    if _recording():
+        _stop()
+
+
+# ================================================================
+# Metrics
+# ================================================================
+def metrics():
+    '''Per-route timings in milliseconds and the slow query log, for /metrics.'''
+    def ms(seconds):
+        return round(seconds * 1000, 2)
+
+    with _lock:
+        routes = {
+            route: {
+                "count": stats["count"],
+                "total_ms": ms(stats["total"]),
+                "mean_ms": ms(stats["total"] / stats["count"]),
+                "max_ms": ms(stats["max"]),
+                "mean_phase_ms": {name: ms(s / stats["count"]) for name, s in stats["phases"].items()},
+            }
+            for route, stats in sorted(_routes.items())
+        }
+        slow_queries = list(_slow_queries)
+
+    return {
+        "enabled": ENABLED,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "routes": routes,
+        "slow_queries": slow_queries,
+    }
+
+
+def reset():
+    '''Forget the collected timings and slow queries.'''
+    with _lock:
+        _routes.clear()
+        _slow_queries.clear()
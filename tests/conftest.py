@@ -0,0 +1,147 @@
+'''
+conftest.py
+Shared fixtures for the met.db tests. The src scripts are imported by path,
+since several of them (met-schema.py, met-build.py) are not valid module names.
+'''
+
+import atexit
+import os
+import sys
+import shutil
+import tempfile
+import sqlite3
+import importlib.util
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+# jQuery and DataTables are downloaded at image build time; the tests serve
+# placeholders from a directory of their own (also seen by app subprocesses)
+os.environ["MET_VENDOR_DIR"] = tempfile.mkdtemp(prefix="met-vendor-")
+atexit.register(shutil.rmtree, os.environ["MET_VENDOR_DIR"], True)
+
+import assets  # noqa: E402
+import database  # noqa: E402 (needs SRC_DIR on the path)
+
+for _path, _url in assets.ASSETS.values():
+    if _url is not None:
+        with open(_path, "w") as f:
+            f.write(f"/* placeholder for {_url} */")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks", action="store_true",
+        help="run the benchmarks in tests/test_benchmarks.py (also run by --benchmark-only)",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    '''Skip the benchmarks unless they were asked for; they take a while.'''
+    if config.getoption("--benchmarks") or config.getoption("--benchmark-only", False):
+        return
+    skip = pytest.mark.skip(reason="benchmark: run with --benchmarks")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+def load_script(filename):
+    '''Import one of the src/*.py scripts as a module, once per session.'''
+    name = os.path.splitext(filename)[0].replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    # registered so worker processes can pickle the script's functions by name
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+DEPARTMENTS = [
+    (1, "American Decorative Arts"),
+    (3, "Ancient West Asian Art"),
+    (4, "Arms and Armor"),
+    (6, "Asian Art"),
+    (7, "The Cloisters"),
+    (10, "Egyptian Art"),
+    (11, "European Paintings"),
+    (13, "Greek and Roman Art"),
+    (17, "Medieval Art"),
+    (19, "Photographs"),
+]
+
+CULTURES = ["French", "German", "Spanish", "Italian", "English", "Unknown"]
+CLASSIFICATIONS = ["Sculpture", "Glass", "Textiles", "Metalwork", "Paintings"]
+COUNTRIES = ["France", "Spain", "Egypt", "Unknown"]
+MEDIUMS = ["Limestone", "Oak", "Silver gilt", "Pot-metal glass", "Wool tapestry", "Tempera on wood", "Paper"]
+ARTISTS = ["Gogh, Vincent van", "Unknown"] + [f"Surname{i}, Given{i}" for i in range(300)]
+
+
+@pytest.fixture(scope="session")
+def template_db(tmp_path_factory):
+    '''A met.db with the full schema and a small, evenly spread collection.'''
+    schema = load_script("met-schema.py")
+    db_path = str(tmp_path_factory.mktemp("template") / "met.db")
+
+    conn = sqlite3.connect(db_path)
+    schema.create_schema(conn)
+
+    conn.executemany("INSERT INTO Department (department_id, displayName) VALUES (?, ?)", DEPARTMENTS)
+    for artist in ARTISTS:
+        if artist == "Unknown":
+            continue
+        conn.execute(
+            "INSERT INTO Artists (artist_name, artistAlphaSort) VALUES (?, ?)",
+            (artist.split(", ")[-1], artist),
+        )
+
+    for object_id in range(1, 2001):
+        department_id = DEPARTMENTS[object_id % len(DEPARTMENTS)][0]
+        begin = 1100 + (object_id * 7) % 500
+        conn.execute("INSERT INTO Objects (department_id, object_id) VALUES (?, ?)", (department_id, object_id))
+        conn.execute(
+            '''
+            INSERT INTO Art (
+                object_id, isHighlight, accessionYear, isPublicDomain, primaryImage,
+                title, culture, artistAlphaSort, objectBeginDate, objectEndDate,
+                medium, country, classification
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (
+                object_id,
+                int(object_id % 25 == 0),
+                str(1870 + object_id % 150),
+                object_id % 3 % 2,
+                f"https://images.example.org/{object_id}.jpg" if object_id % 2 else "Unknown",
+                f"Object {object_id}",
+                CULTURES[object_id % len(CULTURES)],
+                ARTISTS[object_id % len(ARTISTS)],
+                str(begin),
+                str(begin + 50),
+                MEDIUMS[object_id % len(MEDIUMS)],
+                COUNTRIES[object_id % len(COUNTRIES)],
+                CLASSIFICATIONS[object_id % len(CLASSIFICATIONS)],
+            ),
+        )
+
+    # derived by the build after loading
+    schema.refresh_materials(conn)
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def met_db(template_db, tmp_path):
+    '''A private copy of template_db, which the test may modify.'''
+    db_path = str(tmp_path / "met.db")
+    shutil.copy(template_db, db_path)
+    yield db_path
+    database.close_all()
@@ -23,7 +23,7 @@ print(pd.read_sql("""SELECT COUNT(*) FROM Art""", conn))
 print(pd.read_sql("""SELECT artistAlphaSort FROM artists LIMIT 5""", conn))
 
 # checking the end dates of objects
-print(pd.read_sql("""SELECT title, artistAlphaSort, CAST(objectEndDate AS INTEGER) AS objectEndDate FROM Art WHERE CAST(objectEndDate AS INTEGER) > 2024""", conn))
+print(pd.read_sql("""SELECT title, artistAlphaSort, objectEndDate FROM Art WHERE objectEndDate > 2024""", conn))
 
 print(pd.read_sql("""SELECT country FROM Art LIMIT 5""", conn))
 
@@ -0,0 +1,109 @@
+'''
+test_api.py
+The JSON chart APIs: snapshot ETags, 304s and compressed bodies.
+'''
+
+import gzip
+import sqlite3
+
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def client(met_db, monkeypatch):
+    import app
+
+    cache.clear_all()
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    yield app.app.test_client()
+    cache.clear_all()
+
+
+def test_breakdown_returns_data_and_figure(client):
+    response = client.get("/api/breakdown?dept=The+Cloisters&field=culture")
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert sum(row["num_objects"] for row in body["data"]) == 200
+    assert body["figure"]["data"][0]["type"] == "pie"
+    assert "The Cloisters" in body["figure"]["layout"]["title"]["text"]
+
+    assert client.get("/api/breakdown?field=title").status_code == 400
+    assert client.get("/api/breakdown?dept=Nowhere").get_json()["figure"] is None
+
+
+def test_unchanged_requests_get_304(client, met_db):
+    url = "/api/breakdown?dept=ALL&field=country&collapse=1"
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+    # other arguments and new data get new tags
+    assert client.get("/api/breakdown?dept=ALL&field=culture").headers["ETag"] != etag
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET country = 'Italy' WHERE object_id = 1")
+    conn.commit()
+    conn.close()
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_breakdown_body_is_cached(client):
+    import app
+
+    url = "/api/breakdown?dept=The+Cloisters&field=country&collapse=1"
+    first = client.get(url)
+    again = client.get(url)
+    assert again.data == first.data
+    assert app.breakdown_json.cache_info().hits == 1
+    assert app.breakdown_json.cache_info().misses == 1
+
+
+def test_details_get_304(client):
+    url = "/api/details?draw=1&dept=The+Cloisters&start=0&length=10"
+    first = client.get(url)
+    assert first.get_json()["recordsTotal"] == 200
+
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_acq_api(client):
+    body = client.get("/api/acq?width=25").get_json()
+    assert body["width"] == 25
+    assert {trace["type"] for trace in body["figure"]["data"]} == {"bar"}
+    assert client.get("/api/acq?width=3").status_code == 400
+
+
+def test_responses_are_compressed(client):
+    plain = client.get("/api/acq?width=5")
+    assert "Content-Encoding" not in plain.headers
+
+    response = client.get("/api/acq?width=5", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == plain.data
+
+    brotli = pytest.importorskip("brotli")
+    response = client.get("/api/acq?width=5", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == plain.data
+
+
+def test_assets_are_compressed_once(client):
+    import assets
+
+    url = assets.asset_url("plotly.js")
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.cache_control.max_age == assets.ASSET_MAX_AGE
+    with open(assets.PLOTLY_JS, "rb") as f:
+        assert gzip.decompress(response.data) == f.read()
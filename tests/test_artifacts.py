@@ -0,0 +1,42 @@
+'''
+test_artifacts.py
+Charts stored in the snapshot, and the fallback for snapshots without them.
+'''
+
+import sqlite3
+
+import pytest
+
+import cache
+from artifacts import stored_chart
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.clear_all()
+    yield
+    cache.clear_all()
+
+
+def test_stored_artifact_is_served(met_db):
+    conn = sqlite3.connect(met_db)
+    conn.execute(
+        "INSERT INTO Artifacts (name, content_type, body) VALUES ('box_chart', 'text/html', '<div>stored</div>')"
+    )
+    conn.commit()
+    conn.close()
+
+    assert stored_chart(met_db, "box_chart") == "<div>stored</div>"
+
+
+def test_missing_artifact_is_rendered(met_db):
+    html = stored_chart(met_db, "acq_chart")
+    assert "Accession Year Histogram" in html
+
+    # snapshots from before the Artifacts table render every chart
+    conn = sqlite3.connect(met_db)
+    conn.execute("DROP TABLE Artifacts")
+    conn.commit()
+    conn.close()
+
+    assert "Creation Year of Art Objects" in stored_chart(met_db, "box_chart")
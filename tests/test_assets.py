@@ -0,0 +1,82 @@
+'''
+test_assets.py
+Vendored JS/CSS served under fingerprinted, long-cached URLs.
+'''
+
+import hashlib
+
+import plotly.express as px
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def client(met_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    return app.app.test_client()
+
+
+def test_plotly_is_served_from_the_package(client):
+    url = assets.asset_url("plotly.js")
+    assert url.startswith("/assets/plotly.min.") and url.endswith(".js")
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.max_age == assets.ASSET_MAX_AGE
+    assert response.cache_control.immutable
+    with open(assets.PLOTLY_JS, "rb") as f:
+        assert response.data == f.read()
+    response.close()
+
+    assert client.get("/assets/plotly.min.000000000000.js").status_code == 404
+
+
+def test_fingerprint_follows_content(tmp_path, monkeypatch):
+    path = tmp_path / "jquery-3.6.0.min.js"
+    monkeypatch.setitem(assets.ASSETS, "jquery.js", (str(path), "https://code.jquery.com/jquery-3.6.0.min.js"))
+
+    # not vendored: no CDN fallback
+    with pytest.raises(assets.MissingAsset):
+        assets.asset_url("jquery.js")
+
+    path.write_text("one")
+    first = assets.asset_url("jquery.js")
+    assert assets.find(first.rsplit("/", 1)[1]) == str(path)
+
+    path.write_text("two!")
+    assert assets.asset_url("jquery.js") != first
+
+
+def test_downloads_are_checked_against_the_manifest(tmp_path, monkeypatch):
+    path = tmp_path / "vendor" / "lib-1.0.min.js"
+    manifest = tmp_path / "vendor.sha256"
+    monkeypatch.setattr(assets, "VENDOR_DIR", str(tmp_path / "vendor"))
+    monkeypatch.setattr(assets, "MANIFEST", str(manifest))
+    monkeypatch.setattr(assets, "ASSETS", {"lib.js": (str(path), "https://cdn.example.org/lib-1.0.min.js")})
+    monkeypatch.setattr(assets, "download", lambda url: b"tampered")
+
+    # unpinned
+    with pytest.raises(assets.AssetMismatch):
+        assets.vendor()
+
+    manifest.write_text(f"{hashlib.sha256(b'expected').hexdigest()}  lib-1.0.min.js\n")
+    with pytest.raises(assets.AssetMismatch):
+        assets.vendor()
+    assert not path.exists()
+
+    monkeypatch.setattr(assets, "download", lambda url: b"expected")
+    assets.vendor()
+    assert path.read_bytes() == b"expected"
+
+
+def test_pages_load_plotly_once(client):
+    html = assets.figure_html(px.bar(x=[1, 2], y=[3, 4]))
+    assert "Plotly.newPlot" in html
+    assert len(html) < 50_000
+
+    page = client.post("/", data={"department": "ALL", "field": "culture"}).get_data(as_text=True)
+    assert page.count(assets.asset_url("plotly.js")) == 1
+    assert "cdn.plot.ly" not in page
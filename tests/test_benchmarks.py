@@ -0,0 +1,180 @@
+'''
+test_benchmarks.py
+Benchmarks of the pipeline and the app on a synthetic collection.
+
+The collection (see met-synthetic.py) has MET_BENCH_OBJECTS objects, 10k by
+default, and is generated and built once per session. Nothing is fetched
+from the network. To track a larger collection over time:
+
+    MET_BENCH_OBJECTS=500k python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-autosave
+    MET_BENCH_OBJECTS=500k python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:25%
+
+The second command fails when a benchmark's mean is 25% worse than in the
+last saved run. The benchmarks are skipped unless pytest is given
+--benchmarks or --benchmark-only; the benchmarks job in
+.github/workflows/tests.yml compares every pull request with its base.
+'''
+
+import os
+
+import pytest
+
+import cache
+import database
+import explorer
+import facets
+from conftest import SRC_DIR, load_script
+from department_vis import acq_bar_chart, create_box_chart
+from eda_cloisters import run_eda
+
+synthetic = load_script("met-synthetic.py")
+met_build = load_script("met-build.py")
+cleaning = synthetic.load_script(os.path.join(SRC_DIR, "clean", "general-cleaning-script.py"))
+
+BENCH_OBJECTS = synthetic.parse_count(os.environ.get("MET_BENCH_OBJECTS", "10k"))
+
+# the largest department, and a small one
+LARGE_DEPARTMENT = "Drawings and Prints"
+SMALL_DEPARTMENT = "The Cloisters"
+
+
+@pytest.fixture(scope="session")
+def collection(tmp_path_factory):
+    '''Root of the synthetic collection's data/ directory, cleaned.'''
+    root = str(tmp_path_factory.mktemp("synthetic"))
+    synthetic.generate(root, BENCH_OBJECTS)
+    synthetic.clean(root)
+    return root
+
+
+@pytest.fixture(scope="session")
+def bench_db(collection):
+    '''The db built from the synthetic collection.'''
+    db_path = os.path.join(collection, "data", "met.db")
+    met_build.build(db_path, os.path.join(collection, "data", "cleaned_data"))
+    yield db_path
+    database.close_all()
+
+
+@pytest.fixture
+def client(bench_db, monkeypatch):
+    import app
+
+    cache.clear_all()
+    monkeypatch.setattr(app, "DB_PATH", bench_db)
+    yield app.app.test_client()
+    cache.clear_all()
+
+
+# ================================================================
+# Pipeline
+# ================================================================
+def test_clean(benchmark, collection):
+    data_dir = os.path.join(collection, "data")
+    department = next(d for d in synthetic.DEPARTMENTS if d[1] == LARGE_DEPARTMENT)
+    artists_df, objects_df = cleaning.extract_MET_data(data_dir, os.path.basename(synthetic.department_dir(data_dir, department)))
+
+    _, cleaned = benchmark(cleaning.clean_MET_data, artists_df, objects_df)
+    assert cleaned["primaryImage"].notna().all()
+
+
+def test_build(benchmark, collection, tmp_path):
+    db_path = str(tmp_path / "met.db")
+    cleaned_dir = os.path.join(collection, "data", "cleaned_data")
+
+    benchmark.pedantic(met_build.build, args=(db_path, cleaned_dir), rounds=2, iterations=1)
+    database.close_all()
+    with database.connection(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Objects").fetchone()[0] == BENCH_OBJECTS
+
+
+# ================================================================
+# Queries and charts, uncached
+# ================================================================
+@pytest.mark.parametrize("dept", ["ALL", LARGE_DEPARTMENT])
+def test_group_query(benchmark, bench_db, dept):
+    df = benchmark(explorer.run_group_query.__wrapped__, bench_db, dept, "culture")
+    assert df["num_objects"].sum() > 0
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"selected_dept": "ALL", "start": 5000},
+    {"selected_dept": LARGE_DEPARTMENT, "order_by": "title", "descending": True},
+    {"selected_dept": "ALL", "search": "saint"},
+], ids=["deep-page", "ordered", "search"])
+def test_detail_page(benchmark, bench_db, kwargs):
+    df, _, _ = benchmark(explorer.run_detail_page, bench_db, **kwargs)
+    assert len(df) == 25
+
+
+def test_search(benchmark, bench_db):
+    df, _ = benchmark(explorer.search_objects, bench_db, "portrait of a")
+    assert len(df) > 0
+
+
+def test_facet_index_build(benchmark, bench_db):
+    index = benchmark.pedantic(facets.read_facet_index, args=(bench_db,), rounds=3)
+    assert index.size == BENCH_OBJECTS
+
+
+def test_facet_index_load(benchmark, bench_db):
+    '''What the app does once per snapshot: load the index the build stored.'''
+    index = benchmark(facets.load_facet_index, bench_db)
+    assert index.size == BENCH_OBJECTS
+
+
+@pytest.mark.parametrize("filters, years", [
+    ({}, (None, None)),
+    ({"department": [LARGE_DEPARTMENT], "isHighlight": ["No"]}, (1700, 1900)),
+    ({"culture": ["French", "Italian"], "classification": ["Paintings"], "isPublicDomain": ["Yes"]}, (None, 1800)),
+], ids=["all", "department-years", "cross-filter"])
+def test_facet_counts(benchmark, bench_db, filters, years):
+    facets.facet_index(bench_db)
+    selection = facets.make_selection(filters)
+    result = benchmark(facets.facet_counts.__wrapped__, bench_db, selection, *years)
+    assert result["facets"]["department"]
+
+
+def test_box_chart(benchmark, bench_db):
+    benchmark(create_box_chart.__wrapped__, bench_db)
+
+
+def test_acq_chart(benchmark, bench_db):
+    benchmark(acq_bar_chart.__wrapped__, bench_db, 5)
+
+
+def test_eda(benchmark, bench_db):
+    heatmap, _ = benchmark.pedantic(run_eda.__wrapped__, args=(bench_db, SMALL_DEPARTMENT), rounds=3)
+    assert heatmap.startswith("<img")
+
+
+# ================================================================
+# Routes
+# ================================================================
+ROUTES = [
+    "/",
+    "/?dept=ALL&field=culture&collapse=1",
+    "/api/breakdown?dept=ALL&field=classification&collapse=1",
+    f"/api/details?dept={LARGE_DEPARTMENT}&start=100&length=25&order[0][column]=0",
+    "/box",
+    "/acq?width=5",
+    "/api/acq?width=25",
+    f"/eda?dept={SMALL_DEPARTMENT}",
+    "/search?q=virgin",
+    f"/api/facets?department={LARGE_DEPARTMENT}&culture=French&culture=Italian&year_from=1700",
+]
+
+
+@pytest.mark.parametrize("url", ROUTES)
+def test_route_cached(benchmark, client, url):
+    '''Steady state: the route's queries and charts are in the result caches.'''
+    client.get(url)
+    response = benchmark(client.get, url)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("url", ROUTES)
+def test_route_cold(benchmark, client, url):
+    '''First request after a new snapshot is published: every cache is empty.'''
+    response = benchmark.pedantic(client.get, args=(url,), setup=cache.clear_all, rounds=3)
+    assert response.status_code == 200
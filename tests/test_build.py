@@ -0,0 +1,190 @@
+'''
+test_build.py
+Building snapshots from cleaned CSVs and publishing them.
+'''
+
+import os
+
+import pandas as pd
+import pytest
+
+import artifacts
+import database
+from conftest import load_script
+
+build = load_script("met-build.py")
+schema = load_script("met-schema.py")
+
+
+def write_objects(cleaned_dir, department_id, name, object_ids, titles=None):
+    objects = pd.DataFrame({c: "Unknown" for c in build.ART_COLUMNS}, index=range(len(object_ids)))
+    objects["object_id"] = object_ids
+    objects["department_id"] = department_id
+    objects["title"] = titles if titles is not None else [f"Object {i}" for i in object_ids]
+    objects["isHighlight"] = False
+    objects["isPublicDomain"] = True
+    objects["accessionYear"] = "1925"
+    objects["objectBeginDate"] = 1200
+    objects["objectEndDate"] = 1250
+    objects.to_csv(os.path.join(cleaned_dir, f"objects_{name}.csv"), index=False)
+
+
+def write_artists(cleaned_dir, name, artists):
+    pd.DataFrame({
+        "artist_name": [a[0] for a in artists],
+        "artistAlphaSort": [a[1] for a in artists],
+        "artistNationality": "Unknown",
+        "artistBeginDate": "Unknown",
+        "artistEndDate": "Unknown",
+    }).to_csv(os.path.join(cleaned_dir, f"artists_{name}.csv"), index=False)
+
+
+@pytest.fixture
+def cleaned(tmp_path):
+    cleaned_dir = tmp_path / "cleaned_data"
+    cleaned_dir.mkdir()
+    pd.DataFrame({"department_id": [7, 17], "displayName": ["The Cloisters", "Medieval Art"]})\
+        .to_csv(cleaned_dir / "departments.csv", index=False)
+    return str(cleaned_dir)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "met.db")
+
+
+def count(db_path):
+    conn = database.connect(db_path)
+    n = conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0]
+    conn.close()
+    return n
+
+
+def test_build_loads_every_file(db_path, cleaned, monkeypatch):
+    # small batches, so duplicates land in different chunks of the file
+    monkeypatch.setattr(build, "BATCH_ROWS", 4)
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3, 4, 5, 6, 1, 2, 7, 8],
+                  titles=["Chalice", "Relief", "c", "d", "e", "f", "Duplicate", "Duplicate", "g", "h"])
+    write_objects(cleaned, 17, "Medieval_Art", list(range(100, 130)))
+    write_artists(cleaned, "Medieval_Art", [("Second", "Master, The"), ("Jean", "Pucelle, Jean")])
+    write_artists(cleaned, "The_Cloisters", [("First", "Master, The"), ("Nobody", "Unknown")])
+
+    build.build(db_path, cleaned, processes=2)
+
+    conn = database.connect(db_path)
+    counts = dict(conn.execute(
+        "SELECT department_id, COUNT(*) FROM Objects GROUP BY department_id"
+    ).fetchall())
+    assert counts == {7: 8, 17: 30}
+    assert conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0] == 38
+    assert conn.execute("SELECT title FROM Art WHERE object_id = 1").fetchone()[0] == "Chalice"
+    # artist files are written in sorted file order, the first occurrence wins
+    assert dict(conn.execute("SELECT artistAlphaSort, artist_name FROM Artists").fetchall()) == {
+        "Master, The": "Second",
+        "Pucelle, Jean": "Jean",
+    }
+
+    # rollups and the search index are filled after the load, and the triggers
+    # installed for later upserts
+    assert dict(conn.execute(
+        "SELECT department_id, SUM(num_objects) FROM Rollup WHERE field = 'culture' GROUP BY 1"
+    ).fetchall()) == {0: 38, 7: 8, 17: 30}
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert set(schema.rollup_triggers()) | set(schema.search_triggers()) <= triggers
+    assert conn.execute("SELECT COUNT(*) FROM ArtSearch WHERE ArtSearch MATCH 'chalice'").fetchone()[0] == 1
+
+    # the static charts are rendered into the snapshot
+    stored = dict(conn.execute("SELECT name, body FROM Artifacts").fetchall())
+    assert set(stored) == set(artifacts.RENDERERS)
+    assert "plotly" in stored["box_chart"]
+    conn.close()
+
+
+def test_build_deduplicates_artists(db_path, cleaned):
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3])
+    # overlapping files, one with an artist listed twice; written in sorted
+    # file order (A, B, C), so the rows of earlier files are kept
+    write_artists(cleaned, "A_Arms_and_Armor", [("Armorer", "Master, The"), ("Kunz", "Lochner, Kunz")])
+    write_artists(cleaned, "B_Medieval_Art", [
+        ("Illuminator", "Master, The"),
+        ("Jean", "Pucelle, Jean"),
+        ("Jean again", "Pucelle, Jean"),
+    ])
+    write_artists(cleaned, "C_The_Cloisters", [("Sculptor", "Master, The"), ("K. Lochner", "Lochner, Kunz")])
+
+    build.build(db_path, cleaned, processes=2)
+
+    conn = database.connect(db_path)
+    rows = conn.execute("SELECT artistAlphaSort, artist_name FROM Artists ORDER BY artistAlphaSort").fetchall()
+    conn.close()
+    assert rows == [
+        ("Lochner, Kunz", "Kunz"),
+        ("Master, The", "Armorer"),
+        ("Pucelle, Jean", "Jean"),
+    ]
+
+
+def test_build_fails_on_bad_file(db_path, cleaned):
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3])
+    with open(os.path.join(cleaned, "objects_Broken.csv"), "w") as f:
+        f.write("foo,bar\n1,2\n")
+
+    with pytest.raises(RuntimeError, match="objects_Broken.csv"):
+        build.build(db_path, cleaned, processes=2)
+
+
+def _exit_worker(path):
+    os._exit(1)
+
+
+def test_build_fails_when_worker_dies(db_path, cleaned, monkeypatch):
+    monkeypatch.setattr(build, "_parse_file", _exit_worker)
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3])
+
+    with pytest.raises(RuntimeError, match="worker failed"):
+        build.build(db_path, cleaned, processes=2)
+
+
+def test_build_publishes_snapshots(db_path, cleaned):
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3])
+    first = build.build(db_path, cleaned, processes=2)
+    assert database.resolve(db_path) == first
+    assert count(db_path) == 3
+
+    # a reader of the old snapshot keeps its view across a new build
+    reader = database.connect(db_path)
+    write_objects(cleaned, 7, "The_Cloisters", [1, 2, 3, 4])
+    second = build.build(db_path, cleaned, processes=2)
+
+    assert second != first
+    assert reader.execute("SELECT COUNT(*) FROM Art").fetchone()[0] == 3
+    assert count(db_path) == 4
+    reader.close()
+
+    conn = database.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    conn.close()
+
+
+def test_failed_build_keeps_current_snapshot(db_path, cleaned):
+    write_objects(cleaned, 7, "The_Cloisters", [1])
+    published = build.build(db_path, cleaned, processes=1)
+
+    with open(os.path.join(cleaned, "objects_Broken.csv"), "w") as f:
+        f.write("foo,bar\n1,2\n")
+    with pytest.raises(RuntimeError):
+        build.build(db_path, cleaned, processes=1)
+
+    assert database.resolve(db_path) == published
+    assert os.listdir(database.snapshot_dir(db_path)) == [os.path.basename(published)]
+
+
+def test_prune_keeps_recent_snapshots(db_path, cleaned):
+    write_objects(cleaned, 7, "The_Cloisters", [1])
+
+    snapshots = [build.build(db_path, cleaned, processes=1) for _ in range(database.KEEP_SNAPSHOTS + 2)]
+
+    remaining = sorted(f for f in os.listdir(database.snapshot_dir(db_path)) if f.endswith(".db"))
+    assert remaining == [os.path.basename(s) for s in snapshots[-(database.KEEP_SNAPSHOTS + 1):]]
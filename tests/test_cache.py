@@ -0,0 +1,89 @@
+'''
+test_cache.py
+The versioned result cache in front of the explorer and chart queries.
+'''
+
+import sqlite3
+
+import pytest
+
+import cache
+import database
+from explorer import run_group_query
+from test_database import publish_copy
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.clear_all()
+    yield
+    cache.clear_all()
+
+
+def test_repeated_calls_hit(met_db):
+    first = run_group_query(met_db, "The Cloisters", "culture")
+    # callers get their own copy to modify
+    first["num_objects"] = 0
+    second = run_group_query(met_db, "The Cloisters", "culture")
+
+    assert second["num_objects"].sum() == 200
+    info = run_group_query.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+    # keyword and positional arguments share an entry; other arguments do not
+    run_group_query(met_db, selected_dept="The Cloisters", selected_field="culture")
+    run_group_query(met_db, "ALL", "culture")
+    info = run_group_query.cache_info()
+    assert (info.hits, info.misses) == (2, 2)
+    assert cache.stats()["run_group_query"]["hits"] == 2
+
+
+def test_writes_to_an_unpublished_db_invalidate(met_db):
+    before = run_group_query(met_db, "ALL", "isHighlight")
+
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET isHighlight = 1 WHERE object_id <= 10")
+    conn.commit()
+    conn.close()
+
+    after = run_group_query(met_db, "ALL", "isHighlight")
+    assert before.set_index("category")["num_objects"]["Yes"] == 80
+    assert after.set_index("category")["num_objects"]["Yes"] == 90
+    assert run_group_query.cache_info().misses == 2
+
+
+def test_publishing_a_snapshot_invalidates(tmp_path, template_db):
+    (tmp_path / "snapshots").mkdir()
+    db_path = str(tmp_path / "met.db")
+    try:
+        publish_copy(db_path, template_db, "1")
+        run_group_query(db_path, "ALL", "culture")
+        run_group_query(db_path, "ALL", "country")
+        run_group_query(db_path, "ALL", "culture")
+
+        publish_copy(db_path, template_db, "2")
+        run_group_query(db_path, "ALL", "culture")
+    finally:
+        database.close_all()
+
+    info = run_group_query.cache_info()
+    assert (info.hits, info.misses) == (1, 3)
+    # the first snapshot's entries were dropped when the second was cached
+    assert info.currsize == 1
+
+
+def test_eviction_is_least_recently_used(met_db):
+    @cache.versioned_cache(maxsize=2)
+    def lookup(db_path, object_id):
+        with database.connection(db_path) as conn:
+            return conn.execute("SELECT title FROM Art WHERE object_id = ?", (object_id,)).fetchone()[0]
+
+    lookup(met_db, 1)
+    lookup(met_db, 2)
+    lookup(met_db, 1)
+    lookup(met_db, 3)  # evicts 2
+    lookup(met_db, 1)
+    lookup(met_db, 2)
+
+    info = lookup.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 4, 2)
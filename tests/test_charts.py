@@ -0,0 +1,73 @@
+'''
+test_charts.py
+The statistics behind the department charts.
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cache
+import department_vis
+from department_vis import accession_counts, acq_bar_chart, box_stats, create_box_chart, sample_evenly
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.clear_all()
+    yield
+    cache.clear_all()
+
+
+def test_box_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    values = {"A": np.append(rng.normal(1500, 50, 500).round(), [100, 1900, 2000]), "B": np.arange(1, 12.0)}
+    df = pd.DataFrame([(g, v) for g, vs in values.items() for v in vs], columns=["group", "year"])
+
+    stats = box_stats(df, "year", "group")
+
+    for group, vs in values.items():
+        q1, median, q3 = np.percentile(vs, [25, 50, 75])
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        row = stats.loc[group]
+        assert (row["q1"], row["median"], row["q3"]) == pytest.approx((q1, median, q3))
+        assert row["lowerfence"] == vs[vs >= low].min()
+        assert row["upperfence"] == vs[vs <= high].max()
+        assert sorted(row["outliers"]) == sorted(vs[(vs < low) | (vs > high)])
+
+    assert {100, 1900, 2000} <= set(stats.loc["A", "outliers"])
+    assert len(stats.loc["B", "outliers"]) == 0
+
+
+def test_outliers_are_sampled():
+    sample = sample_evenly(np.arange(100), 5)
+    assert list(sample) == [0, 25, 50, 74, 99]
+    assert list(sample_evenly(np.arange(3), 5)) == [0, 1, 2]
+
+
+def test_box_chart_ships_statistics_only(met_db):
+    fig = create_box_chart(met_db)
+
+    box, outliers = fig.data
+    assert box.type == "box" and box.x is None
+    assert len(box.y) == 10
+    assert len(outliers.x) <= 10 * department_vis.MAX_OUTLIERS
+
+
+def test_accession_years_are_binned_in_sql(met_db):
+    counts = accession_counts(met_db, 25)
+
+    # accessionYear is 1870 + object_id % 150 in the test collection
+    years = pd.Series([1870 + object_id % 150 for object_id in range(1, 2001)])
+    expected = (years // 25 * 25).value_counts().sort_index()
+    assert counts.groupby("bin_start")["num_objects"].sum().to_dict() == expected.to_dict()
+    assert set(counts["bin_start"] % 25) == {0}
+
+
+def test_acq_chart_ships_bin_counts(met_db):
+    fig = acq_bar_chart(met_db, 50)
+
+    assert {trace.type for trace in fig.data} == {"bar"}
+    assert sum(len(trace.x) for trace in fig.data) == len(accession_counts(met_db, 50))
+    with pytest.raises(ValueError):
+        acq_bar_chart(met_db, 7)
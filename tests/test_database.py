@@ -0,0 +1,81 @@
+'''
+test_database.py
+Pooled read-only connections to the published snapshot.
+'''
+
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import database
+
+
+def publish_copy(db_path, template_db, build_id):
+    '''Publish a copy of template_db as a new WAL snapshot of db_path.'''
+    snapshot = database.snapshot_path(db_path, build_id)
+    shutil.copy(template_db, snapshot)
+    conn = sqlite3.connect(snapshot)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    database.publish(db_path, snapshot)
+    return snapshot
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    (tmp_path / "snapshots").mkdir()
+    yield str(tmp_path / "met.db")
+    database.close_all()
+
+
+def test_connections_are_reused(met_db):
+    with database.connection(met_db) as conn:
+        first = conn
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == database.MMAP_SIZE
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -database.CACHE_KIB
+
+    with database.connection(met_db) as conn:
+        assert conn is first
+
+    with pytest.raises(sqlite3.OperationalError):
+        with database.connection(met_db) as conn:
+            conn.execute("DELETE FROM Art")
+
+
+def test_new_snapshot_replaces_pooled_connections(db_path, template_db):
+    publish_copy(db_path, template_db, "1")
+    with database.connection(db_path) as conn:
+        old = conn
+        count = conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0]
+
+    second = publish_copy(db_path, template_db, "2")
+    editor = sqlite3.connect(second)
+    editor.execute("DELETE FROM Art WHERE object_id = 1")
+    editor.commit()
+    editor.close()
+
+    with database.connection(db_path) as conn:
+        assert conn is not old
+        assert conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0] == count - 1
+
+
+def test_concurrent_borrowers_get_their_own_connection(met_db):
+    borrowed = []
+    inside = threading.Barrier(4)
+
+    def borrow():
+        with database.connection(met_db) as conn:
+            inside.wait()
+            borrowed.append(conn)
+            conn.execute("SELECT COUNT(*) FROM Art").fetchone()
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(conn) for conn in borrowed}) == 4
@@ -0,0 +1,92 @@
+'''
+test_details.py
+The paged Explorer detail table and its DataTables endpoint.
+'''
+
+import sqlite3
+
+import pytest
+
+from explorer import run_detail_page
+
+
+def test_pages_cover_the_department(met_db):
+    conn = sqlite3.connect(met_db)
+    titles = [title for title, in conn.execute(
+        "SELECT a.title FROM Art a JOIN Objects o ON o.object_id = a.object_id"
+        " WHERE o.department_id = 7 ORDER BY a.object_id"
+    )]
+    conn.close()
+
+    pages = []
+    for start in range(0, len(titles), 75):
+        page, total, filtered = run_detail_page(met_db, "The Cloisters", start=start, length=75)
+        assert total == filtered == len(titles) == 200
+        pages.extend(page["title"])
+
+    assert pages == titles
+
+
+def test_collection_total_comes_from_rollups(met_db):
+    page, total, filtered = run_detail_page(met_db, "ALL", length=10)
+    assert len(page) == 10
+    assert total == filtered == 2000
+    assert list(page["title"]) == [f"Object {i}" for i in range(1, 11)]
+
+
+def test_search_and_order(met_db):
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET title = 'Wheat Field' WHERE object_id IN (4, 14, 27)")
+    conn.commit()
+    conn.close()
+
+    page, total, filtered = run_detail_page(met_db, "ALL", search="whea", order_by="culture", descending=True)
+    assert (total, filtered) == (2000, 3)
+    assert list(page["culture"]) == sorted(page["culture"], reverse=True)
+    assert set(page["title"]) == {"Wheat Field"}
+
+    # department filter and search combine
+    _, total, filtered = run_detail_page(met_db, "The Cloisters", search="whea")
+    assert (total, filtered) == (200, 2)
+
+    with pytest.raises(ValueError):
+        run_detail_page(met_db, "ALL", order_by="title; DROP TABLE Art")
+
+
+def test_details_api(met_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    client = app.app.test_client()
+
+    response = client.get("/api/details", query_string={
+        "draw": 3,
+        "dept": "The Cloisters",
+        "start": 10,
+        "length": 5000,
+        "order[0][column]": 0,
+        "order[0][dir]": "desc",
+    })
+    body = response.get_json()
+
+    assert body["draw"] == 3
+    assert body["recordsTotal"] == body["recordsFiltered"] == 200
+    # page length is capped, and rows follow the table's column order
+    assert len(body["data"]) == app.MAX_PAGE_LENGTH
+    titles = [row[0] for row in body["data"]]
+    assert titles == sorted(titles, reverse=True)
+    assert {row[5] for row in body["data"]} <= {"Yes", "No"}
+
+
+def test_details_api_start_is_bounded(met_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    client = app.app.test_client()
+
+    # past SQLite's 64-bit integers: an empty page rather than an error
+    response = client.get("/api/details", query_string={"dept": "ALL", "start": 2 ** 64})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["data"] == []
+    assert body["recordsTotal"] == 2000
@@ -0,0 +1,53 @@
+'''
+test_eda.py
+The department EDA reads only its department's objects in the medieval window.
+'''
+
+import sqlite3
+
+import pytest
+
+import cache
+from eda_cloisters import load_db, run_eda
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.clear_all()
+    yield
+    cache.clear_all()
+
+
+def test_load_db_filters_in_sql(met_db):
+    conn = sqlite3.connect(met_db)
+    # out of the 12th-16th century window
+    conn.execute("UPDATE Art SET objectBeginDate = 1700 WHERE object_id = 10")
+    conn.execute("UPDATE Art SET objectBeginDate = 1099 WHERE object_id = 20")
+    conn.commit()
+    conn.close()
+
+    df = load_db(met_db, "Egyptian Art")
+
+    # Egyptian Art (department 10) holds the object_ids ending in 5
+    assert set(df["object_id"]) == set(range(5, 2001, 10))
+    assert df["objectBeginDate"].between(1100, 1599).all()
+    assert set(load_db(met_db)["object_id"]) == set(range(4, 2001, 10))
+    assert list(df.columns) == ["object_id", "objectBeginDate", "culture", "medium", "material_family"]
+
+    df = load_db(met_db, "American Decorative Arts")
+    assert 10 not in set(df["object_id"]) and 20 not in set(df["object_id"])
+
+
+def test_eda_for_any_department(met_db):
+    heatmap_html, sankey_html = run_eda(met_db, "Egyptian Art")
+    assert heatmap_html.startswith("<img")
+    assert "Cultural Flow" in sankey_html
+
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET objectBeginDate = 1900 WHERE object_id % 10 = 9")
+    conn.commit()
+    conn.close()
+
+    # Photographs (department 19) has nothing left in the window
+    heatmap_html, sankey_html = run_eda(met_db, "Photographs")
+    assert "No Photographs objects" in heatmap_html
@@ -0,0 +1,166 @@
+'''
+test_facets.py
+Faceted counts must match a GROUP BY over Art and Objects for any selection.
+'''
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+import cache
+import database
+import facets
+from facets import FACETS, facet_counts, facet_index, make_selection
+
+# facet -> SQL for its label, as facet_counts() reports it
+LABEL_SQL = {
+    "department": "d.displayName",
+    "classification": "COALESCE(a.classification, 'Unknown')",
+    "culture": "COALESCE(a.culture, 'Unknown')",
+    "country": "COALESCE(a.country, 'Unknown')",
+    "isHighlight": "CASE a.isHighlight WHEN 1 THEN 'Yes' WHEN 0 THEN 'No' ELSE 'Unknown' END",
+    "isPublicDomain": "CASE a.isPublicDomain WHEN 1 THEN 'Yes' WHEN 0 THEN 'No' ELSE 'Unknown' END",
+}
+
+
+def grouped_counts(db_path, filters, year_from=None, year_to=None):
+    '''What facet_counts() should report, from one GROUP BY per facet.'''
+    def where(skip=None):
+        conditions, params = [], []
+        for facet, values in filters.items():
+            if facet != skip:
+                conditions.append(f"{LABEL_SQL[facet]} IN ({', '.join('?' * len(values))})")
+                params += values
+        if year_from is not None:
+            conditions.append("COALESCE(a.objectEndDate, a.objectBeginDate) >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            conditions.append("COALESCE(a.objectBeginDate, a.objectEndDate) <= ?")
+            params.append(year_to)
+        return " AND ".join(conditions) or "true", params
+
+    conn = sqlite3.connect(db_path)
+    joins = "FROM Art a JOIN Objects o ON o.object_id = a.object_id JOIN Department d ON d.department_id = o.department_id"
+    conditions, params = where()
+    total = conn.execute(f"SELECT COUNT(*) {joins} WHERE {conditions}", params).fetchone()[0]
+    counts = {}
+    for facet in FACETS:
+        conditions, params = where(skip=facet)
+        counts[facet] = dict(conn.execute(
+            f"SELECT {LABEL_SQL[facet]}, COUNT(*) {joins} WHERE {conditions} GROUP BY 1", params
+        ).fetchall())
+    conn.close()
+    return total, counts
+
+
+@pytest.fixture
+def db(met_db):
+    cache.clear_all()
+    # an object without a culture counts with the "Unknown" ones
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET culture = NULL, objectEndDate = NULL WHERE object_id = 6")
+    conn.commit()
+    conn.close()
+    yield met_db
+    cache.clear_all()
+
+
+@pytest.mark.parametrize("filters, year_from, year_to", [
+    ({}, None, None),
+    ({"department": ["The Cloisters"]}, None, None),
+    ({"culture": ["French", "Unknown"], "isHighlight": ["Yes"]}, None, None),
+    ({"department": ["Asian Art", "Medieval Art"], "classification": ["Glass"], "country": ["Spain"]}, 1200, 1400),
+    ({}, None, 1150),
+    ({"isPublicDomain": ["No"]}, 1500, None),
+])
+def test_counts_match_group_by(db, filters, year_from, year_to):
+    result = facet_counts(db, make_selection(filters), year_from, year_to, limit=100)
+    total, expected = grouped_counts(db, filters, year_from, year_to)
+
+    assert result["total"] == total
+    for facet in FACETS:
+        counts = {label: n for label, n in result["facets"][facet] if n}
+        assert counts == expected[facet], facet
+        # largest first
+        assert [n for _, n in result["facets"][facet]] == sorted((n for _, n in result["facets"][facet]), reverse=True)
+
+
+def test_selected_values_are_always_listed(db):
+    selection = make_selection({"culture": ["Atlantean"], "department": ["Photographs"]})
+    result = facet_counts(db, selection, limit=1)
+
+    assert result["total"] == 0
+    assert result["years"] is None
+    assert result["facets"]["culture"][-1] == ["Atlantean", 0]
+    assert len(result["facets"]["department"]) == 1
+    assert result["facets"]["classification"] == []
+
+
+def test_years_of_the_matches(db):
+    result = facet_counts(db, make_selection({}), 1300, 1310)
+    assert result["years"][0] <= 1310
+    assert result["years"][1] >= 1300
+
+
+def test_selection_is_normalized():
+    assert make_selection({"culture": ["b", "a", "b"], "country": []}) == (("culture", ("a", "b")),)
+    with pytest.raises(ValueError):
+        make_selection({"title": ["x"]})
+
+
+def test_new_snapshot_replaces_the_index(db):
+    before = facet_counts(db, make_selection({"country": ["Italy"]}))
+    assert before["total"] == 0
+    first = facet_index(db)
+
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE Art SET country = 'Italy' WHERE object_id IN (1, 2)")
+    conn.commit()
+    conn.close()
+
+    assert facet_counts(db, make_selection({"country": ["Italy"]}))["total"] == 2
+    # only the current snapshot's index is kept
+    assert facet_index(db) is not first
+    assert facets._index[1] is facet_index(db)
+
+
+def test_stored_index_is_loaded(db):
+    built = facets.read_facet_index(db)
+    loaded = facets.FacetIndex.from_bytes(built.to_bytes())
+    for facet in FACETS:
+        assert loaded.labels[facet] == built.labels[facet]
+        assert np.array_equal(loaded.codes[facet], built.codes[facet])
+        assert loaded.codes[facet].dtype == np.uint8
+    assert np.array_equal(loaded.begin, built.begin)
+
+    # the snapshot's stored index is used rather than its rows: store one
+    # built before a change to the rows
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO Artifacts (name, content_type, body) VALUES (?, '', ?)", (facets.ARTIFACT, built.to_bytes()))
+    conn.execute("UPDATE Art SET country = 'Italy' WHERE object_id = 1")
+    conn.commit()
+    conn.close()
+    assert facet_counts(db, make_selection({"country": ["Italy"]}))["total"] == 0
+
+
+def test_warm_loads_the_index(db):
+    facets.warm(db).join()
+    assert facets._index[0] == (db, database.snapshot_version(db))
+
+
+def test_facets_api(db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "DB_PATH", db)
+    client = app.app.test_client()
+
+    response = client.get("/api/facets?department=The+Cloisters&culture=French&culture=German&year_from=1200")
+    body = response.get_json()
+    total, _ = grouped_counts(db, {"department": ["The Cloisters"], "culture": ["French", "German"]}, 1200)
+    assert response.status_code == 200
+    assert body["total"] == total
+    assert set(body["facets"]) == set(FACETS)
+
+    again = client.get(response.request.full_path, headers={"If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304
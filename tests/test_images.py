@@ -0,0 +1,189 @@
+'''
+test_images.py
+The /img proxy: resized variants cached on disk, downloaded once per object.
+'''
+
+import functools
+import http.server
+import os
+import pathlib
+import sqlite3
+import threading
+
+import pytest
+from PIL import Image
+
+import cache
+import images
+from department_vis import highlight_list, show_highlights
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.clear_all()
+    yield
+    cache.clear_all()
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_db(met_db, tmp_path, monkeypatch):
+    '''
+        met_db with object 1's primaryImage pointing at a 2000x1000 PNG served
+        over http from tmp_path/site. Returns (db_path, source file, its URL).
+    '''
+    site = tmp_path / "site"
+    site.mkdir()
+    source = site / "source.png"
+    Image.new("RGB", (2000, 1000), "red").save(source)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(site)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/source.png"
+
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET primaryImage = ? WHERE object_id = 1", (url,))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(images, "IMAGE_CACHE_DIR", str(tmp_path / "image_cache"))
+    monkeypatch.setattr(images, "_cache_bytes", None)
+    yield met_db, source, url
+    server.shutdown()
+    server.server_close()
+
+
+def test_variants_are_resized_and_cached(image_db):
+    db_path, source, _ = image_db
+
+    path, mimetype = images.image_variant(db_path, 1, 400)
+    assert mimetype == "image/jpeg"
+    with Image.open(path) as image:
+        assert (image.format, image.size) == ("JPEG", (400, 200))
+
+    # later variants come from the local copy, never the original location
+    source.unlink()
+    path, mimetype = images.image_variant(db_path, 1, 800, "webp")
+    assert mimetype == "image/webp"
+    with Image.open(path) as image:
+        assert (image.format, image.size) == ("WEBP", (800, 400))
+    assert images.image_variant(db_path, 1, 400)[0].endswith("1-400.jpg")
+
+
+def test_missing_images(image_db):
+    db_path, source, _ = image_db
+
+    # object 2 has primaryImage 'Unknown'
+    with pytest.raises(images.ImageNotFound):
+        images.image_variant(db_path, 2)
+    with pytest.raises(images.ImageNotFound):
+        images.image_variant(db_path, 99999)
+
+    # a download that is not an image is not kept
+    source.write_bytes(b"not an image")
+    with pytest.raises(OSError):
+        images.image_variant(db_path, 1)
+    assert not pathlib.Path(images.original_path(1)).exists()
+
+    # only http(s) URLs are fetched
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE Art SET primaryImage = ? WHERE object_id = 1", (source.as_uri(),))
+    conn.commit()
+    conn.close()
+    with pytest.raises(images.ImageNotFound):
+        images.image_variant(db_path, 1)
+
+
+def test_decompression_bombs_are_refused(image_db, monkeypatch):
+    import app
+
+    db_path, _, _ = image_db
+    monkeypatch.setattr(app, "DB_PATH", db_path)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 500_000)
+
+    with pytest.raises(OSError):
+        images.image_variant(db_path, 1)
+    assert not pathlib.Path(images.original_path(1)).exists()
+    assert app.app.test_client().get("/img/1").status_code == 502
+
+
+def test_cache_keeps_the_recently_used_files(image_db, monkeypatch):
+    db_path, _, url = image_db
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE Art SET primaryImage = ? WHERE object_id IN (75, 1975)", (url,))
+    conn.commit()
+    conn.close()
+
+    images.image_variant(db_path, 1, 400)
+    images.image_variant(db_path, 75, 400)
+    cap = sum(size for _, size, _ in images._cached_files())
+    monkeypatch.setattr(images, "IMAGE_CACHE_MAX_BYTES", cap)
+    monkeypatch.setattr(images, "IMAGE_CACHE_TRIM", 1.0)
+
+    # object 1's files are used again, so object 75's go first
+    mtime = os.stat(images.variant_path(1, 400, "jpeg")).st_mtime_ns
+    images.image_variant(db_path, 1, 400)
+    images.fetch_original(db_path, 1)
+    assert os.stat(images.variant_path(1, 400, "jpeg")).st_mtime_ns == mtime
+
+    images.image_variant(db_path, 1975, 400)
+    cached = {os.path.basename(path) for _, _, path in images._cached_files()}
+    assert {"1.orig", "1-400.jpg", "1975.orig", "1975-400.jpg"} <= cached
+    assert not cached & {"75.orig", "75-400.jpg"}
+    assert sum(size for _, size, _ in images._cached_files()) <= cap
+
+
+def test_image_route(image_db, monkeypatch):
+    import app
+
+    db_path, _, _ = image_db
+    monkeypatch.setattr(app, "DB_PATH", db_path)
+    client = app.app.test_client()
+
+    response = client.get("/img/1", headers={"Accept": "image/webp,*/*"})
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert "max-age" in response.headers["Cache-Control"]
+    response.close()
+
+    response = client.get("/img/1?size=123")
+    assert response.mimetype == "image/jpeg"
+    response.close()
+
+    assert client.get("/img/2").status_code == 404
+
+    page = client.get("/highlights_viewer", query_string={"dept": "Egyptian Art"}).get_data(as_text=True)
+    assert '<img src="/img/' in page
+
+
+def test_highlights_are_listed_once(met_db):
+    # Egyptian Art's highlights with an image are objects 25, 75, ..., 1975
+    first = show_highlights(0, "Egyptian Art", met_db, neighbors=2)
+    assert first["object_id"] == 25
+    assert first["neighbors"] == [75, 1975, 125, 1925]
+    assert show_highlights(41, "Egyptian Art", met_db)["object_id"] == 75
+
+    info = highlight_list.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert show_highlights(0, "The Cloisters", met_db) is None
+
+
+def test_prefetch_fills_the_cache(image_db):
+    db_path, _, url = image_db
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE Art SET primaryImage = ? WHERE object_id IN (75, 1975)", (url,))
+    conn.commit()
+    conn.close()
+
+    futures = images.prefetch(db_path, [75, 1975, 2], 400)
+    for future in futures:
+        future.exception()
+
+    assert pathlib.Path(images.variant_path(75, 400, "jpeg")).exists()
+    assert pathlib.Path(images.variant_path(1975, 400, "jpeg")).exists()
+    # cached variants are not queued again
+    assert images.prefetch(db_path, [75, 1975], 400) == []
@@ -0,0 +1,69 @@
+'''
+test_loadtest.py
+The load-test harness: its report, and a short run against a started app.
+'''
+
+import pytest
+
+from conftest import load_script
+
+loadtest = load_script("met-loadtest.py")
+
+
+class FixedSampler:
+    def __init__(self, times, samples):
+        self.times = times
+        self.samples = samples
+
+    peak = loadtest.MemorySampler.peak
+
+
+def test_summarize_reports_percentiles_per_route():
+    # 100 requests to /a taking 1..100 ms, one failing request to /b
+    results = [("/a", 0.0, i / 1000, True) for i in range(1, 101)]
+    results.append(("/b", 0.0, 0.5, False))
+
+    summary = loadtest.summarize(results, duration=10)
+
+    assert list(summary) == ["/a", "/b", "all"]
+    assert summary["/a"]["requests"] == 100
+    assert summary["/a"]["errors"] == 0
+    assert summary["/a"]["p50_ms"] == pytest.approx(50.5)
+    assert summary["/a"]["p99_ms"] == pytest.approx(99.0)
+    assert summary["/a"]["max_ms"] == 100.0
+    assert summary["/a"]["rps"] == 10.0
+    assert summary["/b"]["errors"] == 1
+    assert summary["all"]["requests"] == 101
+    assert summary["all"]["errors"] == 1
+    assert summary["all"]["max_ms"] == 500.0
+
+
+def test_memory_peak_during_requests():
+    sampler = FixedSampler([1.0, 2.0, 3.0, 4.0], [10, 30, 20, 40])
+
+    assert sampler.peak(1.5, 3.5) == 30
+    # a request between two samples gets the last one before it ended
+    assert sampler.peak(3.2, 3.8) == 20
+    assert sampler.peak(0.0, 0.5) is None
+
+    results = [("/a", 1.5, 3.5, True), ("/b", 3.5, 4.5, True)]
+    summary = loadtest.summarize(results, duration=1, sampler=sampler)
+    assert summary["/a"]["peak_rss_mib"] == round(30 / 2**20, 1)
+    assert summary["all"]["peak_rss_mib"] == round(40 / 2**20, 1)
+
+
+def test_short_run_against_the_app(met_db):
+    process, base_url = loadtest.start_server(met_db)
+    try:
+        departments = loadtest.list_departments(base_url)
+        assert departments
+
+        results = loadtest.run_stage(base_url, departments, users=2, duration=2, journeys=list(loadtest.JOURNEYS))
+    finally:
+        process.terminate()
+        process.wait()
+
+    summary = loadtest.summarize(results, duration=2)
+    assert summary["all"]["requests"] > 0
+    assert summary["all"]["errors"] == 0
+    assert "GET /" in summary
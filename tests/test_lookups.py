@@ -0,0 +1,95 @@
+'''
+test_lookups.py
+The Art view over ArtData and its dictionary encoded lookup tables.
+'''
+
+import sqlite3
+
+from conftest import load_script
+
+schema = load_script("met-schema.py")
+
+
+def art_rows(conn):
+    return conn.execute("SELECT * FROM Art ORDER BY object_id").fetchall()
+
+
+def test_view_decodes_lookups(met_db):
+    conn = sqlite3.connect(met_db)
+
+    # every distinct value is stored once, and ArtData only holds its key
+    cultures = [row[0] for row in conn.execute("SELECT culture FROM Culture ORDER BY culture")]
+    assert cultures == ["English", "French", "German", "Italian", "Spanish", "Unknown"]
+    assert conn.execute("SELECT typeof(culture_id) FROM ArtData LIMIT 1").fetchone()[0] == "integer"
+
+    assert conn.execute(
+        "SELECT culture, medium, classification FROM Art WHERE object_id = 1"
+    ).fetchone() == ("German", "Oak", "Glass")
+    assert [row[1] for row in conn.execute("PRAGMA table_info(Art)")] == schema.ART_COLUMNS + ["material_family"]
+    conn.close()
+
+
+def test_view_writes(met_db):
+    conn = sqlite3.connect(met_db)
+
+    conn.execute("INSERT INTO Art (object_id, title, culture, medium) VALUES (5000, 'New', 'Flemish', 'Oak')")
+    conn.execute("UPDATE Art SET culture = 'French', country = NULL WHERE object_id = 5000")
+    assert conn.execute(
+        "SELECT title, culture, medium, country FROM Art WHERE object_id = 5000"
+    ).fetchone() == ("New", "French", "Oak", None)
+    assert conn.execute("SELECT COUNT(*) FROM Medium WHERE medium = 'Oak'").fetchone()[0] == 1
+
+    conn.execute("DELETE FROM Art WHERE object_id = 5000")
+    assert conn.execute("SELECT COUNT(*) FROM ArtData WHERE object_id = 5000").fetchone()[0] == 0
+    conn.close()
+
+
+def downgrade(conn):
+    '''Turn a current db back into the version 3 layout, with Art as a table.'''
+    indexes = {
+        name: [row[2] for row in conn.execute(f"PRAGMA index_info({name})")]
+        for name in [row[1] for row in conn.execute("PRAGMA index_list(ArtData)")]
+    }
+    columns = [
+        "object_id INTEGER PRIMARY KEY" if name == "object_id" else f"{name} {type_ or 'TEXT'}"
+        for _, name, type_, *_ in conn.execute("PRAGMA table_info(Art)")
+    ]
+    schema.drop_triggers(conn)
+    conn.execute(f"CREATE TABLE Art_v3 ({', '.join(columns)})")
+    conn.execute("INSERT INTO Art_v3 SELECT * FROM Art")
+    conn.execute("DROP VIEW Art")
+    conn.execute("DROP TABLE ArtData")
+    for table in schema.LOOKUP_TABLES.values():
+        conn.execute(f"DROP TABLE {table}")
+    conn.execute("ALTER TABLE Art_v3 RENAME TO Art")
+    for name, columns in indexes.items():
+        columns = [c.removesuffix("_id") for c in columns]
+        conn.execute(f"CREATE INDEX {name} ON Art ({', '.join(columns)})")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+
+
+def page_count(conn):
+    '''Pages of the tables and indexes, leaving out the schema (the SQL of the triggers).'''
+    conn.execute("VACUUM")
+    return conn.execute("SELECT COUNT(*) FROM dbstat WHERE name != 'sqlite_schema'").fetchone()[0]
+
+
+def test_migrate_lookups(met_db):
+    conn = sqlite3.connect(met_db)
+    expected = art_rows(conn)
+    rollups = set(conn.execute("SELECT * FROM Rollup WHERE num_objects > 0"))
+
+    downgrade(conn)
+    text_pages = page_count(conn)
+    schema.create_schema(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == schema.SCHEMA_VERSION
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'Art'").fetchone()[0] == "view"
+    assert art_rows(conn) == expected
+    assert set(conn.execute("SELECT * FROM Rollup WHERE num_objects > 0")) == rollups
+    assert conn.execute("SELECT COUNT(*) FROM ArtSearch WHERE ArtSearch MATCH 'tapestry'").fetchone()[0] > 0
+
+    # the encoded layout takes less space than the repeated text
+    assert page_count(conn) < text_pages
+    conn.close()
@@ -0,0 +1,99 @@
+'''
+test_materials.py
+Material family classification, at build time and in the EDA.
+'''
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from conftest import MEDIUMS, load_script
+from eda_cloisters import assign_material_families
+from materials import MATERIAL_FAMILIES, classify_materials
+
+MEDIUM_SAMPLES = MEDIUMS + [
+    "Silver gilt, oak",            # Wood is checked before Metal
+    "glassilver",                  # overlapping keywords, Metal is checked before Glass
+    "LIMESTONE with traces of paint",
+    "Pot-metal glass and vitreous paint",
+    "Human remains",
+    "Embroidered silk",
+    "ÉTAIN and IRON",               # only ASCII letters are folded by SQLite
+    "Unknown",
+    "",
+    None,
+    np.nan,
+]
+
+
+def keyword_family(medium):
+    '''The original per-row rule: the first family with a keyword in the medium.'''
+    m = str(medium).lower()
+    for family, keywords in MATERIAL_FAMILIES.items():
+        if any(k in m for k in keywords):
+            return family
+    return "Other"
+
+
+def test_classify_matches_keyword_rules():
+    mediums = pd.Series(MEDIUM_SAMPLES, dtype=object, index=range(10, 10 + len(MEDIUM_SAMPLES)))
+
+    families = classify_materials(mediums)
+
+    assert list(families.index) == list(mediums.index)
+    assert list(families) == [keyword_family(m) for m in MEDIUM_SAMPLES]
+
+
+def test_refresh_materials(met_db):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(met_db)
+    conn.execute("INSERT INTO Art (object_id, title, medium) VALUES (5000, 'New', 'Marble')")
+    conn.execute("INSERT INTO Art (object_id, title) VALUES (5001, 'No medium')")
+    schema.refresh_materials(conn)
+
+    df = pd.read_sql("SELECT medium, material_family FROM Art", conn)
+    conn.close()
+
+    assert df["material_family"].notna().all()
+    assert list(df["material_family"]) == [keyword_family(m) for m in df["medium"]]
+
+
+def test_art_view_writes_classify_materials(met_db):
+    conn = sqlite3.connect(met_db)
+    for i, medium in enumerate(MEDIUM_SAMPLES):
+        conn.execute("INSERT INTO Art (object_id, title, medium) VALUES (?, 'New', ?)", (5000 + i, medium))
+    conn.execute("UPDATE Art SET medium = 'Carved walnut' WHERE object_id = 5000")
+    conn.execute("UPDATE Art SET title = 'Renamed' WHERE object_id = 5001")
+
+    rows = conn.execute("SELECT medium, material_family FROM Art WHERE object_id >= 5000 ORDER BY object_id").fetchall()
+    conn.close()
+
+    assert rows[0] == ("Carved walnut", "Wood")
+    assert [family for _, family in rows] == [keyword_family(medium) for medium, _ in rows]
+
+
+def test_migration_replaces_the_art_triggers(met_db):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(met_db)
+    # a version 6 trigger, which leaves material_family out
+    conn.execute("DROP TRIGGER art_insert")
+    conn.execute(
+        "CREATE TRIGGER art_insert INSTEAD OF INSERT ON Art BEGIN "
+        "INSERT INTO ArtData (object_id, title) VALUES (NEW.object_id, NEW.title); END"
+    )
+    conn.execute("PRAGMA user_version = 6")
+
+    schema.create_schema(conn)
+    conn.execute("INSERT INTO Art (object_id, title, medium) VALUES (5000, 'New', 'Oak')")
+    assert conn.execute("SELECT material_family FROM Art WHERE object_id = 5000").fetchone() == ("Wood",)
+    conn.close()
+
+
+def test_eda_classifies_missing_families():
+    df = pd.DataFrame({
+        "medium": ["Oak", "Marble", "Wool tapestry"],
+        "material_family": ["Wood", None, None],
+    })
+
+    assert list(assign_material_families(df)) == ["Wood", "Stone", "Textile"]
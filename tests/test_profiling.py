@@ -0,0 +1,100 @@
+'''
+test_profiling.py
+The opt-in request profiling: phase timings, the slow query log and /metrics.
+'''
+
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+import cache
+import profiling
+
+
+@pytest.fixture
+def client(met_db, monkeypatch):
+    import app
+
+    cache.clear_all()
+    profiling.reset()
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    yield app.app.test_client()
+    cache.clear_all()
+    profiling.reset()
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    # log every query
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+
+
+def test_nested_phases_count_their_own_time(enabled):
+    profiling._begin_request()
+    try:
+        with profiling.phase("figure"):
+            time.sleep(0.02)
+            with profiling.phase("sql"):
+                time.sleep(0.03)
+        timings = dict(profiling._local.timings)
+    finally:
+        profiling._clear_request(None)
+
+    assert 0.02 <= timings["figure"] < 0.03
+    assert timings["sql"] >= 0.03
+    assert timings["dataframe"] == timings["template"] == 0
+
+
+def test_read_sql_matches_pandas(met_db):
+    conn = sqlite3.connect(met_db)
+    query = "SELECT * FROM Art WHERE object_id < ?"
+    pd.testing.assert_frame_equal(
+        profiling.read_sql(query, conn, (50,)),
+        pd.read_sql(query, conn, params=(50,)),
+    )
+    conn.close()
+
+
+def test_requests_are_timed_by_phase(client, enabled):
+    response = client.get("/api/breakdown?dept=The+Cloisters&field=culture")
+    timing = response.headers["Server-Timing"]
+    assert [part.split(";")[0] for part in timing.split(", ")] == profiling.PHASES + ["total"]
+
+    client.get("/?dept=ALL")
+    client.get("/?dept=ALL")
+    metrics = client.get("/metrics").get_json()
+
+    assert metrics["enabled"]
+    assert metrics["routes"]["/"]["count"] == 2
+    phases = metrics["routes"]["/api/breakdown"]["mean_phase_ms"]
+    assert set(phases) == set(profiling.PHASES)
+    assert phases["figure"] > 0 and phases["sql"] > 0
+    assert metrics["routes"]["/"]["mean_phase_ms"]["template"] > 0
+    assert "run_group_query" in metrics["caches"]
+
+
+def test_slow_queries_are_logged_with_their_plan(client, enabled):
+    client.get("/api/breakdown?dept=The+Cloisters&field=country")
+    [entry] = client.get("/metrics").get_json()["slow_queries"]
+
+    assert entry["route"] == "/api/breakdown"
+    assert entry["query"].startswith("SELECT r.category, r.num_objects FROM Rollup r")
+    assert entry["params"] == ["country", "The Cloisters"]
+    assert any(line.lstrip().startswith(("SEARCH", "SCAN")) for line in entry["plan"])
+
+
+def test_off_unless_enabled(client, monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", False)
+    response = client.get("/api/breakdown?dept=ALL&field=culture")
+    assert "Server-Timing" not in response.headers
+
+    metrics = client.get("/metrics").get_json()
+    assert not metrics["enabled"]
+    assert metrics["routes"] == {} and metrics["slow_queries"] == []
+
+
+def test_metrics_are_local_only(client):
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "10.1.2.3"}).status_code == 404
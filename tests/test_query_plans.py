@@ -0,0 +1,139 @@
+'''
+test_query_plans.py
+EXPLAIN QUERY PLAN regression tests for the hot explorer and chart queries.
+The SQL is captured from the functions the app calls, as they run it through
+profiling.fetch_all()/read_sql(), so a change to any of them is checked too.
+A query fails if it falls back to scanning a whole table instead of using
+the indexes from met-schema.py.
+'''
+
+import re
+import sqlite3
+
+import pytest
+
+import explorer
+import profiling
+from department_vis import accession_counts, create_box_chart, highlight_list
+from eda_cloisters import load_db
+from fields import FIELDS
+
+DEPARTMENT = "The Cloisters"
+
+# name -> (function running the queries, the index its main query must use,
+# tables it may read in full). Cached functions are called unwrapped.
+HOT_PATHS = {
+    **{
+        f"group_query[{field}]": (
+            lambda db, field=field: explorer.run_group_query.__wrapped__(db, DEPARTMENT, field),
+            "USING PRIMARY KEY (field=? AND department_id=?)",
+            set(),
+        )
+        for field in FIELDS
+    },
+    **{
+        f"group_query_all[{field}]": (
+            lambda db, field=field: explorer.run_group_query.__wrapped__(db, "ALL", field),
+            "USING PRIMARY KEY (field=? AND department_id=?)",
+            set(),
+        )
+        for field in FIELDS
+    },
+    "detail_page": (
+        lambda db: explorer.run_detail_page(db, DEPARTMENT, start=100),
+        "idx_objects_department",
+        set(),
+    ),
+    "detail_page_ordered": (
+        lambda db: explorer.run_detail_page(db, DEPARTMENT, order_by="title", descending=True),
+        "idx_objects_department",
+        set(),
+    ),
+    # object order: Objects read in rowid order and stopped after the page
+    "detail_page_all": (
+        lambda db: explorer.run_detail_page(db, "ALL", start=100),
+        "SEARCH a USING INTEGER PRIMARY KEY",
+        {"o"},
+    ),
+    "detail_page_search": (
+        lambda db: explorer.run_detail_page(db, DEPARTMENT, search="object"),
+        "VIRTUAL TABLE",
+        set(),
+    ),
+    "accession_counts": (
+        lambda db: accession_counts(db, 10),
+        "idx_art_accessionYear",
+        set(),
+    ),
+    "box_chart": (
+        lambda db: create_box_chart.__wrapped__(db),
+        "idx_art_objectEndDate",
+        set(),
+    ),
+    "highlight_list": (
+        lambda db: highlight_list.__wrapped__(db, DEPARTMENT),
+        "idx_objects_department",
+        set(),
+    ),
+    # either the department or the century window may lead
+    "eda_load_db": (
+        lambda db: load_db(db, DEPARTMENT),
+        "",
+        set(),
+    ),
+}
+
+# a table read in rowid order with no index at all, and any scan of Art or
+# Objects, including a full covering index scan
+FULL_SCAN = re.compile(r"^SCAN (\w+)( LEFT-JOIN)?$")
+SCAN_ART_OR_OBJECTS = re.compile(r"^SCAN (a|o|Art|ArtData|Objects)\b")
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    '''The (query, params) of every query run through the profiling helpers.'''
+    queries = []
+    execute = profiling._execute
+
+    def record(conn, query, params):
+        queries.append((query, params))
+        return execute(conn, query, params)
+
+    monkeypatch.setattr(profiling, "_execute", record)
+    return queries
+
+
+def scans(plan):
+    '''The tables a plan scans in full, by alias.'''
+    return {
+        match.group(1)
+        for step in plan
+        for match in [FULL_SCAN.match(step) or SCAN_ART_OR_OBJECTS.match(step)]
+        if match
+    }
+
+
+@pytest.mark.parametrize("name", HOT_PATHS)
+def test_hot_paths_use_indexes(met_db, captured, name):
+    run, index, allowed_scans = HOT_PATHS[name]
+    run(met_db)
+    assert captured, f"{name} ran no queries"
+
+    conn = sqlite3.connect(met_db)
+    plans = [[step.strip() for step in profiling.query_plan(conn, query, params)] for query, params in captured]
+    conn.close()
+
+    for plan in plans:
+        assert scans(plan) <= allowed_scans, plan
+    assert any(index in step for plan in plans for step in plan), plans
+
+
+def test_object_order_needs_no_sort(met_db, captured):
+    explorer.run_detail_page(met_db, DEPARTMENT, start=100)
+    explorer.run_detail_page(met_db, "ALL", start=100)
+
+    conn = sqlite3.connect(met_db)
+    for query, params in captured:
+        plan = [step.strip() for step in profiling.query_plan(conn, query, params)]
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan, plan
+    conn.close()
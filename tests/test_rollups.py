@@ -0,0 +1,123 @@
+'''
+test_rollups.py
+The Rollup table must always match a GROUP BY over Art and Objects.
+'''
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conftest import load_script
+from explorer import FIELDS, BINARY_FIELDS, run_group_query
+
+
+def grouped_counts(conn):
+    '''What refresh_rollups() would store, computed from the base tables.'''
+    rows = set()
+    for field in FIELDS:
+        for department_id, category, num_objects in conn.execute(
+            f'''
+            SELECT o.department_id, COALESCE(a.{field}, 'Unknown'), COUNT(*)
+            FROM Art a JOIN Objects o ON a.object_id = o.object_id
+            GROUP BY 1, 2
+            '''
+        ):
+            rows.add((field, department_id, category, num_objects))
+        for category, num_objects in conn.execute(
+            f'''
+            SELECT COALESCE(a.{field}, 'Unknown'), COUNT(*)
+            FROM Art a JOIN Objects o ON a.object_id = o.object_id
+            GROUP BY 1
+            '''
+        ):
+            rows.add((field, 0, category, num_objects))
+    return rows
+
+
+def rollup_counts(conn):
+    return set(conn.execute("SELECT * FROM Rollup WHERE num_objects > 0"))
+
+
+def test_triggers_match_group_by(met_db):
+    conn = sqlite3.connect(met_db)
+    assert rollup_counts(conn) == grouped_counts(conn)
+    conn.close()
+
+
+def test_triggers_follow_upserts_and_deletes(met_db):
+    conn = sqlite3.connect(met_db)
+
+    # upsert a changed Art row the way the build does, update one through the
+    # Art view, move an object between departments, delete rows
+    schema = load_script("met-schema.py")
+    conn.execute("CREATE TEMP TABLE Art_stage AS SELECT * FROM Art WHERE false")
+    conn.execute(
+        "INSERT INTO Art_stage (object_id, title, culture, isHighlight) VALUES (5, 'Object 5', 'Flemish', 1)"
+    )
+    schema.upsert_art(conn, "Art_stage")
+    conn.execute("UPDATE Art SET country = 'Belgium', classification = NULL WHERE object_id = 6")
+    conn.execute("UPDATE Objects SET department_id = 7 WHERE object_id = 12")
+    conn.execute("DELETE FROM Art WHERE object_id = 20")
+    conn.execute("DELETE FROM Objects WHERE object_id IN (20, 21)")
+
+    # an Art row without an Objects row is not counted until it gets one
+    conn.execute("INSERT INTO Art (object_id, title, culture) VALUES (5000, 'New', 'Flemish')")
+    assert rollup_counts(conn) == grouped_counts(conn)
+    conn.execute("INSERT INTO Objects (department_id, object_id) VALUES (10, 5000)")
+
+    assert rollup_counts(conn) == grouped_counts(conn)
+    conn.close()
+
+
+def test_migration_fills_rollups(met_db):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(met_db)
+    expected = rollup_counts(conn)
+
+    conn.execute("DROP TABLE Rollup")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    schema.create_schema(conn)
+
+    assert rollup_counts(conn) == expected
+    conn.close()
+
+
+def expected_breakdown(conn, dept, field):
+    '''category -> count, as the explorer showed it when it ran a GROUP BY.'''
+    where = "WHERE d.displayName = ?" if dept != "ALL" else ""
+    df = pd.read_sql(
+        f'''
+        SELECT a.{field} AS category
+        FROM Art a
+        JOIN Objects o ON a.object_id = o.object_id
+        JOIN Department d ON d.department_id = o.department_id
+        {where}
+        ''',
+        conn,
+        params=(dept,) if where else (),
+    )
+    # NULL and the literal "Unknown" are one category
+    categories = df["category"].astype(object).where(df["category"].notna(), "Unknown")
+    if field in BINARY_FIELDS:
+        categories = categories.map({0: "No", 1: "Yes"}).fillna("Unknown")
+    return categories.value_counts().to_dict()
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.parametrize("dept", ["ALL", "The Cloisters"])
+def test_run_group_query(met_db, dept, field):
+    conn = sqlite3.connect(met_db)
+    # NULLs next to the fixture's literal "Unknown" values
+    conn.execute(f"UPDATE Art SET {field} = NULL WHERE object_id % 11 = 0")
+    conn.commit()
+    expected = expected_breakdown(conn, dept, field)
+    conn.close()
+
+    df = run_group_query(met_db, dept, field)
+
+    assert df["category"].is_unique
+    assert dict(zip(df["category"], df["num_objects"])) == expected
+    assert "Unknown" in expected
+    assert list(df["num_objects"]) == sorted(df["num_objects"], reverse=True)
@@ -0,0 +1,151 @@
+'''
+test_schema.py
+Migrating met.db files created by earlier versions of met-schema.py.
+'''
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import database
+from conftest import SRC_DIR, load_script
+
+# Art as created before the year columns were typed (user_version 0)
+ART_V0 = '''
+    CREATE TABLE Art (
+        object_id INTEGER PRIMARY KEY,
+        isHighlight INTEGER,
+        accessionYear TEXT,
+        isPublicDomain INTEGER,
+        primaryImage text,
+        objectName TEXT,
+        title TEXT NOT NULL,
+        culture TEXT,
+        period TEXT,
+        dynasty TEXT,
+        reign TEXT,
+        portfolio TEXT,
+        artistWikidata_URL TEXT,
+        artistAlphaSort TEXT,
+        objectBeginDate TEXT,
+        objectEndDate TEXT,
+        medium TEXT,
+        dimensions TEXT,
+        creditLine TEXT,
+        city TEXT,
+        state TEXT,
+        county TEXT,
+        country TEXT,
+        region TEXT,
+        subregion TEXT,
+        excavation TEXT,
+        classification TEXT
+    )
+'''
+
+
+def test_migrate_typed_years(tmp_path):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(tmp_path / "met.db")
+    conn.execute(ART_V0)
+    conn.executemany(
+        '''
+        INSERT INTO Art (object_id, title, accessionYear, objectBeginDate, objectEndDate, culture)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+        [
+            (1, "Chalice", "1917", "1180", "1200", "French"),
+            (2, "Relief", "1999-2000", "-500", "-450", "Egyptian"),
+            (3, "Fragment", "Unknown", "0", "0", "Unknown"),
+        ],
+    )
+    conn.commit()
+
+    schema.create_schema(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == schema.SCHEMA_VERSION
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(Art)")}
+    assert all(types[c] == "INTEGER" for c in schema.YEAR_COLUMNS)
+
+    rows = conn.execute(
+        '''
+        SELECT object_id, title, accessionYear, objectBeginDate, objectEndDate, culture
+        FROM Art ORDER BY object_id
+        '''
+    ).fetchall()
+    assert rows == [
+        (1, "Chalice", 1917, 1180, 1200, "French"),
+        (2, "Relief", 1999, -500, -450, "Egyptian"),
+        (3, "Fragment", None, 0, 0, "Unknown"),
+    ]
+
+    # the indexes are rebuilt on the new table
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_art_objectBeginDate", "idx_art_accessionYear", "idx_art_culture"} <= indexes
+    conn.close()
+
+
+def test_create_schema_is_idempotent(met_db):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(met_db)
+    count = conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0]
+
+    schema.create_schema(conn)
+
+    assert conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0] == count
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == schema.SCHEMA_VERSION
+    conn.close()
+
+
+def test_published_snapshots_are_migrated_into_a_new_one(template_db, tmp_path):
+    schema = load_script("met-schema.py")
+    db_path = str(tmp_path / "met.db")
+    (tmp_path / "snapshots").mkdir()
+
+    # a version 5 snapshot, from before the Artifacts table
+    old = database.snapshot_path(db_path, "1")
+    shutil.copy(template_db, old)
+    conn = sqlite3.connect(old)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("DROP TABLE Artifacts")
+    conn.execute("PRAGMA user_version = 5")
+    conn.close()
+    database.publish(db_path, old)
+    with open(old, "rb") as f:
+        published = f.read()
+    version = database.snapshot_version(db_path)
+
+    migrated = schema.migrate_published(db_path)
+
+    assert migrated != old
+    assert database.resolve(db_path) == migrated
+    assert database.snapshot_version(db_path) != version
+    with open(old, "rb") as f:
+        assert f.read() == published
+
+    with database.connection(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == schema.SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM Artifacts").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM Art").fetchone()[0] == 2000
+    database.close_all()
+
+    # nothing left to migrate: no new snapshot
+    assert schema.migrate_published(db_path) == migrated
+
+
+def test_schema_script_does_not_load_the_app():
+    # in a fresh interpreter, since the other tests load the app
+    probe = (
+        "import importlib.util, sys;"
+        "spec = importlib.util.spec_from_file_location('met_schema', sys.argv[1]);"
+        "spec.loader.exec_module(importlib.util.module_from_spec(spec));"
+        "print(sorted({'flask', 'explorer', 'profiling'} & set(sys.modules)))"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    result = subprocess.run(
+        [sys.executable, "-c", probe, os.path.join(SRC_DIR, "met-schema.py")],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,77 @@
+'''
+test_search.py
+Full-text search over the ArtSearch index.
+'''
+
+import sqlite3
+
+from conftest import load_script
+from explorer import match_expression, search_objects
+
+
+def test_match_expression():
+    assert match_expression("  ") is None
+    assert match_expression('gogh "wheat') == '"gogh" """wheat"*'
+
+
+def test_search_ranks_and_pages(met_db):
+    conn = sqlite3.connect(met_db)
+    conn.execute("UPDATE Art SET title = 'Wheat Field with Cypresses' WHERE object_id = 7")
+    conn.execute("UPDATE Art SET medium = 'Oil on canvas, wheat paste' WHERE object_id = 8")
+    conn.commit()
+    conn.close()
+
+    results, has_next = search_objects(met_db, "whea")
+    assert list(results["object_id"]) == [7, 8]
+    assert not has_next
+
+    # artist names are searchable, and results come back one page at a time
+    first, has_next = search_objects(met_db, "Vincent Gogh", page=1, per_page=3)
+    assert len(first) == 3 and has_next
+    second, _ = search_objects(met_db, "Vincent Gogh", page=2, per_page=3)
+    assert not set(first["object_id"]) & set(second["object_id"])
+    assert set(first["artist"]) == {"Vincent van"}
+
+
+def test_search_follows_deletes(met_db):
+    conn = sqlite3.connect(met_db)
+    conn.execute("DELETE FROM Art WHERE object_id = 1")
+    conn.commit()
+    conn.close()
+
+    results, _ = search_objects(met_db, "Object 1", per_page=5000)
+    assert 1 not in set(results["object_id"])
+    assert {10, 100, 1000} <= set(results["object_id"])
+
+
+def test_migration_indexes_existing_rows(met_db):
+    schema = load_script("met-schema.py")
+    conn = sqlite3.connect(met_db)
+    conn.execute("DROP TABLE ArtSearch")
+    for trigger in ("search_art_insert", "search_art_delete", "search_art_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+
+    schema.create_schema(conn)
+    conn.close()
+
+    results, _ = search_objects(met_db, "Sculpture", per_page=5000)
+    assert len(results) == 400
+
+
+def test_search_page_is_bounded(met_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "DB_PATH", met_db)
+    client = app.app.test_client()
+
+    # past SQLite's 64-bit integers, and past the last page shown
+    for page in (2 ** 64, app.MAX_SEARCH_PAGE + 1):
+        response = client.get("/search", query_string={"q": "Object", "page": page})
+        assert response.status_code == 200
+        assert f"Page {app.MAX_SEARCH_PAGE}" in response.get_data(as_text=True)
+
+    monkeypatch.setattr(app, "MAX_SEARCH_PAGE", 2)
+    page = client.get("/search", query_string={"q": "Object", "page": 2}).get_data(as_text=True)
+    assert ">Next<" not in page
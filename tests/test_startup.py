@@ -0,0 +1,52 @@
+'''
+test_startup.py
+Importing the app is fast and leaves the charting libraries unloaded.
+Each import runs in a fresh interpreter, since the other tests load them.
+'''
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+# Seconds `import app` may take in a fresh interpreter. It takes about 0.4s;
+# with the charting libraries loaded eagerly it took 2.5-3.5s.
+STARTUP_BUDGET = 1.5
+
+# Loaded by the first request that draws a chart, never at import time
+LAZY_MODULES = ["plotly.express", "plotly.graph_objects", "matplotlib", "seaborn", "scipy", "ipywidgets", "skimage"]
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+'''
+
+
+def import_in_fresh_interpreter(module, cwd):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_app_imports_within_budget(tmp_path):
+    # best of three, so a busy machine does not fail the test
+    runs = [import_in_fresh_interpreter("app", tmp_path) for _ in range(3)]
+
+    assert runs[0]["loaded"] == []
+    assert min(run["elapsed"] for run in runs) < STARTUP_BUDGET
+
+
+def test_interactive_vis_import_has_no_side_effects(tmp_path):
+    result = import_in_fresh_interpreter("interactive_vis", tmp_path)
+
+    assert result["loaded"] == []
+    # the database is not opened (connecting would fail: there is no met_data/)
+    assert os.listdir(tmp_path) == []
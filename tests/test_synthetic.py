@@ -0,0 +1,50 @@
+'''
+test_synthetic.py
+The synthetic collection generator used by the benchmarks.
+'''
+
+import filecmp
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import load_script
+
+synthetic = load_script("met-synthetic.py")
+
+
+@pytest.mark.parametrize("text, count", [("10k", 10_000), ("500K", 500_000), ("5M", 5_000_000), ("1.5m", 1_500_000), ("1234", 1234)])
+def test_parse_count(text, count):
+    assert synthetic.parse_count(text) == count
+
+
+@pytest.mark.parametrize("n_objects", [19, 1000, 123_457])
+def test_department_sizes_add_up(n_objects):
+    sizes = synthetic.department_sizes(n_objects)
+    assert sizes.sum() == n_objects
+    # Drawings and Prints is the largest department, as in the real collection
+    assert synthetic.DEPARTMENTS[sizes.argmax()][1] == "Drawings and Prints"
+
+
+def test_generation_is_deterministic(tmp_path):
+    first = synthetic.generate(str(tmp_path / "a"), 2000, seed=1)
+    second = synthetic.generate(str(tmp_path / "b"), 2000, seed=1)
+
+    for a, b in zip(first, second):
+        for name in ("objects.jsonl", "artists.jsonl"):
+            assert filecmp.cmp(os.path.join(a, name), os.path.join(b, name), shallow=False)
+
+
+def test_records_have_the_api_layout(tmp_path):
+    directories = synthetic.generate(str(tmp_path), 2000)
+    objects = pd.concat(pd.read_json(os.path.join(d, "objects.jsonl"), lines=True) for d in directories)
+    artists = pd.concat(pd.read_json(os.path.join(d, "artists.jsonl"), lines=True) for d in directories)
+    departments = pd.read_json(tmp_path / "data" / "departments.jsonl", lines=True)
+
+    assert len(objects) == 2000 and objects["object_id"].is_unique
+    assert set(objects["department_id"]) == set(departments["department_id"])
+    assert (objects["objectBeginDate"] <= objects["objectEndDate"]).all()
+    # every artist credited on an object has an artists.jsonl record
+    credited = set(objects.loc[objects["artistAlphaSort"] != "", "artistAlphaSort"])
+    assert credited == set(artists["artistAlphaSort"])